@@ -1,16 +1,23 @@
 # crud.py
 
 from sqlalchemy.orm import Session
+from sqlalchemy import func, or_, and_, type_coerce, literal_column, String
+from sqlalchemy.dialects import sqlite, postgresql
 import models, schemas
 from typing import List, Optional
+from datetime import datetime, timezone
 
 
-def create_user_video(db: Session, user_id: int, video_id: str, original_video_path: str, first_frame_path: str):
+def create_user_video(db: Session, user_id: int, video_id: str, original_video_path: str, first_frame_path: str, device_id: Optional[int] = None, session_type: str = "upload", content_hash: Optional[str] = None, count_base: Optional[dict] = None):
     db_video = models.Video(
         id=video_id,
         original_video_path=original_video_path,
         first_frame_path=first_frame_path,
-        status="pending"
+        status="pending",
+        device_id=device_id,
+        session_type=session_type,
+        content_hash=content_hash,
+        count_base=count_base
     )
     db.add(db_video)
     db.commit()
@@ -69,12 +76,19 @@ def update_device_config(db: Session, device_id: int, config: schemas.DeviceUpda
             dev.processing_start_time = config.processing_start_time
         if config.processing_end_time is not None:
             dev.processing_end_time = config.processing_end_time
+        if config.processing_days is not None:
+            dev.processing_days = config.processing_days
         if config.lines_config is not None:
             dev.lines_config = config.lines_config
+        if config.group_name is not None:
+            dev.group_name = config.group_name or None
             
         # RTSP URL sempre é recalculada/atualizada pelo endpoint chamador se necessário,
         # mas aqui mantemos a lógica original de atualizar se passado
         if rtsp_url:
+            if rtsp_url != dev.rtsp_url:
+                # Outra câmera/stream: os metadados em cache (resolução forçada no '-s' do FFmpeg) não valem mais
+                clear_stream_metadata(dev)
             dev.rtsp_url = rtsp_url
             
         dev.is_configured = True
@@ -85,42 +99,124 @@ def update_device_config(db: Session, device_id: int, config: schemas.DeviceUpda
         db.refresh(dev)
     return dev
 
+def get_stream_metadata(db: Session, device_id: int):
+    dev = db.query(models.Device).filter(models.Device.id == device_id).first()
+    if dev and dev.stream_width and dev.stream_height:
+        return {
+            "width": dev.stream_width, "height": dev.stream_height,
+            "codec": dev.stream_codec, "fps": dev.stream_fps
+        }
+    return None
+
+def clear_stream_metadata(dev: models.Device):
+    """Invalida o probe salvo: o próximo start da câmera sonda a stream de novo."""
+    dev.stream_width = dev.stream_height = None
+    dev.stream_codec = dev.stream_fps = None
+    dev.stream_probed_at = None
+
+def save_stream_metadata(db: Session, device_id: int, meta: dict):
+    dev = db.query(models.Device).filter(models.Device.id == device_id).first()
+    if dev:
+        dev.stream_width = meta.get("width")
+        dev.stream_height = meta.get("height")
+        dev.stream_codec = meta.get("codec")
+        dev.stream_fps = meta.get("fps")
+        dev.stream_probed_at = datetime.now()
+        db.commit()
+    return dev
+
 def get_video(db: Session, video_id: str):
     return db.query(models.Video).filter(models.Video.id == video_id).first()
 
 def get_user_videos(db: Session):
     return db.query(models.Video).order_by(models.Video.created_at.desc()).all()
 
-def update_video_status(db: Session, video_id: str, status: str):
+def _created_at_key(db: Session):
+    # No SQLite o created_at é texto (CURRENT_TIMESTAMP): o cursor compara texto com texto,
+    # assim bate exatamente com o valor salvo e o índice continua sendo usado
+    if db.get_bind().dialect.name == "sqlite":
+        return type_coerce(models.Video.created_at, String)
+    return models.Video.created_at
+
+def _history_filters(q, status, session_type, since, until):
+    if status:
+        q = q.filter(models.Video.status == status)
+    if session_type:
+        q = q.filter(models.Video.session_type == session_type)
+    if since:
+        q = q.filter(models.Video.created_at >= since)
+    if until:
+        q = q.filter(models.Video.created_at < until)
+    return q
+
+def history_version(db: Session, status: Optional[str] = None, session_type: Optional[str] = None,
+                    since: Optional[datetime] = None, until: Optional[datetime] = None):
+    """(última alteração, quantidade) das linhas do filtro: muda sempre que alguma página do histórico muda."""
+    q = _history_filters(db.query(func.max(models.Video.updated_at), func.count(models.Video.id)), status, session_type, since, until)
+    return tuple(q.one())
+
+def list_videos(db: Session, limit: int = 50, cursor: Optional[tuple] = None, status: Optional[str] = None,
+                session_type: Optional[str] = None, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                include_results: bool = False):
+    """
+    Página do histórico (keyset por created_at, id) com projeção leve:
+    só traz o JSON de results se pedido. Retorna (linhas, cursor_da_próxima_página).
+    """
+    key = _created_at_key(db)
+    cols = [models.Video.id, models.Video.status, models.Video.created_at, key.label("cursor_key"),
+            models.Video.processed_video_path, models.Video.report_path, models.Video.session_type]
+    if include_results:
+        cols.append(models.Video.results)
+
+    q = _history_filters(db.query(*cols), status, session_type, since, until)
+    if cursor:
+        c_created, c_id = cursor
+        if db.get_bind().dialect.name != "sqlite":
+            c_created = datetime.fromisoformat(c_created)
+        q = q.filter(or_(key < c_created, and_(key == c_created, models.Video.id < c_id)))
+
+    rows = q.order_by(models.Video.created_at.desc(), models.Video.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = (str(last.cursor_key), last.id)
+    return rows, next_cursor
+
+def update_video_status(db: Session, video_id: str, status: str, commit: bool = True):
     db_video = get_video(db, video_id)
     if db_video:
         db_video.status = status
-        db.commit()
-        db.refresh(db_video)
+        if commit:
+            db.commit()
+            db.refresh(db_video)
     return db_video
 
-def update_video_after_processing(db: Session, video_id: str, processed_path: str, report_path: str, results: dict, status: str):
+def update_video_after_processing(db: Session, video_id: str, processed_path: str, report_path: str, results: dict, status: str, commit: bool = True):
     db_video = get_video(db, video_id)
     if db_video:
         db_video.processed_video_path = processed_path
         db_video.report_path = report_path
         db_video.results = results
         db_video.status = status
-        db.commit()
-        db.refresh(db_video)
+        if commit:
+            db.commit()
+            db.refresh(db_video)
     return db_video
 
+def get_latest_live_session(db: Session, device_id: int):
+    """Sessão ao vivo mais recente da câmera (índice device_id, created_at)."""
+    return db.query(models.Video)\
+        .filter(models.Video.device_id == device_id, models.Video.session_type == "live")\
+        .order_by(models.Video.created_at.desc())\
+        .first()
+
 def get_latest_live_results(db: Session, device_id: int):
     """
     Recupera o último resultado de contagem (JSON) de uma câmera ao vivo.
     Isso permite reiniciar o processo mantendo os números acumulados.
     """
-    prefix = f"live_{device_id}_"
-    # Busca o vídeo mais recente deste dispositivo
-    latest = db.query(models.Video)\
-        .filter(models.Video.id.like(f"{prefix}%"))\
-        .order_by(models.Video.created_at.desc())\
-        .first()
+    latest = get_latest_live_session(db, device_id)
     
     if latest and latest.results:
         return latest.results
@@ -129,3 +225,428 @@ def get_latest_live_results(db: Session, device_id: int):
 def delete_video_by_id(db: Session, video: models.Video):
     db.delete(video)
     db.commit()
+
+def update_live_results(db: Session, video_id: str, results: dict, status: str = "live_processing", commit: bool = True):
+    """UPDATE direto do snapshot ao vivo (sem SELECT/refresh do ORM)."""
+    db.query(models.Video).filter(models.Video.id == video_id)\
+        .update({models.Video.results: results, models.Video.status: status}, synchronize_session=False)
+    if commit:
+        db.commit()
+
+def _dialect_insert(db: Session, table):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+def upsert_count_buckets(db: Session, device_id: int, deltas: dict, commit: bool = True):
+    """
+    Soma deltas por minuto em count_buckets (INSERT ... ON CONFLICT DO UPDATE).
+    deltas: {(line, direction, bucket_start): delta}
+    """
+    rows = [
+        {"device_id": device_id, "line": line, "direction": direction, "bucket_start": minute, "count": delta}
+        for (line, direction, minute), delta in deltas.items() if delta
+    ]
+    if not rows: return
+    stmt = _dialect_insert(db, models.CountBucket).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["device_id", "line", "direction", "bucket_start"],
+        set_={"count": models.CountBucket.count + stmt.excluded["count"]},
+    )
+    db.execute(stmt)
+    # Rollups por hora/dia na mesma transação (analytics sem varrer os minutos)
+    upsert_count_rollups(db, device_id, deltas, commit=False)
+    if commit:
+        db.commit()
+
+ROLLUP_GRANULARITIES = ("hour", "day", "month")
+
+def _truncate(ts: datetime, granularity: str):
+    if granularity == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    if granularity == "month":
+        return ts.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def upsert_count_rollups(db: Session, device_id: int, deltas: dict, commit: bool = True, granularities=ROLLUP_GRANULARITIES):
+    """
+    Soma os deltas por minuto nos agregados por hora, dia e mês (count_rollups).
+    deltas: {(line, direction, bucket_start): delta}
+    """
+    acc = {}
+    for (line, direction, minute), delta in deltas.items():
+        if not delta: continue
+        for gran in granularities:
+            key = (gran, line, direction, _truncate(minute, gran))
+            acc[key] = acc.get(key, 0) + delta
+    rows = [
+        {"granularity": gran, "device_id": device_id, "line": line, "direction": direction, "bucket_start": start, "count": delta}
+        for (gran, line, direction, start), delta in acc.items() if delta
+    ]
+    # Em lotes: limite de parâmetros por statement do SQLite
+    for i in range(0, len(rows), 1000):
+        stmt = _dialect_insert(db, models.CountRollup).values(rows[i:i+1000])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["granularity", "device_id", "line", "direction", "bucket_start"],
+            set_={"count": models.CountRollup.count + stmt.excluded["count"]},
+        )
+        db.execute(stmt)
+    if commit:
+        db.commit()
+
+def _time_bucket(db: Session, column, granularity: str):
+    if db.get_bind().dialect.name == "postgresql":
+        return func.date_trunc(granularity, column)
+    if granularity == "week":
+        # Segunda-feira da semana ('weekday 0' avança até domingo, -6 dias volta à segunda)
+        return func.strftime("%Y-%m-%d 00:00:00", column, "weekday 0", "-6 days")
+    fmt = {"minute": "%Y-%m-%d %H:%M:00", "hour": "%Y-%m-%d %H:00:00", "day": "%Y-%m-%d 00:00:00", "month": "%Y-%m-01 00:00:00"}[granularity]
+    return func.strftime(fmt, column)
+
+def get_count_series(db: Session, device_id: int, start: datetime, end: datetime, granularity: str = "hour", line: Optional[str] = None):
+    """Série agregada (minuto/hora/dia) usando o índice (device_id, bucket_start)."""
+    bucket = _time_bucket(db, models.CountBucket.bucket_start, granularity).label("bucket")
+    q = db.query(bucket, models.CountBucket.line, models.CountBucket.direction, func.sum(models.CountBucket.count).label("count"))\
+        .filter(models.CountBucket.device_id == device_id,
+                models.CountBucket.bucket_start >= start,
+                models.CountBucket.bucket_start < end)
+    if line:
+        q = q.filter(models.CountBucket.line == line)
+    return q.group_by(bucket, models.CountBucket.line, models.CountBucket.direction).order_by(bucket).all()
+
+def get_analytics_counts(db: Session, start: datetime, end: datetime, granularity: str = "day",
+                         device_ids: Optional[List[int]] = None, group: Optional[str] = None,
+                         line: Optional[str] = None, direction: Optional[str] = None, by: str = "device"):
+    """
+    Contagens agregadas de várias câmeras a partir de count_rollups.
+    granularity: hour | day | month (direto dos rollups) | week (agrupando os rollups diários)
+    by: device | group | total
+    """
+    R = models.CountRollup
+    source = granularity if granularity in ROLLUP_GRANULARITIES else "day"
+    bucket = (R.bucket_start if granularity == source else _time_bucket(db, R.bucket_start, granularity)).label("bucket")
+
+    if by == "group":
+        key = models.Device.group_name
+    elif by == "device":
+        key = R.device_id
+    else:
+        key = None
+    group_cols = [bucket, R.line, R.direction] + ([key] if key is not None else [])
+    key = (key if key is not None else literal_column("'total'")).label("key")
+
+    q = db.query(bucket, key, R.line, R.direction, func.sum(R.count).label("count"))\
+        .filter(R.granularity == source, R.bucket_start >= start, R.bucket_start < end)
+    if group is not None or by == "group":
+        q = q.join(models.Device, models.Device.id == R.device_id)
+    if group is not None:
+        q = q.filter(models.Device.group_name == group)
+    if device_ids:
+        q = q.filter(R.device_id.in_(device_ids))
+    if line:
+        q = q.filter(R.line == line)
+    if direction:
+        q = q.filter(R.direction == direction)
+    return q.group_by(*group_cols).order_by(bucket).all()
+
+def clear_processed_video(db: Session, video_id: str, commit: bool = True):
+    """Remove a referência ao vídeo processado (arquivo apagado pela retenção)."""
+    db.query(models.Video).filter(models.Video.id == video_id)\
+        .update({models.Video.processed_video_path: None}, synchronize_session=False)
+    if commit:
+        db.commit()
+
+def clear_evicted_sources(db: Session, upload_paths: list, frame_paths: list, commit: bool = True):
+    """Uploads e primeiros frames apagados pela retenção: zera as referências (original ausente = vídeo não reprocessável)."""
+    V = models.Video
+    for column, paths in ((V.original_video_path, upload_paths), (V.first_frame_path, frame_paths)):
+        for i in range(0, len(paths), 500):
+            db.query(V).filter(column.in_(paths[i:i + 500])).update({column: None}, synchronize_session=False)
+    if commit:
+        db.commit()
+
+def _live_total(results: Optional[dict], key: str):
+    return ((results or {}).get(key) or {}).get("Total", 0) or 0
+
+def _local_naive(ts: datetime):
+    """created_at vem do banco em UTC (func.now()); os buckets usam hora local sem fuso."""
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone().replace(tzinfo=None)
+
+def compact_live_sessions(db: Session, before: datetime, dry_run: bool = False):
+    """
+    Compacta sessões ao vivo encerradas antes de `before`: a contagem vira rollups diários/mensais
+    e a linha em videos é removida. A sessão mais recente de cada câmera é mantida (semente da contagem).
+    Cada sessão contribui com a própria contagem:
+      - com count_base: results - count_base (contagem herdada da sessão anterior);
+      - sem count_base, antes do primeiro rollup: sessões que começavam do zero, vale o total da linha;
+      - dias com rollups já estão nos count_buckets: a linha é só removida.
+    Sessões sem count_base e sem como saber o que é herdado ficam com status 'compaction_review' (não são removidas).
+    Retorna {"sessions": removidas, "folded": convertidas em rollups, "flagged": marcadas para revisão}.
+    """
+    # Dias que já têm rollups (sessões da época dos count_buckets)
+    covered = set(
+        db.query(models.CountRollup.device_id, models.CountRollup.bucket_start)
+          .filter(models.CountRollup.granularity == "day", models.CountRollup.bucket_start < before).all()
+    )
+    # Antes do primeiro rollup nenhuma sessão herdava contagem
+    first_bucket_day = db.query(func.min(models.CountRollup.bucket_start))\
+        .filter(models.CountRollup.granularity == "day").scalar()
+
+    before_utc = before.astimezone(timezone.utc).replace(tzinfo=None)
+    rows = db.query(models.Video.id, models.Video.device_id, models.Video.created_at, models.Video.results,
+                    models.Video.status, models.Video.count_base)\
+        .filter(models.Video.session_type == "live", models.Video.created_at < before_utc,
+                models.Video.status.in_(["done", "compacted"]), models.Video.device_id.isnot(None))\
+        .order_by(models.Video.device_id, models.Video.created_at).all()
+
+    to_delete, flagged, folded = [], [], 0
+    deltas_by_device = {}
+    latest_by_device = {}
+    for r in rows:
+        if r.device_id not in latest_by_device:
+            latest = get_latest_live_session(db, r.device_id)
+            latest_by_device[r.device_id] = latest.id if latest else None
+        if r.id == latest_by_device[r.device_id]: continue
+
+        # Compactada por uma execução anterior: já está nos rollups
+        if r.status == "compacted":
+            to_delete.append(r.id)
+            continue
+
+        day = _truncate(_local_naive(r.created_at), "day")
+        ent, pas = _live_total(r.results, "entrantes"), _live_total(r.results, "passantes")
+        if (r.device_id, day) in covered or not (ent or pas):
+            to_delete.append(r.id)
+            continue
+
+        if r.count_base is not None:
+            d_ent = max(0, ent - (r.count_base.get("entrantes") or 0))
+            d_pas = max(0, pas - (r.count_base.get("passantes") or 0))
+        elif first_bucket_day is not None and day < first_bucket_day:
+            d_ent, d_pas = ent, pas
+        else:
+            flagged.append(r.id)
+            continue
+
+        deltas = deltas_by_device.setdefault(r.device_id, {})
+        for key, delta in ((("entrant", "in", day), d_ent), (("passerby", "cross", day), d_pas)):
+            if delta: deltas[key] = deltas.get(key, 0) + delta
+        to_delete.append(r.id)
+        folded += 1
+
+    if flagged:
+        print(f"⚠️ {len(flagged)} sessões ao vivo sem contagem base conhecida: mantidas com status 'compaction_review'")
+    if not dry_run and (to_delete or flagged):
+        for dev_id, deltas in deltas_by_device.items():
+            upsert_count_rollups(db, dev_id, deltas, commit=False, granularities=("day", "month"))
+        for i in range(0, len(to_delete), 500):
+            db.query(models.Video).filter(models.Video.id.in_(to_delete[i:i+500])).delete(synchronize_session=False)
+        for i in range(0, len(flagged), 500):
+            db.query(models.Video).filter(models.Video.id.in_(flagged[i:i+500]))\
+                .update({models.Video.status: "compaction_review"}, synchronize_session=False)
+        db.commit()
+    return {"sessions": len(to_delete), "folded": folded, "flagged": len(flagged)}
+
+# --- Fila de jobs ---
+ACTIVE_JOB_STATUSES = ("queued", "running")
+
+def create_job(db: Session, video_id: str, params: dict, priority: int = 10, frames_total: Optional[int] = None, kind: str = "upload",
+               batch_id: Optional[str] = None, status: str = "queued", commit: bool = True):
+    job = models.Job(video_id=video_id, params=params, priority=priority, frames_total=frames_total, kind=kind, batch_id=batch_id, status=status)
+    if status == "done":
+        job.progress, job.finished_at = 100.0, func.now()
+    db.add(job)
+    if commit:
+        db.commit()
+        db.refresh(job)
+    return job
+
+def get_job(db: Session, job_id: int):
+    return db.query(models.Job).filter(models.Job.id == job_id).first()
+
+def get_active_job_for_video(db: Session, video_id: str):
+    return db.query(models.Job)\
+        .filter(models.Job.video_id == video_id, models.Job.status.in_(ACTIVE_JOB_STATUSES))\
+        .order_by(models.Job.id.desc()).first()
+
+def list_jobs(db: Session, statuses: Optional[List[str]] = None, limit: int = 100):
+    q = db.query(models.Job)
+    if statuses:
+        q = q.filter(models.Job.status.in_(statuses))
+    return q.order_by(models.Job.priority, models.Job.id).limit(limit).all()
+
+def claim_next_job(db: Session):
+    """
+    Pega o próximo job da fila (prioridade, depois ordem de chegada) e marca como running.
+    O UPDATE condicional garante que dois workers nunca peguem o mesmo job.
+    """
+    while True:
+        job = db.query(models.Job.id)\
+            .filter(models.Job.status == "queued")\
+            .order_by(models.Job.priority, models.Job.id).first()
+        if job is None:
+            return None
+        claimed = db.query(models.Job)\
+            .filter(models.Job.id == job.id, models.Job.status == "queued")\
+            .update({models.Job.status: "running", models.Job.started_at: func.now(), models.Job.attempts: models.Job.attempts + 1},
+                    synchronize_session=False)
+        db.commit()
+        if claimed:
+            return get_job(db, job.id)
+
+def update_job(db: Session, job_id: int, commit: bool = True, **fields):
+    """Atualiza campos do job (status, progress, error...). Status final preenche finished_at."""
+    if fields.get("status") in ("done", "failed", "cancelled"):
+        fields["finished_at"] = func.now()
+    db.query(models.Job).filter(models.Job.id == job_id)\
+        .update({getattr(models.Job, k): v for k, v in fields.items()}, synchronize_session=False)
+    if commit:
+        db.commit()
+
+def cancel_queued_job(db: Session, job_id: int):
+    """Cancela o job se ainda estiver na fila. Retorna True se cancelou."""
+    n = db.query(models.Job).filter(models.Job.id == job_id, models.Job.status == "queued")\
+        .update({models.Job.status: "cancelled", models.Job.finished_at: func.now()}, synchronize_session=False)
+    db.commit()
+    return bool(n)
+
+def requeue_running_jobs(db: Session):
+    """Jobs que estavam rodando quando o servidor caiu voltam para a fila."""
+    n = db.query(models.Job).filter(models.Job.status == "running")\
+        .update({models.Job.status: "queued"}, synchronize_session=False)
+    db.commit()
+    return n
+
+def get_active_job_video_ids(db: Session):
+    return {vid for (vid,) in db.query(models.Job.video_id).filter(models.Job.status.in_(ACTIVE_JOB_STATUSES))}
+
+def get_queue_snapshot(db: Session):
+    """Jobs ativos na ordem de execução: [(id, status, priority, frames_total, progress)]."""
+    return db.query(models.Job.id, models.Job.status, models.Job.priority, models.Job.frames_total, models.Job.progress)\
+        .filter(models.Job.status.in_(ACTIVE_JOB_STATUSES))\
+        .order_by(models.Job.priority, models.Job.id).all()
+
+
+# --- Lotes ---
+def create_batch(db: Session, batch_id: str, name: Optional[str], params: dict, items: list, priority: int = 20):
+    """
+    Cria o lote e todos os jobs numa transação só.
+    items: [{'video_id', 'params', 'frames_total', 'status'}] (status 'done' = resultado em cache)
+    """
+    batch = models.Batch(id=batch_id, name=name, params=params, items_total=len(items), status="running")
+    db.add(batch)
+    for item in items:
+        create_job(db, item["video_id"], item["params"], priority=priority, frames_total=item.get("frames_total"),
+                   kind="batch", batch_id=batch_id, status=item.get("status", "queued"), commit=False)
+    db.commit()
+    db.refresh(batch)
+    return batch
+
+def get_batch(db: Session, batch_id: str):
+    return db.query(models.Batch).filter(models.Batch.id == batch_id).first()
+
+def list_batch_items(db: Session, batch_id: str):
+    """Jobs do lote com o vídeo de cada um: [(Job, Video)] na ordem de envio."""
+    return db.query(models.Job, models.Video)\
+        .outerjoin(models.Video, models.Video.id == models.Job.video_id)\
+        .filter(models.Job.batch_id == batch_id)\
+        .order_by(models.Job.id).all()
+
+def count_active_batch_jobs(db: Session, batch_id: str):
+    return db.query(models.Job.id)\
+        .filter(models.Job.batch_id == batch_id, models.Job.status.in_(ACTIVE_JOB_STATUSES)).count()
+
+def cancel_batch_jobs(db: Session, batch_id: str):
+    """
+    Cancela os jobs do lote ainda na fila. Retorna (cancelados, rodando): os jobs cancelados aqui
+    e os ids dos que estão rodando (cancelados pelo worker).
+    """
+    queued = db.query(models.Job).filter(models.Job.batch_id == batch_id, models.Job.status == "queued").all()
+    for job in queued:
+        job.status = "cancelled"
+        job.finished_at = func.now()
+    db.commit()
+    running = [j.id for j in db.query(models.Job.id).filter(models.Job.batch_id == batch_id, models.Job.status == "running")]
+    return queued, running
+
+def finish_batch(db: Session, batch_id: str, status: str, results: dict):
+    """Fecha o lote (UPDATE condicional: só o primeiro worker a terminar o último job finaliza)."""
+    n = db.query(models.Batch).filter(models.Batch.id == batch_id, models.Batch.status == "running")\
+        .update({models.Batch.status: status, models.Batch.results: results, models.Batch.finished_at: func.now()}, synchronize_session=False)
+    db.commit()
+    return bool(n)
+
+
+# --- Deduplicação e cache de resultados ---
+def find_video_by_hash(db: Session, content_hash: str, exclude_id: Optional[str] = None):
+    """Upload anterior com o mesmo conteúdo (o mais recente)."""
+    q = db.query(models.Video).filter(models.Video.content_hash == content_hash, models.Video.original_video_path.isnot(None))
+    if exclude_id:
+        q = q.filter(models.Video.id != exclude_id)
+    return q.order_by(models.Video.created_at.desc()).first()
+
+def set_video_hash(db: Session, video_id: str, content_hash: str, commit: bool = True):
+    db.query(models.Video).filter(models.Video.id == video_id)\
+        .update({models.Video.content_hash: content_hash}, synchronize_session=False)
+    if commit:
+        db.commit()
+
+def get_result_cache(db: Session, key: str):
+    return db.query(models.ResultCache).filter(models.ResultCache.key == key).first()
+
+def save_result_cache(db: Session, key: str, content_hash: str, cfg_hash: str, tracker_version: str, model_version: str,
+                      video_id: str, processed_video_path: str, events_path: str, results: dict, commit: bool = True):
+    """Grava (ou substitui) o resultado em cache da combinação."""
+    entry = get_result_cache(db, key) or models.ResultCache(key=key, hits=0)
+    entry.content_hash = content_hash
+    entry.cfg_hash = cfg_hash
+    entry.tracker_version = tracker_version
+    entry.model_version = model_version
+    entry.source_video_id = video_id
+    entry.processed_video_path = processed_video_path
+    entry.events_path = events_path
+    entry.results = results
+    db.add(entry)
+    if commit:
+        db.commit()
+    return entry
+
+def record_cache_hit(db: Session, key: str, commit: bool = True):
+    db.query(models.ResultCache).filter(models.ResultCache.key == key)\
+        .update({models.ResultCache.hits: models.ResultCache.hits + 1, models.ResultCache.last_hit_at: func.now()}, synchronize_session=False)
+    if commit:
+        db.commit()
+
+def save_quick_estimate(db: Session, video_id: str, content_hash: Optional[str], cfg_hash: str, sample_fps: float, imgsz: Optional[int],
+                        frames_sampled: int, elapsed_s: float, estimate: dict, actual: Optional[dict] = None):
+    entry = models.QuickEstimate(video_id=video_id, content_hash=content_hash, cfg_hash=cfg_hash, sample_fps=sample_fps, imgsz=imgsz,
+                                 frames_sampled=frames_sampled, elapsed_s=elapsed_s, estimate=estimate)
+    if actual:
+        # Só atribui quando existe: JSON None viraria 'null' e a estimativa nunca seria calibrada
+        entry.actual = actual
+        entry.calibrated_at = func.now()
+    db.add(entry)
+    db.commit()
+    db.refresh(entry)
+    return entry
+
+def calibrate_quick_estimates(db: Session, content_hash: str, cfg_hash: str, actual: dict, commit: bool = True):
+    """Processamento completo terminou: as estimativas ainda sem contagem real da mesma combinação passam a servir de calibração."""
+    n = db.query(models.QuickEstimate)\
+        .filter(models.QuickEstimate.content_hash == content_hash, models.QuickEstimate.cfg_hash == cfg_hash,
+                models.QuickEstimate.actual.is_(None))\
+        .update({models.QuickEstimate.actual: actual, models.QuickEstimate.calibrated_at: func.now()}, synchronize_session=False)
+    if commit:
+        db.commit()
+    return n
+
+def get_quick_calibration(db: Session, sample_fps: float, imgsz: Optional[int], limit: int = 200):
+    """(estimativa, contagem real) das estimativas calibradas com os mesmos parâmetros de amostragem, mais recentes primeiro."""
+    rows = db.query(models.QuickEstimate.estimate, models.QuickEstimate.actual)\
+        .filter(models.QuickEstimate.actual.isnot(None), models.QuickEstimate.sample_fps == sample_fps,
+                models.QuickEstimate.imgsz.is_(None) if imgsz is None else models.QuickEstimate.imgsz == imgsz)\
+        .order_by(models.QuickEstimate.id.desc()).limit(limit).all()
+    return [(r.estimate, r.actual) for r in rows]
@@ -0,0 +1,172 @@
+# crud_async.py
+# Versões assíncronas do crud para uso direto no event loop (rotas async e pipelines).
+# Consultas simples usam select(); as mais elaboradas reaproveitam a lógica do crud síncrono via run_sync.
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from datetime import datetime
+import crud, models, schemas
+
+
+async def get_video(db: AsyncSession, video_id: str):
+    return await db.get(models.Video, video_id)
+
+async def create_user_video(db: AsyncSession, user_id: int, video_id: str, original_video_path: str, first_frame_path: str, device_id: Optional[int] = None, session_type: str = "upload", content_hash: Optional[str] = None, count_base: Optional[dict] = None):
+    db_video = models.Video(
+        id=video_id,
+        original_video_path=original_video_path,
+        first_frame_path=first_frame_path,
+        status="pending",
+        device_id=device_id,
+        session_type=session_type,
+        content_hash=content_hash,
+        count_base=count_base
+    )
+    db.add(db_video)
+    await db.commit()
+    return db_video
+
+async def update_video_status(db: AsyncSession, video_id: str, status: str):
+    db_video = await get_video(db, video_id)
+    if db_video:
+        db_video.status = status
+        await db.commit()
+    return db_video
+
+async def update_video_after_processing(db: AsyncSession, video_id: str, processed_path: str, report_path: str, results: dict, status: str):
+    db_video = await get_video(db, video_id)
+    if db_video:
+        db_video.processed_video_path = processed_path
+        db_video.report_path = report_path
+        db_video.results = results
+        db_video.status = status
+        await db.commit()
+    return db_video
+
+async def delete_video_by_id(db: AsyncSession, video: models.Video):
+    await db.delete(video)
+    await db.commit()
+
+async def list_videos(db: AsyncSession, *args, **kwargs):
+    return await db.run_sync(crud.list_videos, *args, **kwargs)
+
+async def history_version(db: AsyncSession, *args, **kwargs):
+    return await db.run_sync(crud.history_version, *args, **kwargs)
+
+async def get_latest_live_session(db: AsyncSession, device_id: int):
+    """Sessão ao vivo mais recente da câmera (índice device_id, created_at)."""
+    res = await db.execute(
+        select(models.Video)
+        .where(models.Video.device_id == device_id, models.Video.session_type == "live")
+        .order_by(models.Video.created_at.desc())
+        .limit(1)
+    )
+    return res.scalars().first()
+
+async def get_latest_live_results(db: AsyncSession, device_id: int):
+    latest = await get_latest_live_session(db, device_id)
+    if latest and latest.results:
+        return latest.results
+    return None
+
+async def get_device(db: AsyncSession, device_id: int):
+    return await db.get(models.Device, device_id)
+
+async def get_devices(db: AsyncSession, configured_only: bool = False):
+    stmt = select(models.Device)
+    if configured_only:
+        stmt = stmt.where(models.Device.is_configured == True)
+    res = await db.execute(stmt)
+    return res.scalars().all()
+
+async def get_device_by_url(db: AsyncSession, ip_address: str, rtsp_url: str):
+    res = await db.execute(
+        select(models.Device).where(models.Device.ip_address == ip_address, models.Device.rtsp_url == rtsp_url)
+    )
+    return res.scalars().first()
+
+async def delete_device(db: AsyncSession, device_id: int):
+    dev = await get_device(db, device_id)
+    if dev:
+        await db.delete(dev)
+        await db.commit()
+    return dev
+
+async def update_device_config(db: AsyncSession, device_id: int, config: schemas.DeviceUpdate, rtsp_url: str):
+    return await db.run_sync(crud.update_device_config, device_id, config, rtsp_url)
+
+async def get_stream_metadata(db: AsyncSession, device_id: int):
+    return await db.run_sync(crud.get_stream_metadata, device_id)
+
+async def save_stream_metadata(db: AsyncSession, device_id: int, meta: dict):
+    return await db.run_sync(crud.save_stream_metadata, device_id, meta)
+
+async def get_count_series(db: AsyncSession, device_id: int, start: datetime, end: datetime, granularity: str = "hour", line: Optional[str] = None):
+    return await db.run_sync(crud.get_count_series, device_id, start, end, granularity, line)
+
+async def get_analytics_counts(db: AsyncSession, *args, **kwargs):
+    return await db.run_sync(crud.get_analytics_counts, *args, **kwargs)
+
+async def create_job(db: AsyncSession, *args, **kwargs):
+    return await db.run_sync(crud.create_job, *args, **kwargs)
+
+async def get_job(db: AsyncSession, job_id: int):
+    return await db.get(models.Job, job_id)
+
+async def get_active_job_for_video(db: AsyncSession, video_id: str):
+    return await db.run_sync(crud.get_active_job_for_video, video_id)
+
+async def list_jobs(db: AsyncSession, statuses: Optional[list] = None, limit: int = 100):
+    return await db.run_sync(crud.list_jobs, statuses, limit)
+
+async def claim_next_job(db: AsyncSession):
+    return await db.run_sync(crud.claim_next_job)
+
+async def update_job(db: AsyncSession, job_id: int, **fields):
+    return await db.run_sync(crud.update_job, job_id, **fields)
+
+async def cancel_queued_job(db: AsyncSession, job_id: int):
+    return await db.run_sync(crud.cancel_queued_job, job_id)
+
+async def requeue_running_jobs(db: AsyncSession):
+    return await db.run_sync(crud.requeue_running_jobs)
+
+async def get_queue_snapshot(db: AsyncSession):
+    return await db.run_sync(crud.get_queue_snapshot)
+
+async def create_batch(db: AsyncSession, *args, **kwargs):
+    return await db.run_sync(crud.create_batch, *args, **kwargs)
+
+async def get_batch(db: AsyncSession, batch_id: str):
+    return await db.get(models.Batch, batch_id)
+
+async def list_batch_items(db: AsyncSession, batch_id: str):
+    return await db.run_sync(crud.list_batch_items, batch_id)
+
+async def count_active_batch_jobs(db: AsyncSession, batch_id: str):
+    return await db.run_sync(crud.count_active_batch_jobs, batch_id)
+
+async def cancel_batch_jobs(db: AsyncSession, batch_id: str):
+    return await db.run_sync(crud.cancel_batch_jobs, batch_id)
+
+async def finish_batch(db: AsyncSession, batch_id: str, status: str, results: dict):
+    return await db.run_sync(crud.finish_batch, batch_id, status, results)
+
+async def find_video_by_hash(db: AsyncSession, content_hash: str, exclude_id: Optional[str] = None):
+    return await db.run_sync(crud.find_video_by_hash, content_hash, exclude_id)
+
+async def set_video_hash(db: AsyncSession, video_id: str, content_hash: str):
+    return await db.run_sync(crud.set_video_hash, video_id, content_hash)
+
+async def get_result_cache(db: AsyncSession, key: str):
+    return await db.get(models.ResultCache, key)
+
+async def record_cache_hit(db: AsyncSession, key: str):
+    return await db.run_sync(crud.record_cache_hit, key)
+
+async def save_quick_estimate(db: AsyncSession, *args, **kwargs):
+    return await db.run_sync(crud.save_quick_estimate, *args, **kwargs)
+
+async def get_quick_calibration(db: AsyncSession, sample_fps: float, imgsz: Optional[int], limit: int = 200):
+    return await db.run_sync(crud.get_quick_calibration, sample_fps, imgsz, limit)
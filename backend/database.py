@@ -1,7 +1,8 @@
 # database.py
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 import os
 
 # Define SQLite como padrão se não houver variável de ambiente
@@ -14,8 +15,34 @@ engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args=connect_args
 )
 
+# Engine assíncrona (aiosqlite no SQLite padrão) para uso direto no event loop.
+# Outros bancos: informar ASYNC_DATABASE_URL com um driver assíncrono instalado
+def _async_url(url):
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    return url
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", _async_url(SQLALCHEMY_DATABASE_URL))
+async_engine = create_async_engine(ASYNC_DATABASE_URL)
+
+if "sqlite" in SQLALCHEMY_DATABASE_URL:
+    @event.listens_for(engine, "connect")
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def _sqlite_pragmas(dbapi_conn, _):
+        """WAL: leituras da API não esperam pelas escritas dos pipelines."""
+        cur = dbapi_conn.cursor()
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=NORMAL")
+        cur.execute("PRAGMA busy_timeout=5000")
+        cur.execute("PRAGMA temp_store=MEMORY")
+        cur.execute("PRAGMA cache_size=-20000")
+        cur.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# expire_on_commit=False: objetos continuam legíveis após o commit sem novo I/O implícito
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
 Base = declarative_base()
 
 def get_db():
@@ -23,4 +50,75 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def add_missing_columns():
+    """
+    O create_all não altera tabelas já existentes: adiciona em bancos antigos
+    as colunas e índices novos declarados nos models.
+    """
+    insp = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not insp.has_table(table.name): continue
+            existing = {c['name'] for c in insp.get_columns(table.name)}
+            for col in table.columns:
+                if col.name in existing: continue
+                ddl = col.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {col.name} {ddl}'))
+                print(f"🛠️ Coluna adicionada: {table.name}.{col.name}")
+
+            existing_idx = {i['name'] for i in insp.get_indexes(table.name)}
+            for idx in table.indexes:
+                if idx.name not in existing_idx:
+                    idx.create(conn)
+
+
+def backfill_video_sessions():
+    """Preenche device_id/session_type de linhas antigas a partir do id ('live_{device}_{timestamp}')."""
+    with engine.begin() as conn:
+        rows = conn.execute(text("SELECT id FROM videos WHERE session_type IS NULL")).fetchall()
+        if not rows: return
+        live, uploads = [], []
+        for (vid,) in rows:
+            parts = vid.split('_')
+            if vid.startswith('live_') and len(parts) > 2 and parts[1].isdigit():
+                live.append({"id": vid, "device_id": int(parts[1])})
+            else:
+                uploads.append({"id": vid})
+        if live:
+            conn.execute(text("UPDATE videos SET session_type = 'live', device_id = :device_id WHERE id = :id"), live)
+        if uploads:
+            conn.execute(text("UPDATE videos SET session_type = 'upload' WHERE id = :id"), uploads)
+        print(f"🛠️ Backfill de sessões: {len(live)} ao vivo, {len(uploads)} uploads")
+
+
+def backfill_count_rollups():
+    """Monta os rollups hora/dia/mês a partir de count_buckets já existentes (bancos anteriores aos rollups)."""
+    import crud, models
+    with SessionLocal() as db:
+        if db.query(models.CountRollup.id).first() is not None: return
+        if db.query(models.CountBucket.id).first() is None: return
+        # Em blocos: o upsert soma, então aplicar parcialmente dá o mesmo resultado
+        chunk, total = {}, 0
+        for b in db.query(models.CountBucket).order_by(models.CountBucket.device_id).yield_per(5000):
+            chunk.setdefault(b.device_id, {})[(b.line, b.direction, b.bucket_start)] = b.count
+            total += 1
+            if total % 50000 == 0:
+                for device_id, deltas in chunk.items():
+                    crud.upsert_count_rollups(db, device_id, deltas, commit=False)
+                chunk = {}
+        for device_id, deltas in chunk.items():
+            crud.upsert_count_rollups(db, device_id, deltas, commit=False)
+        db.commit()
+        print(f"🛠️ Backfill de rollups: {total} minutos agregados")
+
+
+def run_migrations():
+    add_missing_columns()
+    backfill_video_sessions()
+    backfill_count_rollups()
@@ -1,37 +1,37 @@
 import os
 import uuid
-import shutil
 import cv2
 import asyncio
 import json
+import base64
+import hashlib
 import numpy as np
-import pandas as pd
 from datetime import timedelta, datetime
 import ffmpeg
 import json
-import requests
 from urllib.parse import urlparse, quote
 import time
 import socket
 import ffmpeg
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, File, UploadFile, HTTPException, WebSocket, WebSocketDisconnect, BackgroundTasks, Depends, Response, status
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException, WebSocket, WebSocketDisconnect, Depends, Response, Request, Query, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import StreamingResponse, FileResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from typing import Dict, List, Any
-from collections import Counter
-from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from pydantic import BaseModel, Field
 from urllib.parse import quote
 
 # Importações do projeto
-from sense import config, video_process, geometry, live_manager
+from sense import config, video_process, geometry, live_manager, go2rtc, live_channel, db_writer, counting, reports, retention, jobs, chunked, job_checkpoint, result_cache, video_writer, render, preview, progress, batch, quick_estimate
 import crud, models, schemas
-from database import engine, get_db
+from database import engine, get_async_db, run_migrations, AsyncSessionLocal, SessionLocal
+from sqlalchemy.ext.asyncio import AsyncSession
+import crud_async
 import subprocess
-from typing import Dict, List, Any, Optional
+from collections import deque
+from typing import Dict, List, Any, Optional, Literal
 
 
 ml_models = {}
@@ -40,6 +40,8 @@ processing_jobs: Dict[str, Dict[str, Any]] = {}
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("Iniciando o servidor...")
+    # Writer write-behind: todas as escritas dos pipelines passam por ele
+    db_writer.writer.start()
     try:
         # Carrega Modelos IA
         ml_models["processor"] = video_process.VideoProcessor()
@@ -47,32 +49,65 @@ async def lifespan(app: FastAPI):
         
         # Inicia Scheduler em Background
         asyncio.create_task(live_manager.scheduler_loop(ml_models))
+
+        # Fila de jobs offline: cada worker usa um fork do processor (tracker próprio)
+        jobs.queue.handler = run_job
+        jobs.queue.on_finished = _on_job_finished
+        jobs.queue.processor_factory = lambda: ml_models["processor"].fork()
+        await jobs.queue.start()
+
+        # Retenção de mídia/histórico (vídeos em processamento ou na fila nunca são removidos)
+        if config.RETENTION_ENABLED:
+            retention.service.protected_ids = _protected_video_ids
+            asyncio.create_task(retention.service.loop())
         
     except Exception as e:
         print(f"❌ Erro no VideoProcessor ou Scheduler: {e}")
         ml_models["processor"] = None
     yield
+    await jobs.queue.stop()
+    chunked.pool.shutdown()
+    await db_writer.writer.stop()
+    await go2rtc.client.close()
     ml_models.clear()
     print("Servidor desligado.")
 
 app = FastAPI(title="SenseProduct API", lifespan=lifespan)
 models.Base.metadata.create_all(bind=engine)
+run_migrations()
 origins = ["*"]
-app.add_middleware(CORSMiddleware, allow_origins=origins, allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
+app.add_middleware(CORSMiddleware, allow_origins=origins, allow_credentials=True, allow_methods=["*"], allow_headers=["*"], expose_headers=["ETag", "X-Next-Cursor"])
 app.mount("/static", StaticFiles(directory=config.STATIC_DIR), name="static")
 
 # --- Schemas Auxiliares ---
 class ConnectionManager:
-    def __init__(self): self.active_connections: Dict[str, WebSocket] = {}
+    def __init__(self):
+        self.active_connections: Dict[str, WebSocket] = {}
+        self.watchers: Dict[str, set] = {} # video_id -> client_ids acompanhando o job
     async def connect(self, websocket: WebSocket, client_id: str): await websocket.accept(); self.active_connections[client_id] = websocket
     def disconnect(self, client_id: str):
         if client_id in self.active_connections: del self.active_connections[client_id]
-    async def _send_json(self, client_id: str, data: dict):
+        for clients in self.watchers.values(): clients.discard(client_id)
+    def watch(self, video_id: str, client_id: str):
+        if client_id: self.watchers.setdefault(video_id, set()).add(client_id)
+    def unwatch(self, video_id: str):
+        """Job/lote encerrado (qualquer status): ninguém mais recebe mensagens dele."""
+        self.watchers.pop(video_id, None)
+    async def _send_text(self, client_id: str, text: str):
         if client_id in self.active_connections:
-            try: await self.active_connections[client_id].send_text(json.dumps(data))
+            try: await self.active_connections[client_id].send_text(text)
             except Exception: self.disconnect(client_id)
-    async def send_progress(self, client_id: str, progress: float): await self._send_json(client_id, {"type": "progress", "value": progress})
-    async def send_final_results(self, client_id: str, results: dict): await self._send_json(client_id, {"type": "results", "value": results})
+    async def broadcast(self, video_id: str, data: dict, client_id: Optional[str] = None):
+        """Envia para todos que acompanham o vídeo (JSON serializado uma vez só)."""
+        targets = set(self.watchers.get(video_id, ()))
+        if client_id: targets.add(client_id)
+        if not targets: return
+        text = json.dumps(data)
+        await asyncio.gather(*(self._send_text(c, text) for c in targets))
+    async def send_progress(self, video_id: str, data: dict, client_id: Optional[str] = None): await self.broadcast(video_id, data, client_id)
+    async def send_final_results(self, video_id: str, results: dict, client_id: Optional[str] = None):
+        await self.broadcast(video_id, {"type": "results", "video_id": video_id, "value": results}, client_id)
+        self.unwatch(video_id)
 
 manager = ConnectionManager()
 
@@ -81,315 +116,282 @@ class ProcessRequest(BaseModel):
     video_id: str; client_id: str
     entrant_line_points: List[Dict[str, float]]; passerby_line_points: List[Dict[str, float]]
     frame_dimensions: FrameDimensions; in_side: str
+    mode: Optional[Literal["sequential", "chunked", "quick"]] = None # None = automático (paralelo para vídeos longos); quick = estimativa por amostragem
+    use_cache: bool = True # False força reprocessar mesmo com resultado em cache
+    render: Literal["none", "preview", "full"] = "full" # none = só contagens, eventos e trajetórias (mais rápido)
+    quick_fps: Optional[float] = Field(None, gt=0) # Só no modo quick: frames/s amostrados (padrão QUICK_SAMPLE_FPS)
+    quick_imgsz: Optional[int] = Field(None, ge=0) # Só no modo quick: imgsz da detecção (0 = padrão da detecção)
 
 # --- LÓGICA GEOMÉTRICA (Refatorada para sense/geometry.py) ---
 # As funções get_point_side, get_closest_segment_side e bbox_intersects_line foram removidas daqui.
 
-def draw_line_visuals(frame, line_points, color, label, in_side=None):
-    if len(line_points) < 2: return
-    for i in range(len(line_points) - 1):
-        p1 = (int(line_points[i]['x']), int(line_points[i]['y']))
-        p2 = (int(line_points[i+1]['x']), int(line_points[i+1]['y']))
-        cv2.line(frame, p1, p2, color, 3)
-    
-    mid = len(line_points) // 2
-    p1, p2 = line_points[mid-1], line_points[mid]
-    mx, my = (p1['x']+p2['x'])/2, (p1['y']+p2['y'])/2
-    
-    if in_side: # Lógica Entrantes
-        dx, dy = p2['x']-p1['x'], p2['y']-p1['y']
-        norm = {'x': -dy, 'y': dx}; length = np.sqrt(norm['x']**2 + norm['y']**2) or 1
-        un = {'x': norm['x']/length, 'y': norm['y']/length}
-        t1 = (int(mx + un['x']*40), int(my + un['y']*40))
-        t2 = (int(mx - un['x']*40), int(my - un['y']*40))
-        cv2.putText(frame, "IN" if in_side=='right' else "OUT", t1, cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
-        cv2.putText(frame, "OUT" if in_side=='right' else "IN", t2, cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
-    else: # Lógica Passantes
-        cv2.putText(frame, label, (int(mx), int(my-10)), cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
+def _new_stream_entry():
+    return {"preview": preview.PreviewChannel()}
+
+async def _close_stream_entry(video_id: str):
+    """Libera quem estiver assistindo o preview (o gerador do stream mantém sua própria referência)."""
+    entry = processing_jobs.pop(video_id, None)
+    if entry is not None:
+        await entry["preview"].close()
+
+def _protected_video_ids():
+    """Vídeos em processamento ou na fila (chamado pela retenção, fora do event loop)."""
+    with SessionLocal() as db:
+        return set(processing_jobs) | crud.get_active_job_video_ids(db)
+
+def _scale_lines(pts, dims, fw, fh):
+    """Linhas desenhadas no frontend (dims da imagem exibida) -> pixels do vídeo."""
+    sx = fw / dims['width'] if dims['width'] else 1; sy = fh / dims['height'] if dims['height'] else 1
+    return [{'x': int(p['x']*sx), 'y': int(p['y']*sy)} for p in pts]
 
 # --- CORE: Processamento de Vídeo ---
-async def run_video_processing(video_id: str, line_ent_raw: list, line_pass_raw: list, client_id: str, dims: dict, in_side: str, db: Session):
-    processor = ml_models.get("processor")
-    job = processing_jobs.get(video_id)
-    if not all([processor, job]): return
-
-    crud.update_video_status(db, video_id, "processing")
-    frame_queue, ready_event = job["queue"], job["ready_event"]
-    video = crud.get_video(db, video_id)
+async def run_video_processing(video_id: str, line_ent_raw: list, line_pass_raw: list, client_id: str, dims: dict, in_side: str,
+                               processor=None, cancel_event: Optional[asyncio.Event] = None, job_id: Optional[int] = None,
+                               mode: Optional[str] = None, render_mode: str = "full", report: bool = True):
+    processor = processor or ml_models.get("processor")
+    if not processor: raise RuntimeError("VideoProcessor indisponível")
+    job = processing_jobs.setdefault(video_id, _new_stream_entry())
+
+    db_writer.writer.submit(crud.update_video_status, video_id, "processing", key=("video", video_id))
+    preview_channel = job["preview"]
+    async with AsyncSessionLocal() as db:
+        video = await crud_async.get_video(db, video_id)
     
     vid = cv2.VideoCapture(video.original_video_path)
-    if not vid.isOpened(): ready_event.set(); await frame_queue.put(None); return
+    if not vid.isOpened(): raise RuntimeError(f"Não foi possível abrir {video.original_video_path}")
     
     fw = int(vid.get(cv2.CAP_PROP_FRAME_WIDTH)); fh = int(vid.get(cv2.CAP_PROP_FRAME_HEIGHT))
     fps = vid.get(cv2.CAP_PROP_FPS); total = int(vid.get(cv2.CAP_PROP_FRAME_COUNT))
     
     # Escalar linhas
-    sx = fw / dims['width'] if dims['width'] else 1; sy = fh / dims['height'] if dims['height'] else 1
-    def sc(pts): return [{'x': int(p['x']*sx), 'y': int(p['y']*sy)} for p in pts]
-    line_ent = sc(line_ent_raw); line_pass = sc(line_pass_raw)
+    line_ent = _scale_lines(line_ent_raw, dims, fw, fh); line_pass = _scale_lines(line_pass_raw, dims, fw, fh)
+
+    # Progresso coalescido (PROGRESS_INTERVAL_S) para todos que acompanham o vídeo
+    manager.watch(video_id, client_id)
+    job_progress = progress.JobProgress(video_id, total, job_id=job_id)
+    out = None
+    async def report_progress(pct, stage="processing", force=False):
+        if not (force or job_progress.due()): return
+        queues = {"inference_waiting": jobs.gate.waiting, "db_writer": db_writer.writer.stats()["queue_depth"],
+                  "preview_viewers": preview_channel.viewers}
+        if out is not None:
+            queues["encoder"] = out.stats().get("queue_depth", 0)
+        await manager.send_progress(video_id, job_progress.message(pct, queues, stage), client_id)
+        if job_id is not None:
+            db_writer.writer.submit(crud.update_job, job_id, progress=round(pct, 2), key=("job_progress", job_id))
+
+    # Checkpoint do job: se o servidor caiu no meio, retoma do último ponto salvo
+    cfg_hash = reports.config_hash(line_ent, line_pass, in_side)
+    events_file = reports.events_path(video_id, cfg_hash)
+    ckpt = job_checkpoint.JobCheckpoint(video_id, cfg_hash)
+    state = ckpt.load()
+    if state and not os.path.exists(events_file + ".part"):
+        ckpt.reset(); state = None
+    if state:
+        print(f"♻️ Retomando {video_id} do frame {state['frame']}/{total} ({state['parts']} segmentos de saída)")
+
+    # Vídeos longos: inferência paralela por segmentos (tracks costurados); o loop abaixo só conta e desenha
+    merged = None
+    progress_base, progress_scale = 0.0, 100.0
+    use_chunks = state["chunked"] if state else (mode == "chunked" or (mode is None and chunked.should_chunk(total, fps)))
+    if use_chunks:
+        try:
+            merged = await chunked.analyze(video.original_video_path, total, fps, ckpt.chunk_dir, cancel_event,
+                                           on_progress=lambda frac: report_progress(frac * 80, stage="chunked"))
+        except Exception:
+            vid.release(); ckpt.clear()
+            raise
+        if merged is None:
+            vid.release(); ckpt.clear()
+            raise jobs.JobCancelled()
+        print(f"🧵 Costura de {video_id}: {merged.stats()}")
+        progress_base, progress_scale = 80.0, 20.0
     
-    # Output - Tenta usar codec H.264 (avc1) se disponível, fallback para mp4v
+    # Output em segmentos: cada checkpoint fecha um mp4 válido; no final são concatenados sem recodificar
     out_path = os.path.join(config.OUTPUT_DIR, f"{video_id}_processed.mp4")
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(out_path, fourcc, fps, (fw, fh))
-    if not out.isOpened(): # Fallback
-        out = cv2.VideoWriter(out_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (fw, fh))
+    # H.264 via ffmpeg numa thread própria: o loop só enfileira os frames
+    draw = render_mode != "none"
+    part_idx = state["parts"] if state else 0
+    def open_part(i): return video_writer.open_writer(ckpt.part_path(i), fw, fh, fps) if render_mode == "full" else None
+    out = open_part(part_idx)
+    part_frames = 0
 
     # --- ESTADO E CONTAGEM ---
-    # track_states: 'neutral' | 'passerby' | 'entrant'
-    track_states = {} 
-    
-    # Contadores (Apenas Entrantes e Passantes)
-    count_entrant = 0
-    count_passerby = 0
-    
-    # Removido: count_exit, current_occupancy, total_dwell_time_accumulated
-    
-    # Buffer para identificar gêneros
-    track_classes = {} 
+    # Mesma lógica de cruzamento do pipeline ao vivo; ts = segundos desde o início do vídeo
+    counter = counting.CrossingCounter(line_ent, line_pass, in_side)
+    counts = counter.counts
+
+    # Eventos de cruzamento vão para o log (base dos relatórios por minuto/hora)
+    event_log = reports.EventLog(events_file, resume_at=state["events_offset"] if state else None)
+    # Trajetórias: centro de cada track por frame (em todos os modos de renderização)
+    tracks_log = reports.EventLog(reports.tracks_path(video_id, cfg_hash), resume_at=state.get("tracks_offset") if state else None)
 
-    entrant_out_side = 'left' if in_side == 'right' else 'right'
-    
-    ready_event.set()
     curr_frame = 0
+    overlap = max(1, int(round(config.CHUNK_OVERLAP_S * (fps or 30))))
+    recent = deque(maxlen=overlap) # (frame, tracks) mais recentes: costura dos IDs na retomada
+    max_track_id = 0
+    remap = lambda tid: tid
+    if state:
+        counter.restore(state["counts"], state["track_states"])
+        curr_frame = state["frame"]
+        max_track_id = state["max_track_id"]
+        if merged is not None:
+            vid.set(cv2.CAP_PROP_POS_FRAMES, curr_frame)
+        else:
+            # Tracker novo: reprocessa os frames anteriores ao checkpoint só para aquecer e
+            # associa os tracks às caixas salvas (mesmos IDs, sem recontar quem estava no meio do cruzamento)
+            warm = max(0, curr_frame - overlap)
+            vid.set(cv2.CAP_PROP_POS_FRAMES, warm)
+            head = {}
+            for i in range(warm, curr_frame):
+                ret, frame = vid.read()
+                if not ret: break
+                async with jobs.gate.slot(jobs.PRIORITY_UPLOAD):
+                    tracks = await asyncio.to_thread(processor.process_frame, frame)
+                for t in tracks:
+                    head.setdefault(t["track_id"], {})[i] = t["bbox"]
+            tail = {int(tid): {int(fr): box for fr, box in boxes.items()} for tid, boxes in state["tail"].items()}
+            mapping = chunked.match_tracks({"tail": tail, "emb_tail": {}}, {"head": head, "emb_head": {}})
+            # IDs não associados ganham um deslocamento para não colidir com os do checkpoint
+            remap = lambda tid, m=mapping, off=max_track_id: m.get(tid, tid + off)
+            print(f"🧵 {video_id}: {len(mapping)}/{len(tail)} tracks do checkpoint reassociados")
+
+    cancelled = False
+    last_ckpt = time.monotonic()
     
-    while True:
-        ret, frame = vid.read()
-        if not ret: break
-        
-        # Desenhar linhas
-        draw_line_visuals(frame, line_ent, (0, 255, 0), "Entrantes", in_side)
-        draw_line_visuals(frame, line_pass, (0, 255, 255), "Passantes")
-        
-        tracks = await asyncio.to_thread(processor.process_frame, frame)
-        
-        for t in tracks:
-            tid = t["track_id"]; bbox = t["bbox"]; cls = t["class_id"]
-            
-            # --- PONTO DE REFERÊNCIA: CENTRO DO BBOX ---
-            ref_point = (int((bbox[0]+bbox[2])/2), int((bbox[1]+bbox[3])/2))
-
-            # Inicializa estado se novo ID
-            if tid not in track_states:
-                track_states[tid] = {
-                    'status': 'neutral', 
-                    'last_point': ref_point
-                }
-                track_classes[tid] = []
-            
-            track_classes[tid].append(cls)
-            state = track_states[tid]
-            
-            # --- PROTEÇÃO CONTRA KEYERROR ---
-            # Se por algum motivo o estado veio antigo (sem last_point), usa o atual para não quebrar
-            prev_point = state.get('last_point', ref_point)
-
-            # Só processa se houve deslocamento real
-            if prev_point != ref_point:
-
-                # -----------------------------------------------------------
-                # 1. Checa Passante (Lógica: Cruzamento de Segmento - Bidirecional)
-                # -----------------------------------------------------------
-                crossed_pass = False
-                for i in range(len(line_pass) - 1):
-                    # Verifica se o movimento cortou algum segmento da linha desenhada
-                    if geometry.segments_intersect(prev_point, ref_point, line_pass[i], line_pass[i+1]):
-                        crossed_pass = True
-                        break
-
-                if crossed_pass:
-                    if state['status'] == 'neutral':
-                        state['status'] = 'passerby'
-                        count_passerby += 1
-                        # Feedback Visual
-                        cv2.rectangle(frame, (int(bbox[0]), int(bbox[1])), (int(bbox[2]), int(bbox[3])), (0, 255, 255), 4)
-
-                # -----------------------------------------------------------
-                # 2. Checa Entrante (Lógica: Cruzamento + Direção OUT->IN)
-                # -----------------------------------------------------------
-                for i in range(len(line_ent) - 1):
-                    p_start = line_ent[i]
-                    p_end = line_ent[i+1]
-                    
-                    # Se cruzou o segmento físico da linha de entrada
-                    if geometry.segments_intersect(prev_point, ref_point, p_start, p_end):
-                        
-                        # Verifica Direção: Ponto anterior deve estar do lado 'OUT'
-                        side_prev = geometry.get_side_of_segment(prev_point, p_start, p_end)
-                        required_prev_side = 'left' if in_side == 'right' else 'right'
-
-                        if side_prev == required_prev_side:
-                            # Confirmação de Entrada
-                            if state['status'] == 'neutral':
-                                state['status'] = 'entrant'
-                                count_entrant += 1
-                                cv2.circle(frame, ref_point, 20, (0, 255, 0), -1)
-                                
-                            elif state['status'] == 'passerby':
-                                # Correção: Era passante, mas decidiu entrar
-                                state['status'] = 'entrant'
-                                count_passerby -= 1 # Remove da contagem de passantes
-                                count_entrant += 1  # Adiciona na contagem de entrantes
-                                cv2.circle(frame, ref_point, 20, (0, 255, 0), -1)
-                                cv2.putText(frame, "TROCOU!", (int(bbox[0]), int(bbox[1]-20)), cv2.FONT_HERSHEY_SIMPLEX, 1, (0,0,255), 2)
-                            
-                            break # Já contou, sai do loop de segmentos
-
-            # Atualiza o último ponto conhecido
-            state['last_point'] = ref_point
-
-        # Desenha as caixas e IDs primeiro (para a bolinha ficar por cima depois)
-        annotated = processor.draw_tracks(frame, tracks)
-
-        for t in tracks:
-            tid = t["track_id"]; bbox = t["bbox"]; cls = t["class_id"]
-            
-            # --- PONTO DE REFERÊNCIA: CENTRO DO BBOX ---
-            ref_point = (int((bbox[0]+bbox[2])/2), int((bbox[1]+bbox[3])/2))
-            
-            # Desenha a "Bolinha Vermelha" garantida na imagem de saída
-            cv2.circle(annotated, ref_point, 5, (0, 0, 255), -1)
-
-            # Inicializa estado se novo ID
-            if tid not in track_states:
-                track_states[tid] = {
-                    'status': 'neutral', 
-                    'last_point': ref_point
-                }
-                track_classes[tid] = []
-            
-            track_classes[tid].append(cls)
-            state = track_states[tid]
+    try:
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                cancelled = True
+                break
+            t0 = time.perf_counter()
+            ret, frame = vid.read()
+            if not ret: break
+            job_progress.add("decode", time.perf_counter() - t0)
             
-            # Proteção: Pega ponto anterior ou usa o atual se não existir
-            prev_point = state.get('last_point', ref_point)
-
-            # Só processa lógica se houve movimento
-            if prev_point != ref_point:
-
-                # -----------------------------------------------------------
-                # 1. LÓGICA PASSANTES (Qualquer Sentido)
-                # -----------------------------------------------------------
-                crossed_pass = False
-                for i in range(len(line_pass) - 1):
-                    # Verifica interseção vetorial (independente de lado)
-                    if geometry.segments_intersect(prev_point, ref_point, line_pass[i], line_pass[i+1]):
-                        crossed_pass = True
-                        break
-                
-                if crossed_pass:
-                    # Se era neutro, vira passante
-                    if state['status'] == 'neutral':
-                        state['status'] = 'passerby'
-                        count_passerby += 1
-                        # Feedback Visual Amarelo
-                        cv2.rectangle(annotated, (int(bbox[0]), int(bbox[1])), (int(bbox[2]), int(bbox[3])), (0, 255, 255), 4)
-
-                # -----------------------------------------------------------
-                # 2. LÓGICA ENTRANTES (Sentido Obrigatório OUT -> IN)
-                # -----------------------------------------------------------
-                for i in range(len(line_ent) - 1):
-                    p_start = line_ent[i]
-                    p_end = line_ent[i+1]
-                    
-                    # Verifica se cruzou fisicamente a linha
-                    if geometry.segments_intersect(prev_point, ref_point, p_start, p_end):
-                        
-                        # Verifica Direção: Deve vir do lado de FORA
-                        # Se in_side='right', o lado de fora é 'left'
-                        side_prev = geometry.get_side_of_segment(prev_point, p_start, p_end)
-                        required_prev_side = 'left' if in_side == 'right' else 'right'
-
-                        if side_prev == required_prev_side:
-                            # Caso 1: Era Neutro -> Virou Entrante
-                            if state['status'] == 'neutral':
-                                state['status'] = 'entrant'
-                                count_entrant += 1
-                                cv2.circle(annotated, ref_point, 15, (0, 255, 0), -1)
-                                
-                            # Caso 2: Era Passante -> Virou Entrante (CORREÇÃO DE CONTAGEM)
-                            elif state['status'] == 'passerby':
-                                state['status'] = 'entrant'
-                                count_passerby -= 1 # Remove do passante
-                                count_entrant += 1  # Adiciona no entrante
-                                cv2.circle(annotated, ref_point, 15, (0, 255, 0), -1)
-                                cv2.putText(annotated, "ENTROU!", (int(bbox[0]), int(bbox[1]-30)), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0,255,0), 2)
-                            
-                            break # Já contou entrada, sai do loop de segmentos
-
-            # Atualiza ponto anterior
-            state['last_point'] = ref_point
-        
-        # Desenha placar no vídeo (Sem "Na Loja")
-        cv2.putText(annotated, f"Entrantes: {count_entrant}", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 255, 0), 3)
-        cv2.putText(annotated, f"Passantes: {count_passerby}", (50, 100), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 255, 255), 3)
-        
-        out.write(annotated)
-        
-        ret_enc, buf = cv2.imencode('.jpg', annotated)
-        if ret_enc: await frame_queue.put(buf.tobytes())
-        
-        curr_frame += 1
-        if curr_frame % 15 == 0 and total > 0: await manager.send_progress(client_id, (curr_frame/total)*100)
-
-    vid.release(); out.release()
-    await frame_queue.put(None)
-
-    final_entrantes = {"Person": 0}
-    final_passantes = {"Person": 0}
-    
-    for tid, info in track_states.items():
-        status_final = info['status']
-        if status_final == 'neutral': continue
-        
-        # Como só tem 1 classe, não precisamos de lógica de votação complexa
-        # Mas mantemos a estrutura caso volte a usar multiclasse no futuro
-        c_list = track_classes.get(tid, [])
-        if not c_list: 
-            g = "Person" # Fallback
-        else:
-            # Pega a classe mais comum (será sempre 0="Person" neste caso)
-            common = Counter(c_list).most_common(1)[0][0]
-            g = config.CLASS_NAMES.get(common, "Person")
-        
-        if status_final == 'entrant':
-            # Se a chave não existir (ex: ruído), usa fallback ou ignora
-            if g in final_entrantes: 
-                final_entrantes[g] += 1
-            else:
-                final_entrantes["Person"] += 1 # Garante contagem
-                
-        elif status_final == 'passerby':
-            if g in final_passantes: 
-                final_passantes[g] += 1
+            if merged is not None:
+                tracks = merged.at(curr_frame)
             else:
-                final_passantes["Person"] += 1
-
-    # Calcula totais
-    final_entrantes['Total'] = sum(v for k, v in final_entrantes.items() if k != 'Total')
-    final_passantes['Total'] = sum(v for k, v in final_passantes.items() if k != 'Total')
-    
-    total_geral = {
-        "Person": final_entrantes.get("Person", 0) + final_passantes.get("Person", 0),
-        "Total": final_entrantes['Total'] + final_passantes['Total']
-    }
+                # Jobs offline cedem a inferência para as câmeras ao vivo quando há disputa
+                async with jobs.gate.slot(jobs.PRIORITY_UPLOAD):
+                    tracks = await asyncio.to_thread(processor.process_frame, frame)
+                job_progress.add_timings(processor.last_timings)
+                for t in tracks:
+                    t["track_id"] = remap(t["track_id"])
+            t0 = time.perf_counter()
+            if tracks:
+                max_track_id = max(max_track_id, max(t["track_id"] for t in tracks))
+            recent.append((curr_frame, [(t["track_id"], t["bbox"]) for t in tracks]))
+            ts = curr_frame / fps if fps else None
+            events = counter.update(tracks, ts=ts, frame_idx=curr_frame)
+            event_log.write(events)
+            if tracks:
+                tracks_log.write([render.trajectory_record(curr_frame, ts, tracks)])
+            t1 = time.perf_counter()
+            job_progress.add("count", t1 - t0)
+
+            # Linhas e caixas desenhados só depois da inferência: a contagem não depende do modo de renderização.
+            # Sem vídeo de saída, só desenha quando o preview tem espectador e está na hora de um frame novo
+            want_preview = draw and preview_channel.wants_frame()
+            if out is not None or want_preview:
+                annotated = render.annotate(frame, processor, tracks, events, counts, line_ent, line_pass, in_side)
+                t2 = time.perf_counter()
+                job_progress.add("render", t2 - t1)
+                if out is not None:
+                    await out.awrite(annotated) # Só espera se o encoder estiver atrasado (backpressure)
+                    part_frames += 1
+                if want_preview:
+                    await preview_channel.publish(annotated)
+                job_progress.add("encode", time.perf_counter() - t2)
+            
+            job_progress.frame_done(curr_frame + 1, len(tracks))
+            curr_frame += 1
+            if total > 0:
+                await report_progress(progress_base + (curr_frame/total) * progress_scale)
+
+            # Checkpoint: fecha o segmento de saída atual e grava o estado para retomar deste frame
+            if time.monotonic() - last_ckpt >= config.JOB_CHECKPOINT_S:
+                if out is not None:
+                    await asyncio.to_thread(out.release)
+                    part_idx += 1
+                tail = {}
+                for fr, boxes in recent:
+                    for tid, box in boxes:
+                        tail.setdefault(str(tid), {})[str(fr)] = box
+                await asyncio.to_thread(ckpt.save, dict(counter.state(),
+                    frame=curr_frame, parts=part_idx, events_offset=event_log.tell(), tracks_offset=tracks_log.tell(),
+                    tail=tail, max_track_id=max_track_id, chunked=merged is not None))
+                out = open_part(part_idx)
+                part_frames = 0
+                last_ckpt = time.monotonic()
+        if not cancelled and out is not None:
+            # Espera o encoder esvaziar a fila e fechar o último segmento
+            await asyncio.to_thread(out.release)
+            print(f"🎞️ Encoder de {video_id}: {out.stats()}")
+    except Exception:
+        event_log.discard(); tracks_log.discard(); ckpt.clear()
+        raise
+    finally:
+        # CancelledError (servidor desligando) mantém o checkpoint para a retomada; o segmento em aberto é refeito
+        vid.release()
+        if out is not None: out.abort()
+
+    print(f"📺 Preview de {video_id}: {preview_channel.stats()}")
+    await preview_channel.close()
+    if cancelled:
+        event_log.discard(); tracks_log.discard(); ckpt.clear()
+        raise jobs.JobCancelled()
+    event_log.close(); tracks_log.close()
+    await report_progress(100.0, stage="finalizing", force=True)
+    if render_mode == "full":
+        # Segmento aberto no último checkpoint pode ter ficado vazio
+        await asyncio.to_thread(ckpt.concat, ckpt.parts({"parts": part_idx + (1 if part_frames else 0)}), out_path)
+    else:
+        out_path = None
+    ckpt.clear()
 
     # JSON Final Simplificado (Sem métricas de loja/ocupação)
-    final_counts = {
-        "total_geral": total_geral, 
-        "entrantes": final_entrantes, 
-        "passantes": final_passantes
-    }
-    
-    # Gera Relatório
-    report_path = os.path.join(config.REPORTS_DIR, f"{video_id}_report.xlsx")
-    pd.DataFrame(final_counts).T.to_excel(report_path)
+    final_counts = counter.results()
     
-    video_url = f"/static/output_videos/{video_id}_processed.mp4"
-    report_url = f"/static/reports/{video_id}_report.xlsx"
+    # Gera Relatório (em thread: streaming do log de eventos, fora do event loop)
+    # (lotes pulam: o endpoint de relatório gera sob demanda)
+    report_url = f"/videos/{video_id}/report?format=xlsx"
+    if report:
+        try:
+            await asyncio.to_thread(reports.generate_report, video_id, "xlsx", final_counts)
+        except Exception as e:
+            print(f"⚠️ Falha ao gerar relatório de {video_id}: {e}")
     
-    crud.update_video_after_processing(db, video_id, out_path, report_url, final_counts, "done")
-    await manager.send_final_results(client_id, {"counts": final_counts, "report_url": report_url})
+    db_writer.writer.submit(crud.update_video_after_processing, video_id, out_path, report_url, final_counts, "done", key=("video", video_id))
+
+    # Cache por (conteúdo, linhas, tracker, modelos): reenviar a mesma combinação não reprocessa
+    # (só resultados completos, com vídeo de saída, servem para qualquer modo de renderização)
+    if config.RESULT_CACHE_ENABLED and video.content_hash and out_path:
+        cache_key = await asyncio.to_thread(result_cache.cache_key, video.content_hash, cfg_hash)
+        db_writer.writer.submit(crud.save_result_cache, cache_key, video.content_hash, cfg_hash, result_cache.tracker_version(),
+                                result_cache.model_version(), video_id, out_path, events_file, final_counts, key=("result_cache", cache_key))
+    # Estimativas rápidas desta combinação ganham a contagem real (calibração da faixa de confiança)
+    if video.content_hash:
+        db_writer.writer.submit(crud.calibrate_quick_estimates, video.content_hash, cfg_hash, final_counts, key=("quick_calibration", video_id))
+    await manager.send_final_results(video_id, {"counts": final_counts, "report_url": report_url}, client_id)
+
+async def run_job(job: models.Job, processor, cancel_event: asyncio.Event):
+    """Handler da fila de jobs: processa o upload e mantém o status do vídeo coerente com o do job."""
+    p = job.params or {}
+    try:
+        await run_video_processing(job.video_id, p["entrant_line_points"], p["passerby_line_points"], p["client_id"],
+                                   p["frame_dimensions"], p["in_side"], processor=processor, cancel_event=cancel_event, job_id=job.id,
+                                   mode=p.get("mode"), render_mode=p.get("render", "full"), report=p.get("report", True))
+    except jobs.JobCancelled:
+        db_writer.writer.submit(crud.update_video_status, job.video_id, "cancelled", key=("video", job.video_id))
+        raise
+    except Exception:
+        db_writer.writer.submit(crud.update_video_status, job.video_id, "failed", key=("video", job.video_id))
+        raise
+    finally:
+        await _close_stream_entry(job.video_id)
+        # Falha/cancelamento não passam por send_final_results
+        manager.unwatch(job.video_id)
 
 @app.get("/devices/{device_id}/monitor_stream")
 async def monitor_stream(device_id: int):
@@ -431,58 +433,504 @@ async def monitor_stream(device_id: int):
     return StreamingResponse(frame_generator(), media_type="multipart/x-mixed-replace; boundary=frame")
     
 @app.post("/upload-video/")
-async def upload_video(video_file: UploadFile = File(...), db: Session = Depends(get_db)):
+async def upload_video(video_file: UploadFile = File(...), db: AsyncSession = Depends(get_async_db)):
     vid_id = str(uuid.uuid4())
     v_path = os.path.join(config.UPLOAD_DIR, f"{vid_id}.mp4")
+    # Grava em blocos calculando o SHA-256 (fora do event loop)
+    content_hash, size = await asyncio.to_thread(result_cache.store_upload, video_file.file, v_path)
+    return await _register_upload(db, vid_id, v_path, content_hash, size)
+
+async def _register_upload(db: AsyncSession, vid_id: str, v_path: str, content_hash: str, size: int):
+    """Deduplica pelo hash, extrai o primeiro frame e cria o vídeo (uploads avulsos e lotes)."""
     f_path = os.path.join(config.FRAMES_DIR, f"{vid_id}_frame.jpg")
-    with open(v_path, "wb") as b: shutil.copyfileobj(video_file.file, b)
-    cap = cv2.VideoCapture(v_path); ret, frame = cap.read(); cap.release()
-    if ret: cv2.imwrite(f_path, frame)
+    # Conteúdo já enviado antes: vira hardlink do mesmo arquivo (e do mesmo primeiro frame)
+    previous = await crud_async.find_video_by_hash(db, content_hash)
+    deduped = bool(previous) and await asyncio.to_thread(result_cache.dedupe_upload, v_path, previous.original_video_path)
+    def _first_frame():
+        if deduped and previous.first_frame_path and os.path.exists(previous.first_frame_path):
+            result_cache.link_or_copy(previous.first_frame_path, f_path)
+            return
+        cap = cv2.VideoCapture(v_path); ret, frame = cap.read(); cap.release()
+        if ret: cv2.imwrite(f_path, frame)
+    await asyncio.to_thread(_first_frame)
+    if deduped:
+        print(f"♻️ Upload {vid_id}: conteúdo idêntico a {previous.id} ({size / 1024**2:.1f} MB deduplicados)")
+
     # Passamos 0 como user_id (ignorado pelo CRUD no modelo novo)
-    crud.create_user_video(db, 0, vid_id, v_path, f_path)
-    return {"video_id": vid_id, "first_frame_url": f"/static/frames/{vid_id}_frame.jpg"}
+    await crud_async.create_user_video(db, 0, vid_id, v_path, f_path, content_hash=content_hash)
+    return {"video_id": vid_id, "first_frame_url": f"/static/frames/{vid_id}_frame.jpg", "content_hash": content_hash, "deduplicated": deduped}
 
 @app.get("/video-stream/{video_id}")
 async def video_stream(video_id: str):
     async def gen(vid_id):
         job = processing_jobs.get(vid_id)
         if not job: return
-        await job["ready_event"].wait()
-        while True:
-            frame = await job["queue"].get()
-            if frame is None: break
+        # Frames reduzidos e limitados a PREVIEW_FPS; o job só codifica enquanto há espectador
+        async for frame in job["preview"].frames():
             yield (b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-        del processing_jobs[vid_id]
     return StreamingResponse(gen(video_id), media_type='multipart/x-mixed-replace; boundary=frame')
 
 @app.websocket("/ws/progress/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str):
+    """
+    Progresso dos jobs. O cliente que pediu o processamento já acompanha o vídeo; outros podem acompanhar
+    qualquer job com ?watch=<video_id> (repetível) ou enviando {"watch": "<video_id>"}.
+    """
     await manager.connect(websocket, client_id)
+    for video_id in websocket.query_params.getlist("watch"):
+        manager.watch(video_id, client_id)
     try:
-        while True: await websocket.receive_text()
+        while True:
+            text = await websocket.receive_text()
+            try: msg = json.loads(text)
+            except ValueError: continue
+            if isinstance(msg, dict) and msg.get("watch"):
+                manager.watch(str(msg["watch"]), client_id)
     except WebSocketDisconnect: manager.disconnect(client_id)
 
+def _source_available(video: models.Video):
+    """Original ainda em disco (a retenção zera original_video_path ao apagar o upload)."""
+    return bool(video.original_video_path) and os.path.exists(video.original_video_path)
+
+SOURCE_EVICTED = "Vídeo original removido pela retenção de disco; envie o arquivo novamente"
+
+def _probe_video(path):
+    """(frames, largura, altura) do arquivo."""
+    cap = cv2.VideoCapture(path)
+    try: return int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or None, int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    finally: cap.release()
+
+async def _cached_result(db: AsyncSession, video: models.Video, req: ProcessRequest, fw: int, fh: int):
+    """Resultado em cache para o vídeo + linhas do pedido: reaproveita os arquivos e finaliza o vídeo na hora."""
+    if not video.content_hash:
+        # Uploads anteriores ao cache: calcula o hash uma vez
+        video.content_hash = await asyncio.to_thread(result_cache.file_sha256, video.original_video_path)
+        await crud_async.set_video_hash(db, video.id, video.content_hash)
+    dims = req.frame_dimensions.dict()
+    cfg_hash = reports.config_hash(_scale_lines(req.entrant_line_points, dims, fw, fh), _scale_lines(req.passerby_line_points, dims, fw, fh), req.in_side)
+    key = await asyncio.to_thread(result_cache.cache_key, video.content_hash, cfg_hash)
+    entry = await crud_async.get_result_cache(db, key)
+    if not entry: return None
+    out_path = await asyncio.to_thread(result_cache.restore, entry, video.id)
+    if not out_path: return None
+
+    report_url = f"/videos/{video.id}/report?format=xlsx"
+    await crud_async.update_video_after_processing(db, video.id, out_path, report_url, entry.results, "done")
+    await crud_async.record_cache_hit(db, key)
+    print(f"⚡ {video.id}: resultado em cache (mesmo conteúdo de {entry.source_video_id})")
+    return {"cached": True, "job_id": None, "results": entry.results, "report_url": report_url, "stream_url": None,
+            "download_url": f"/static/output_videos/{video.id}_processed.mp4"}
+
+async def _quick_estimate(db: AsyncSession, video: models.Video, req: ProcessRequest, request: Request):
+    """Contagem aproximada por amostragem, na hora (sem job, sem vídeo de saída, sem alterar o status/resultados do vídeo)."""
+    if not video.content_hash:
+        video.content_hash = await asyncio.to_thread(result_cache.file_sha256, video.original_video_path)
+        await crud_async.set_video_hash(db, video.id, video.content_hash)
+    _, fw, fh = await asyncio.to_thread(_probe_video, video.original_video_path)
+    dims = req.frame_dimensions.dict()
+    line_ent = _scale_lines(req.entrant_line_points, dims, fw, fh); line_pass = _scale_lines(req.passerby_line_points, dims, fw, fh)
+    cfg_hash = reports.config_hash(line_ent, line_pass, req.in_side)
+
+    # Tracker próprio: YOLO/ReID compartilhados com os jobs (criar o tracker carrega pesos: fora do event loop)
+    processor = await asyncio.to_thread(ml_models["processor"].fork)
+    try:
+        est = await quick_estimate.estimate(processor, video.original_video_path, line_ent, line_pass, req.in_side,
+                                            sample_fps=req.quick_fps, imgsz=req.quick_imgsz, is_disconnected=request.is_disconnected)
+    except quick_estimate.EstimateAborted as e:
+        print(f"⏹️ Estimativa rápida de {video.id} interrompida: {e}")
+        raise HTTPException(504, f"Estimativa interrompida ({e}); use o processamento completo")
+    sample_fps = req.quick_fps or config.QUICK_SAMPLE_FPS
+    calibration = await crud_async.get_quick_calibration(db, sample_fps, est["imgsz"])
+    band = quick_estimate.band(est["results"], calibration)
+
+    # Combinação já processada por completo (cache): a estimativa entra calibrada direto
+    actual = None
+    if config.RESULT_CACHE_ENABLED:
+        key = await asyncio.to_thread(result_cache.cache_key, video.content_hash, cfg_hash)
+        entry = await crud_async.get_result_cache(db, key)
+        actual = entry.results if entry else None
+    await crud_async.save_quick_estimate(db, video.id, video.content_hash, cfg_hash, sample_fps, est["imgsz"],
+                                         est["frames_sampled"], est["elapsed_s"], est["results"], actual)
+    print(f"🔎 Estimativa rápida de {video.id}: {est['frames_sampled']} frames (1 a cada {est['stride']}, seek={est['seek']}) em {est['elapsed_s']}s")
+    return {"estimate": True, "job_id": None, "results": est["results"], **band,
+            "sample_fps": est["sample_fps"], "imgsz": est["imgsz"], "frames_sampled": est["frames_sampled"],
+            "frames_total": est["frames_total"], "elapsed_s": est["elapsed_s"]}
+
 @app.post("/process-video/")
-async def process_video(req: ProcessRequest, bg: BackgroundTasks, db: Session = Depends(get_db)):
+async def process_video(req: ProcessRequest, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Enfileira o processamento do vídeo (fila persistente). Retorna o job com posição e ETA.
+    mode="quick": estimativa rápida por amostragem, respondida na hora com faixa de confiança."""
+    if not ml_models.get("processor"): raise HTTPException(503, "VideoProcessor indisponível")
+    video = await crud_async.get_video(db, req.video_id)
+    if not video: raise HTTPException(404, "Vídeo não encontrado")
+    if not _source_available(video): raise HTTPException(410, SOURCE_EVICTED)
+    if req.mode == "quick":
+        return await _quick_estimate(db, video, req, request)
     if req.video_id in processing_jobs: raise HTTPException(409, "Já processando")
-    processing_jobs[req.video_id] = {"queue": asyncio.Queue(), "ready_event": asyncio.Event()}
-    bg.add_task(run_video_processing, req.video_id, req.entrant_line_points, req.passerby_line_points, req.client_id, req.frame_dimensions.dict(), req.in_side, next(get_db()))
-    return {"stream_url": f"/video-stream/{req.video_id}", "download_url": f"/static/output_videos/{req.video_id}_processed.mp4"}
+    # Reserva o vídeo antes do primeiro await: duas requisições simultâneas não criam dois jobs
+    entry = processing_jobs[req.video_id] = _new_stream_entry()
+    try:
+        if await crud_async.get_active_job_for_video(db, req.video_id):
+            raise HTTPException(409, "Já processando")
+
+        frames_total, fw, fh = await asyncio.to_thread(_probe_video, video.original_video_path)
+        cached = await _cached_result(db, video, req, fw, fh) if config.RESULT_CACHE_ENABLED and req.use_cache else None
+        if cached:
+            if processing_jobs.get(req.video_id) is entry: processing_jobs.pop(req.video_id)
+            return cached
+
+        job = await crud_async.create_job(db, req.video_id, req.dict(exclude={"video_id"}), priority=jobs.PRIORITY_UPLOAD, frames_total=frames_total)
+    except BaseException:
+        if processing_jobs.get(req.video_id) is entry: processing_jobs.pop(req.video_id)
+        raise
+    db_writer.writer.submit(crud.update_video_status, req.video_id, "queued", key=("video", req.video_id))
+    jobs.queue.notify()
+
+    queue_info = await jobs.queue.position(job.id) or {}
+    return {"job_id": job.id, **queue_info,
+            "stream_url": f"/video-stream/{req.video_id}" if req.render != "none" else None,
+            "download_url": f"/static/output_videos/{req.video_id}_processed.mp4" if req.render == "full" else None,
+            "trajectories_url": f"/videos/{req.video_id}/trajectories"}
+
+async def _job_response(job: models.Job):
+    data = schemas.JobResponse.model_validate(job)
+    if job.status in crud.ACTIVE_JOB_STATUSES:
+        data = data.model_copy(update=await jobs.queue.position(job.id) or {})
+    return data
+
+@app.get("/jobs", response_model=List[schemas.JobResponse])
+async def list_jobs(status: Optional[List[str]] = Query(None), limit: int = Query(100, ge=1, le=1000), db: AsyncSession = Depends(get_async_db)):
+    """Jobs na ordem de execução (prioridade, chegada). Ex.: ?status=queued&status=running"""
+    rows = await crud_async.list_jobs(db, status, limit)
+    return [await _job_response(j) for j in rows]
+
+@app.get("/jobs/{job_id}", response_model=schemas.JobResponse)
+async def get_job(job_id: int, db: AsyncSession = Depends(get_async_db)):
+    job = await crud_async.get_job(db, job_id)
+    if not job: raise HTTPException(404, "Job não encontrado")
+    return await _job_response(job)
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Cancela um job na fila (imediato) ou em execução (interrompe no próximo frame)."""
+    job = await crud_async.get_job(db, job_id)
+    if not job: raise HTTPException(404, "Job não encontrado")
+    result = await jobs.queue.cancel(job_id)
+    if result is None: raise HTTPException(409, f"Job já finalizado ({job.status})")
+    if result == "cancelled":
+        db_writer.writer.submit(crud.update_video_status, job.video_id, "cancelled", key=("video", job.video_id))
+        await _close_stream_entry(job.video_id)
+        manager.unwatch(job.video_id)
+        await _on_job_finished(job, "cancelled")
+    return {"job_id": job_id, "status": result}
+
+# --- LOTES ---
+class LineConfig(BaseModel):
+    entrant_line_points: List[Dict[str, float]]; passerby_line_points: List[Dict[str, float]]
+    frame_dimensions: Optional[FrameDimensions] = None # None = pontos já em pixels do vídeo
+    in_side: str = "right"
+
+class BatchItem(BaseModel):
+    video_id: Optional[str] = None # Vídeo já enviado por /upload-video/
+    path: Optional[str] = None # Ou arquivo relativo a BATCH_IMPORT_DIR
+    lines: Optional[LineConfig] = None # Sobrescreve a configuração padrão do lote
+
+class BatchRequest(BaseModel):
+    name: Optional[str] = None
+    client_id: Optional[str] = None # WebSocket que acompanha o lote (progresso de cada vídeo + status dos itens)
+    lines: Optional[LineConfig] = None # Configuração padrão
+    items: List[BatchItem] = []
+    folder: Optional[str] = None # Subpasta de BATCH_IMPORT_DIR: todos os vídeos dela entram no lote
+    render: Literal["none", "preview", "full"] = "none" # Lotes normalmente só precisam dos números
+    mode: Optional[Literal["sequential", "chunked"]] = None
+    use_cache: bool = True
+
+def _batch_channel(batch_id: str): return f"batch:{batch_id}"
+
+async def _import_batch_files(db: AsyncSession, srcs: list):
+    """Arquivos da pasta de importação -> vídeos (hash calculado em paralelo). Retorna os video_ids."""
+    vid_ids = [str(uuid.uuid4()) for _ in srcs]
+    v_paths = [os.path.join(config.UPLOAD_DIR, f"{vid}.mp4") for vid in vid_ids]
+    hashes = await asyncio.gather(*(asyncio.to_thread(batch.import_file, src, dst) for src, dst in zip(srcs, v_paths)))
+    for vid, v_path, content_hash in zip(vid_ids, v_paths, hashes):
+        await _register_upload(db, vid, v_path, content_hash, os.path.getsize(v_path))
+    return vid_ids
+
+async def _create_batch(db: AsyncSession, req: BatchRequest, sources: list):
+    """
+    sources: [(video_id, nome de origem, LineConfig ou None)]. Sonda os vídeos em paralelo, resolve o cache
+    de cada item e cria o lote com todos os jobs numa transação (um notify para a fila).
+    """
+    if not sources: raise HTTPException(400, "Lote vazio")
+    if len(sources) > config.BATCH_MAX_ITEMS: raise HTTPException(400, f"Máximo de {config.BATCH_MAX_ITEMS} vídeos por lote")
+    if any(lines is None for _, _, lines in sources) and req.lines is None:
+        raise HTTPException(400, "Configuração de linhas ausente (padrão do lote ou por vídeo)")
+
+    batch_id = str(uuid.uuid4())
+    videos = [await crud_async.get_video(db, vid) for vid, _, _ in sources]
+    missing = [vid for (vid, _, _), v in zip(sources, videos) if v is None]
+    if missing: raise HTTPException(404, f"Vídeos não encontrados: {', '.join(missing[:10])}")
+    gone = [v.id for v in videos if not _source_available(v)]
+    if gone: raise HTTPException(410, f"{SOURCE_EVICTED}: {', '.join(gone[:10])}")
+    probes = await asyncio.gather(*(asyncio.to_thread(_probe_video, v.original_video_path) for v in videos))
+
+    items, skipped = [], []
+    for (vid, source_name, lines), video, (frames_total, fw, fh) in zip(sources, videos, probes):
+        if vid in processing_jobs or await crud_async.get_active_job_for_video(db, vid):
+            skipped.append({"video_id": vid, "error": "Já processando"}); continue
+        lines = lines or req.lines
+        preq = ProcessRequest(video_id=vid, client_id=req.client_id or "", entrant_line_points=lines.entrant_line_points,
+                              passerby_line_points=lines.passerby_line_points, in_side=lines.in_side,
+                              frame_dimensions=lines.frame_dimensions or FrameDimensions(width=fw, height=fh),
+                              mode=req.mode, use_cache=req.use_cache, render=req.render)
+        params = dict(preq.dict(exclude={"video_id"}), source_name=source_name, report=False)
+        cached = await _cached_result(db, video, preq, fw, fh) if config.RESULT_CACHE_ENABLED and req.use_cache else None
+        if cached: params["cached"] = True
+        items.append({"video_id": vid, "params": params, "frames_total": frames_total, "status": "done" if cached else "queued"})
+    if not items: raise HTTPException(409, "Todos os vídeos do lote já estão em processamento")
+
+    params = {"render": req.render, "mode": req.mode, "lines": req.lines.dict() if req.lines else None}
+    await crud_async.create_batch(db, batch_id, req.name, params, items, priority=jobs.PRIORITY_BATCH)
+    if req.client_id:
+        manager.watch(_batch_channel(batch_id), req.client_id)
+        for it in items: manager.watch(it["video_id"], req.client_id)
+    for it in items:
+        if it["status"] == "queued":
+            db_writer.writer.submit(crud.update_video_status, it["video_id"], "queued", key=("video", it["video_id"]))
+    jobs.queue.notify()
+    print(f"📦 Lote {batch_id}: {len(items)} vídeos ({sum(1 for it in items if it['status'] == 'done')} do cache)")
+
+    if all(it["status"] == "done" for it in items):
+        await _finish_batch(batch_id)
+    summary = await _batch_summary(db, batch_id)
+    return dict(summary, skipped=skipped)
+
+async def _batch_summary(db: AsyncSession, batch_id: str, with_items: bool = True):
+    b = await crud_async.get_batch(db, batch_id)
+    if not b: return None
+    rows = await crud_async.list_batch_items(db, batch_id)
+    items = [batch.item_summary(job, video) for job, video in rows]
+    remaining = sum((job.frames_total or 0) * (1 - (job.progress or 0) / 100) for job, _ in rows if job.status in crud.ACTIVE_JOB_STATUSES)
+    rate = jobs.queue.fps * jobs.queue.workers
+    data = {
+        "batch_id": b.id, "name": b.name, "status": b.status, "items_total": b.items_total,
+        "progress": round(sum(it["progress"] or 0 for it in items) / len(items), 2) if items else 0.0,
+        "eta_s": round(remaining / rate, 1) if rate and b.status == "running" else None,
+        **batch.combine(items),
+        "created_at": b.created_at, "finished_at": b.finished_at,
+        "report_url": f"/batches/{b.id}/report?format=xlsx",
+    }
+    if with_items: data["items"] = items
+    return data
+
+async def _finish_batch(batch_id: str):
+    """Fecha o lote (uma vez só), gera o relatório combinado e avisa quem acompanha."""
+    async with AsyncSessionLocal() as db:
+        rows = await crud_async.list_batch_items(db, batch_id)
+        items = [batch.item_summary(job, video) for job, video in rows]
+        status = batch.final_status(items)
+        if not await crud_async.finish_batch(db, batch_id, status, batch.combine(items)): return
+    try:
+        await asyncio.to_thread(batch.write_report, batch_id, items, "xlsx")
+    except Exception as e:
+        print(f"⚠️ Falha ao gerar relatório do lote {batch_id}: {e}")
+    print(f"📦 Lote {batch_id} finalizado ({status}): {batch.combine(items)}")
+    await manager.broadcast(_batch_channel(batch_id), {"type": "batch_done", "batch_id": batch_id, "status": status, **batch.combine(items),
+                                                      "report_url": f"/batches/{batch_id}/report?format=xlsx"})
+    manager.unwatch(_batch_channel(batch_id))
+
+async def _on_job_finished(job: models.Job, status: str):
+    """Chamado pela fila ao fim de cada job: status do item para quem acompanha o lote e fechamento do lote."""
+    if not job.batch_id: return
+    await db_writer.writer.flush() # Resultado do vídeo é gravado pelo write-behind
+    async with AsyncSessionLocal() as db:
+        video = await crud_async.get_video(db, job.video_id)
+        active = await crud_async.count_active_batch_jobs(db, job.batch_id)
+    await manager.broadcast(_batch_channel(job.batch_id), {"type": "batch_item", "batch_id": job.batch_id, "video_id": job.video_id,
+                                                           "job_id": job.id, "status": status, "results": video.results if video else None,
+                                                           "remaining": active})
+    if active == 0:
+        await _finish_batch(job.batch_id)
+
+@app.post("/batches")
+async def create_batch(req: BatchRequest, db: AsyncSession = Depends(get_async_db)):
+    """
+    Lote a partir de vídeos já enviados (items[].video_id), de arquivos/pastas do servidor (items[].path, folder)
+    ou ambos. Linhas: req.lines para todos, items[].lines por vídeo.
+    """
+    if not ml_models.get("processor"): raise HTTPException(503, "VideoProcessor indisponível")
+    # (arquivo no servidor, nome de origem, linhas)
+    files = []
+    try:
+        if req.folder:
+            files += [(src, os.path.basename(src), None) for src in await asyncio.to_thread(batch.list_folder, req.folder)]
+        for it in req.items:
+            if it.path:
+                files.append((batch.resolve_file(it.path), it.path, it.lines))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    if len(files) + sum(1 for it in req.items if it.video_id) > config.BATCH_MAX_ITEMS:
+        raise HTTPException(400, f"Máximo de {config.BATCH_MAX_ITEMS} vídeos por lote")
+
+    imported = await _import_batch_files(db, [src for src, _, _ in files])
+    sources = [(vid, name, lines) for vid, (_, name, lines) in zip(imported, files)]
+    sources += [(it.video_id, it.video_id, it.lines) for it in req.items if it.video_id]
+    return await _create_batch(db, req, sources)
+
+@app.post("/batches/upload")
+async def upload_batch(video_files: List[UploadFile] = File(...), config_json: str = Form("{}", alias="config"),
+                       db: AsyncSession = Depends(get_async_db)):
+    """Lote com upload de vários arquivos (multipart). 'config' = BatchRequest em JSON (items[i] = linhas do arquivo i)."""
+    if not ml_models.get("processor"): raise HTTPException(503, "VideoProcessor indisponível")
+    try:
+        req = BatchRequest.model_validate_json(config_json)
+    except ValueError as e:
+        raise HTTPException(422, str(e))
+    sources = []
+    for i, f in enumerate(video_files):
+        vid_id = str(uuid.uuid4())
+        v_path = os.path.join(config.UPLOAD_DIR, f"{vid_id}.mp4")
+        content_hash, size = await asyncio.to_thread(result_cache.store_upload, f.file, v_path)
+        await _register_upload(db, vid_id, v_path, content_hash, size)
+        lines = req.items[i].lines if i < len(req.items) else None
+        sources.append((vid_id, f.filename, lines))
+    return await _create_batch(db, req, sources)
+
+@app.get("/batches/{batch_id}")
+async def get_batch(batch_id: str, items: bool = True, db: AsyncSession = Depends(get_async_db)):
+    """Status do lote: progresso, ETA, totais combinados e status de cada vídeo."""
+    summary = await _batch_summary(db, batch_id, with_items=items)
+    if not summary: raise HTTPException(404, "Lote não encontrado")
+    return summary
+
+@app.post("/batches/{batch_id}/cancel")
+async def cancel_batch(batch_id: str, db: AsyncSession = Depends(get_async_db)):
+    """Cancela os vídeos ainda na fila e interrompe os que estão rodando."""
+    b = await crud_async.get_batch(db, batch_id)
+    if not b: raise HTTPException(404, "Lote não encontrado")
+    if b.status != "running": raise HTTPException(409, f"Lote já finalizado ({b.status})")
+    cancelled, running = await crud_async.cancel_batch_jobs(db, batch_id)
+    # Mesmo tratamento do cancelamento avulso: status do vídeo e aviso do item para quem acompanha o lote
+    for job in cancelled:
+        db_writer.writer.submit(crud.update_video_status, job.video_id, "cancelled", key=("video", job.video_id))
+        await _close_stream_entry(job.video_id)
+        manager.unwatch(job.video_id)
+        await manager.broadcast(_batch_channel(batch_id), {"type": "batch_item", "batch_id": batch_id, "video_id": job.video_id,
+                                                           "job_id": job.id, "status": "cancelled", "results": None,
+                                                           "remaining": len(running)})
+    for job_id in running:
+        await jobs.queue.cancel(job_id)
+    if not running:
+        await _finish_batch(batch_id)
+    return {"batch_id": batch_id, "status": "cancelling" if running else "cancelled"}
+
+@app.get("/batches/{batch_id}/report")
+async def download_batch_report(batch_id: str, format: str = Query("xlsx", pattern="^(csv|xlsx)$"), db: AsyncSession = Depends(get_async_db)):
+    """Relatório combinado do lote: uma linha por vídeo (arquivo, status, contagens) e o total."""
+    summary = await _batch_summary(db, batch_id)
+    if not summary: raise HTTPException(404, "Lote não encontrado")
+    path = batch.report_path(batch_id, format)
+    if summary["status"] == "running" or not os.path.exists(path):
+        # Parcial enquanto roda / outro formato: gera na hora
+        path = await asyncio.to_thread(batch.write_report, batch_id, summary["items"], format)
+    return FileResponse(path=path, filename=f"relatorio_lote_{batch_id}.{format}", media_type=batch.REPORT_FORMATS[format])
+
+def _encode_cursor(cursor):
+    if not cursor: return None
+    return base64.urlsafe_b64encode("|".join(cursor).encode()).decode()
+
+def _decode_cursor(token):
+    try:
+        created, _, vid = base64.urlsafe_b64decode(token.encode()).decode().partition("|")
+        return created, vid
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
 
 @app.get("/videos/me/", response_model=List[schemas.VideoResponse])
-async def history(db: Session = Depends(get_db)):
-    # crud.get_user_videos agora retorna todos os vídeos (sem filtro de ID)
-    return [schemas.VideoResponse(id=v.id, status=v.status, created_at=v.created_at, first_frame_url=f"/static/frames/{v.id}_frame.jpg", processed_video_url=f"/static/output_videos/{v.id}_processed.mp4" if v.processed_video_path else None, report_url=f"/static/reports/{v.id}_report.xlsx" if v.report_path else None, results=v.results) for v in crud.get_user_videos(db)]
+async def history(
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    status_filter: Optional[str] = Query(None, alias="status"),
+    session_type: Optional[str] = Query(None, alias="type"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    include_results: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Histórico paginado (cursor por created_at). A listagem é uma projeção leve:
+    o JSON de results só é carregado com include_results=true.
+    Suporta If-None-Match: polling repetido sem mudanças recebe 304.
+    """
+    # ETag pela versão do filtro (max(updated_at) + count) e pelos parâmetros da página: o 304 sai sem a consulta da página
+    updated, total = await crud_async.history_version(db, status_filter, session_type, since, until)
+    digest = hashlib.md5(json.dumps([str(updated), total, limit, cursor, status_filter, session_type,
+                                     str(since), str(until), include_results]).encode()).hexdigest()
+    etag = f'W/"{digest}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    rows, next_cursor = await crud_async.list_videos(
+        db, limit, _decode_cursor(cursor) if cursor else None, status_filter, session_type, since, until, include_results
+    )
+    items = [schemas.VideoResponse(
+        id=v.id, status=v.status, created_at=v.created_at,
+        first_frame_url=f"/static/frames/{v.id}_frame.jpg",
+        processed_video_url=f"/static/output_videos/{v.id}_processed.mp4" if v.processed_video_path else None,
+        report_url=v.report_path,
+        results=v.results if include_results else None,
+    ) for v in rows]
+
+    next_token = _encode_cursor(next_cursor)
+    response.headers["ETag"] = etag
+    if next_token:
+        response.headers["X-Next-Cursor"] = next_token
+    return items
 
 @app.delete("/videos/{video_id}", status_code=204)
-async def delete_vid(video_id: str, db: Session = Depends(get_db)):
-    v = crud.get_video(db, video_id)
+async def delete_vid(video_id: str, db: AsyncSession = Depends(get_async_db)):
+    v = await crud_async.get_video(db, video_id)
     if not v: raise HTTPException(404)
     for p in [v.original_video_path, v.first_frame_path, v.processed_video_path, os.path.join(config.REPORTS_DIR, f"{video_id}_report.xlsx")]:
         if p and os.path.exists(p): os.remove(p)
-    crud.delete_video_by_id(db, v)
+    reports.delete_reports(video_id)
+    await crud_async.delete_video_by_id(db, v)
     return Response(status_code=204)
 
+@app.get("/videos/{video_id}/report")
+async def download_report(video_id: str, format: str = Query("xlsx", pattern="^(csv|xlsx|parquet)$"), db: AsyncSession = Depends(get_async_db)):
+    """
+    Relatório de contagem (totais + quebras por minuto/hora por linha e sentido).
+    Gerado em thread a partir do log de eventos e reaproveitado do cache nas próximas chamadas.
+    """
+    v = await crud_async.get_video(db, video_id)
+    if not v: raise HTTPException(404, detail="Vídeo não encontrado")
+
+    try:
+        path = await asyncio.to_thread(reports.generate_report, video_id, format, v.results)
+    except ValueError as e:
+        raise HTTPException(400, detail=str(e))
+
+    if path is None:
+        # Vídeos processados antes do log de eventos: só existe o xlsx antigo de totais
+        legacy = os.path.join(config.REPORTS_DIR, f"{video_id}_report.xlsx")
+        if format != "xlsx" or not os.path.exists(legacy):
+            raise HTTPException(404, detail="Relatório não disponível para este vídeo")
+        path = legacy
+
+    return FileResponse(path=path, filename=f"relatorio_{video_id}.{format}", media_type=reports.FORMATS[format])
+
+@app.get("/videos/{video_id}/trajectories")
+async def download_trajectories(video_id: str):
+    """Trajetórias do último processamento (JSONL: por frame, [track_id, x, y] do centro de cada caixa)."""
+    _, cfg_hash = reports.latest_events(video_id)
+    path = reports.tracks_path(video_id, cfg_hash) if cfg_hash else None
+    if not path or not os.path.exists(path):
+        raise HTTPException(404, detail="Trajetórias não disponíveis para este vídeo")
+    return FileResponse(path=path, filename=f"trajetorias_{video_id}.jsonl", media_type="application/x-ndjson")
+
 @app.get("/download-video/{video_id}")
 async def download_video_endpoint(video_id: str):
     """Rota dedicada para forçar o download do vídeo processado"""
@@ -553,7 +1001,7 @@ async def scan_network():
     return found_ips
 
 @app.post("/devices/autodiscover")
-async def autodiscover_camera(dev: schemas.DeviceConnect, db: Session = Depends(get_db)):
+async def autodiscover_camera(dev: schemas.DeviceConnect, db: AsyncSession = Depends(get_async_db)):
     """
     Testa URLs RTSP. Se detectar Intelbras/Dahua, escaneia múltiplos canais (DVR/NVR).
     """
@@ -606,12 +1054,9 @@ async def autodiscover_camera(dev: schemas.DeviceConnect, db: Session = Depends(
     name_found, template_found, proto_found, is_multi = working_config
 
     # 4. Função auxiliar para salvar no banco
-    def save_device(channel_num, url_rtsp):
+    async def save_device(channel_num, url_rtsp):
         # Verifica duplicidade por IP e URL
-        existing = db.query(models.Device).filter(
-            models.Device.ip_address == dev.ip_address,
-            models.Device.rtsp_url == url_rtsp
-        ).first()
+        existing = await crud_async.get_device_by_url(db, dev.ip_address, url_rtsp)
 
         dev_name = f"Cam {dev.ip_address.split('.')[-1]}"
         if is_multi:
@@ -623,7 +1068,7 @@ async def autodiscover_camera(dev: schemas.DeviceConnect, db: Session = Depends(
             existing.name = dev_name
             existing.is_configured = True
             existing.port = int(dev.port)
-            db.commit()
+            await db.commit()
             saved_devices.append(existing)
         else:
             new_dev = models.Device(
@@ -638,12 +1083,12 @@ async def autodiscover_camera(dev: schemas.DeviceConnect, db: Session = Depends(
                 client_id=f"cam_{str(uuid.uuid4())[:8]}"
             )
             db.add(new_dev)
-            db.commit()
+            await db.commit()
             saved_devices.append(new_dev)
 
     # 5. Salva o primeiro canal encontrado (Canal 1)
     url_ch1 = f"rtsp://{safe_user}:{safe_pass}@{dev.ip_address}:{dev.port}{template_found.format(ch=1)}"
-    save_device(1, url_ch1)
+    await save_device(1, url_ch1)
 
     # 6. Se for Multi-Channel (Intelbras), escaneia canais 2-16
     if is_multi:
@@ -667,35 +1112,33 @@ async def autodiscover_camera(dev: schemas.DeviceConnect, db: Session = Depends(
             if res:
                 ch_num, url = res
                 print(f"   ✅ Canal {ch_num} Ativo! Salvando...")
-                save_device(ch_num, url)
+                await save_device(ch_num, url)
 
     # Retorna o primeiro dispositivo (para manter compatibilidade com frontend) ou lista
     # Como o frontend não lê o retorno, retornar o primeiro objeto é seguro.
     return saved_devices[0]
 
 @app.get("/devices/", response_model=List[schemas.DeviceResponse])
-def read_devices(db: Session = Depends(get_db)):
-    return db.query(models.Device).all()
+async def read_devices(db: AsyncSession = Depends(get_async_db)):
+    return await crud_async.get_devices(db)
 
 @app.delete("/devices/{device_id}")
-def delete_device(device_id: int, db: Session = Depends(get_db)):
-    dev = db.query(models.Device).filter(models.Device.id == device_id).first()
-    if dev:
-        db.delete(dev)
-        db.commit()
+async def delete_device(device_id: int, db: AsyncSession = Depends(get_async_db)):
+    await crud_async.delete_device(db, device_id)
+    live_manager.notify_device_changed(device_id)
     return {"ok": True}
 
 @app.put("/devices/{device_id}/config")
-async def update_device_configuration(device_id: int, config_data: schemas.DeviceUpdate, db: Session = Depends(get_db)):
+async def update_device_configuration(device_id: int, config_data: schemas.DeviceUpdate, db: AsyncSession = Depends(get_async_db)):
     """
     Atualiza configurações avançadas e reinicia a câmera mantendo a contagem.
     """
-    dev = db.query(models.Device).filter(models.Device.id == device_id).first()
+    dev = await crud_async.get_device(db, device_id)
     if not dev:
         raise HTTPException(status_code=404, detail="Dispositivo não encontrado")
     
     # Atualiza configurações no banco
-    crud.update_device_config(db, device_id, config_data, dev.rtsp_url)
+    await crud_async.update_device_config(db, device_id, config_data, dev.rtsp_url)
     
     # Aciona o Hot Reload
     await live_manager.restart_camera(device_id)
@@ -703,65 +1146,87 @@ async def update_device_configuration(device_id: int, config_data: schemas.Devic
     return {"status": "updated", "message": "Configurações aplicadas. A câmera será reiniciada em breve."}
 
 @app.get("/devices/{device_id}/snapshot")
-def get_device_snapshot(device_id: int, db: Session = Depends(get_db)):
+async def get_device_snapshot(device_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Captura 1 frame solicitando diretamente ao Go2RTC (que lida bem com H.265).
     """
-    dev = db.query(models.Device).filter(models.Device.id == device_id).first()
+    dev = await crud_async.get_device(db, device_id)
     if not dev:
         raise HTTPException(status_code=404, detail="Dispositivo não encontrado")
     
-    # URL interna do serviço Go2RTC (dentro da rede Docker)
-    GO2RTC_API = "http://sense_go2rtc:1984/api"
     stream_name = f"camera_{dev.id}"
     
     os.makedirs(config.FRAMES_DIR, exist_ok=True)
-    filename = f"snapshot_{device_id}_{int(time.time())}.jpg"
+    # Um arquivo por câmera (sobrescrito a cada clique); o ?t= na URL evita o cache do navegador
+    filename = f"snapshot_{device_id}.jpg"
     filepath = os.path.join(config.FRAMES_DIR, filename)
     
-    # 1. Garante que o stream está registrado no Go2RTC
-    # (Mesmo que já esteja, o PUT atualiza ou confirma sem erro)
+    # 1. Garante que o stream está registrado no Go2RTC (PUT só na primeira vez ou se o src mudou)
     try:
-        print(f"📡 Registrando stream '{stream_name}' no Go2RTC...")
-        requests.put(f"{GO2RTC_API}/streams", params={"src": dev.rtsp_url, "name": stream_name}, timeout=3)
-    except Exception as e:
+        await go2rtc.client.ensure_stream(stream_name, dev.rtsp_url)
+    except go2rtc.Go2RTCError as e:
         print(f"⚠️ Erro ao registrar stream no Go2RTC: {e}")
         # Segue o fluxo, pois pode já existir
 
-    # 2. Tenta pegar o snapshot (frame.jpeg)
-    # Fazemos algumas tentativas pois se o stream estava parado, demora uns segundos para ter o frame
-    success = False
-    for attempt in range(5):
-        try:
-            print(f"📸 Solicitando frame ao Go2RTC (Tentativa {attempt+1}/5)...")
-            res = requests.get(f"{GO2RTC_API}/frame.jpeg", params={"src": stream_name}, timeout=5)
-            
-            if res.status_code == 200:
-                with open(filepath, "wb") as f:
-                    f.write(res.content)
-                success = True
-                print("✅ Snapshot capturado com sucesso via Go2RTC.")
-                break
-            else:
-                print(f"⏳ Go2RTC ainda não tem frame (Status {res.status_code}). Aguardando...")
-                time.sleep(1.5) # Espera o buffer encher
-        except Exception as e:
-            print(f"❌ Erro na requisição ao Go2RTC: {e}")
-            time.sleep(1)
-
-    if not success:
+    # 2. Tenta pegar o snapshot (frame.jpeg) - as esperas entre tentativas não prendem threads
+    print(f"📸 Solicitando frame ao Go2RTC ({stream_name})...")
+    content = await go2rtc.client.get_frame(stream_name)
+    if content is None:
         raise HTTPException(status_code=500, detail="Não foi possível obter snapshot do Go2RTC (Timeout/Codec)")
 
-    return {"url": f"/static/frames/{filename}"}
+    def _write():
+        tmp = f"{filepath}.part"
+        with open(tmp, "wb") as f:
+            f.write(content)
+        os.replace(tmp, filepath)
+    await asyncio.to_thread(_write)
+    print("✅ Snapshot capturado com sucesso via Go2RTC.")
+
+    return {"url": f"/static/frames/{filename}?t={int(time.time())}"}
+
+@app.websocket("/ws/devices/{device_id}/live")
+async def device_live_ws(websocket: WebSocket, device_id: int):
+    """
+    Push das contagens ao vivo: envia o estado atual e depois deltas e eventos de
+    cruzamento publicados pelo loop da câmera (sem consultas ao banco).
+    """
+    await websocket.accept()
+    channel = live_channel.get_channel(device_id)
+    q = channel.subscribe()
+    # Cliente não envia nada: receive() só retorna no disconnect, que assim é notado mesmo sem mensagens a enviar
+    disconnect = asyncio.create_task(websocket.receive())
+    try:
+        await websocket.send_json(channel.snapshot())
+        while True:
+            next_msg = asyncio.create_task(q.get())
+            done, _ = await asyncio.wait({next_msg, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+            if disconnect in done:
+                next_msg.cancel()
+                msg = disconnect.result()
+                if msg["type"] == "websocket.disconnect": break
+                # Mensagem inesperada do cliente: ignora e continua esperando o disconnect
+                disconnect = asyncio.create_task(websocket.receive())
+                if next_msg not in done: continue
+            await websocket.send_json(next_msg.result())
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        disconnect.cancel()
+        channel.unsubscribe(q)
 
 @app.get("/devices/{device_id}/live_stats")
-def get_device_live_stats(device_id: int, db: Session = Depends(get_db)):
+async def get_device_live_stats(device_id: int, db: AsyncSession = Depends(get_async_db)):
+    # Câmera ativa: as contagens já estão em memória
+    channel = live_channel.channels.get(device_id)
+    if channel and channel.status == "online":
+        return channel.snapshot()
+
     try:
-        prefix = f"live_{device_id}_"
-        latest_video = db.query(models.Video)\
-            .filter(models.Video.id.like(f"{prefix}%"))\
-            .order_by(models.Video.created_at.desc())\
-            .first()
+        # Sessão atual em memória (busca por PK); sem ela, usa o índice (device_id, created_at)
+        session_id = live_manager.current_sessions.get(device_id)
+        latest_video = await crud_async.get_video(db, session_id) if session_id else None
+        if not latest_video:
+            latest_video = await crud_async.get_latest_live_session(db, device_id)
 
         if not latest_video:
             return {"status": "offline", "message": "Aguardando inicio..."}
@@ -786,36 +1251,80 @@ def get_device_live_stats(device_id: int, db: Session = Depends(get_db)):
         # Retorna erro tratado 500 mas com JSON para não quebrar o frontend
         return {"status": "error", "message": str(e)}
 
+@app.get("/devices/{device_id}/metrics")
+def get_device_metrics(device_id: int):
+    """Métricas do pipeline ao vivo: taxa de frames descartados e latência ponta-a-ponta."""
+    metrics = live_manager.camera_metrics.get(device_id)
+    if metrics is None:
+        return {"status": "offline"}
+    return {"status": "online", **metrics}
+
+@app.get("/devices/{device_id}/counts", response_model=List[schemas.CountSeriesPoint])
+async def get_device_counts(device_id: int, start: datetime, end: datetime, granularity: str = "hour", line: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
+    """Série histórica de contagens (minuto/hora/dia) a partir de count_buckets."""
+    if granularity not in ("minute", "hour", "day"):
+        raise HTTPException(status_code=400, detail="granularity deve ser minute, hour ou day")
+    rows = await crud_async.get_count_series(db, device_id, start, end, granularity, line)
+    return [schemas.CountSeriesPoint(bucket=str(r.bucket), line=r.line, direction=r.direction, count=r.count) for r in rows]
+
+@app.get("/analytics/counts", response_model=List[schemas.AnalyticsPoint])
+async def get_analytics_counts(
+    start: datetime,
+    end: datetime,
+    granularity: str = Query("day", pattern="^(hour|day|week|month)$"),
+    devices: Optional[str] = Query(None, description="IDs separados por vírgula"),
+    group: Optional[str] = None,
+    line: Optional[str] = None,
+    direction: Optional[str] = None,
+    by: str = Query("device", pattern="^(device|group|total)$"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Contagens de várias câmeras (ex: entrantes por loja por dia nos últimos 90 dias)
+    a partir dos agregados por hora/dia, sem varrer sessões nem minutos.
+    """
+    try:
+        device_ids = [int(d) for d in devices.split(',') if d.strip()] if devices else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="devices deve ser uma lista de IDs separados por vírgula")
+    rows = await crud_async.get_analytics_counts(db, start, end, granularity, device_ids, group, line, direction, by)
+    return [schemas.AnalyticsPoint(bucket=str(r.bucket), key=None if r.key is None else str(r.key), line=r.line, direction=r.direction, count=r.count) for r in rows]
+
+@app.get("/system/retention")
+def get_retention_metrics():
+    """Uso de disco por pasta, orçamentos e resultado da última passada de retenção."""
+    return retention.service.stats()
+
+@app.post("/system/retention/run")
+async def run_retention(dry_run: bool = True):
+    """Executa uma passada agora (por padrão em dry-run: só lista o que seria removido)."""
+    return await asyncio.to_thread(retention.service.run_once, dry_run)
+
+@app.get("/system/jobs")
+def get_jobs_metrics():
+    """Workers, jobs em execução, estimativa de frames/s e ocupação dos slots de inferência."""
+    return jobs.queue.stats()
+
+@app.get("/system/db_writer")
+def get_db_writer_metrics():
+    """Profundidade da fila e latência de commit do writer write-behind."""
+    return db_writer.writer.stats()
+
 @app.get("/stream-camera/{device_id}")
-def stream_camera_feed(device_id: int, db: Session = Depends(get_db)):
+async def stream_camera_feed(device_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Registra a câmera no serviço Go2RTC e retorna as informações para o Frontend conectar.
     """
-    dev = db.query(models.Device).filter(models.Device.id == device_id).first()
+    dev = await crud_async.get_device(db, device_id)
     if not dev:
         raise HTTPException(status_code=404, detail="Dispositivo não encontrado")
 
     stream_name = f"camera_{dev.id}"
-    
-    # URL base da API do Go2RTC
-    go2rtc_api_url = "http://sense_go2rtc:1984/api/streams"
-    
-    # Payload correto usando params (Deixa o 'requests' tratar a codificação de caracteres especiais)
-    payload = {
-        "src": dev.rtsp_url,
-        "name": stream_name
-    }
 
     try:
-        # Usa requests.put com 'params' para garantir URL válida
-        response = requests.put(go2rtc_api_url, params=payload)
-        
-        if response.status_code not in [200, 201]:
-            # Se der erro 400, imprime o que o servidor respondeu para debug
-            print(f"⚠️ Aviso: Go2RTC retornou {response.status_code} - {response.text}")
-    except Exception as e:
+        await go2rtc.client.ensure_stream(stream_name, dev.rtsp_url)
+    except go2rtc.Go2RTCError as e:
         print(f"❌ Erro ao conectar no Go2RTC: {e}")
-        pass
 
     # Retorna o nome do stream para o frontend montar a URL final
-    return {"stream_name": stream_name}
\ No newline at end of file
+    return {"stream_name": stream_name}
@@ -1,8 +1,13 @@
 # models.py
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, JSON
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, JSON, Float, Index, UniqueConstraint
 from sqlalchemy.sql import func
+from datetime import datetime, timezone
 from database import Base
 
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
 # CLASSE USER REMOVIDA COMPLETAMENTE
 
 class Device(Base):
@@ -20,8 +25,17 @@ class Device(Base):
     rtsp_url = Column(String, nullable=True)
     is_configured = Column(Boolean, default=False)
     processing_start_time = Column(String, nullable=True) # Ex: "08:00"
-    processing_end_time = Column(String, nullable=True)   # Ex: "18:00"
+    processing_end_time = Column(String, nullable=True)   # Ex: "18:00" (menor que o início = cruza a meia-noite)
+    processing_days = Column(String, nullable=True)       # Ex: "0,1,2,3,4" (0 = segunda). NULL = todos os dias, "" = nenhum
     lines_config = Column(JSON, nullable=True)
+    group_name = Column(String, nullable=True, index=True) # Agrupamento para analytics (ex: loja, região)
+
+    # Metadados da stream (probe feito uma vez e reutilizado nos próximos starts)
+    stream_width = Column(Integer, nullable=True)
+    stream_height = Column(Integer, nullable=True)
+    stream_codec = Column(String, nullable=True)
+    stream_fps = Column(Float, nullable=True)
+    stream_probed_at = Column(DateTime(timezone=True), nullable=True)
 
 class Video(Base):
     __tablename__ = "videos"
@@ -34,4 +48,132 @@ class Video(Base):
     report_path = Column(String, nullable=True)
     status = Column(String, default="pending") 
     results = Column(JSON, nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Última alteração da linha (ETag do histórico sem montar a página); NULL em linhas antigas ainda não alteradas.
+    # Gerado no Python: o CURRENT_TIMESTAMP do SQLite só tem resolução de segundos
+    updated_at = Column(DateTime(timezone=True), default=_utcnow, onupdate=_utcnow, index=True)
+    # Sessões ao vivo: câmera de origem (uploads ficam com NULL)
+    device_id = Column(Integer, nullable=True)
+    session_type = Column(String, nullable=True, default="upload") # 'upload' | 'live'
+    # SHA-256 do arquivo enviado (deduplicação e chave do cache de resultados)
+    content_hash = Column(String, nullable=True, index=True)
+    # Sessões ao vivo: contagem herdada ao iniciar (a contagem da própria sessão é results - count_base).
+    # NULL em sessões antigas
+    count_base = Column(JSON, nullable=True)
+
+    __table_args__ = (
+        Index('ix_videos_device_created', 'device_id', 'created_at'),
+        Index('ix_videos_created', 'created_at', 'id'),
+    )
+
+class CountBucket(Base):
+    """Série temporal das contagens ao vivo: deltas por minuto, linha e sentido."""
+    __tablename__ = "count_buckets"
+
+    id = Column(Integer, primary_key=True)
+    device_id = Column(Integer, nullable=False)
+    line = Column(String, nullable=False)       # 'entrant' | 'passerby'
+    direction = Column(String, nullable=False)  # 'in' | 'cross'
+    bucket_start = Column(DateTime, nullable=False) # Início do minuto (hora local)
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint('device_id', 'line', 'direction', 'bucket_start', name='uq_count_buckets_key'),
+        Index('ix_count_buckets_device_time', 'device_id', 'bucket_start'),
+    )
+
+
+class CountRollup(Base):
+    """Agregados por hora/dia/mês de count_buckets, mantidos incrementalmente para as consultas de analytics."""
+    __tablename__ = "count_rollups"
+
+    id = Column(Integer, primary_key=True)
+    granularity = Column(String, nullable=False) # 'hour' | 'day' | 'month'
+    device_id = Column(Integer, nullable=False)
+    line = Column(String, nullable=False)
+    direction = Column(String, nullable=False)
+    bucket_start = Column(DateTime, nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint('granularity', 'device_id', 'line', 'direction', 'bucket_start', name='uq_count_rollups_key'),
+        Index('ix_count_rollups_device_time', 'granularity', 'device_id', 'bucket_start'),
+    )
+
+
+class Job(Base):
+    """Fila persistente de processamento offline (sobrevive a reinícios do servidor)."""
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True)
+    video_id = Column(String, nullable=False, index=True)
+    kind = Column(String, nullable=False, default="upload")
+    priority = Column(Integer, nullable=False, default=10) # Menor = mais prioritário
+    status = Column(String, nullable=False, default="queued") # queued | running | done | failed | cancelled
+    params = Column(JSON, nullable=True)
+    frames_total = Column(Integer, nullable=True)
+    progress = Column(Float, nullable=False, default=0.0) # 0-100
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(String, nullable=True)
+    batch_id = Column(String, nullable=True, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index('ix_jobs_queue', 'status', 'priority', 'id'),
+    )
+
+
+class Batch(Base):
+    """Lote de vídeos enviados juntos: um job por vídeo na fila e um relatório combinado no final."""
+    __tablename__ = "batches"
+
+    id = Column(String, primary_key=True)
+    name = Column(String, nullable=True)
+    status = Column(String, nullable=False, default="running") # running | done | failed | cancelled
+    params = Column(JSON, nullable=True) # Configuração padrão das linhas / modo de renderização
+    items_total = Column(Integer, nullable=False, default=0)
+    results = Column(JSON, nullable=True) # Totais combinados (preenchido ao terminar)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class ResultCache(Base):
+    """Resultado de processamento por (conteúdo do vídeo, linhas, tracker, modelos)."""
+    __tablename__ = "result_cache"
+
+    key = Column(String, primary_key=True)
+    content_hash = Column(String, nullable=False, index=True)
+    cfg_hash = Column(String, nullable=False)
+    tracker_version = Column(String, nullable=False)
+    model_version = Column(String, nullable=False)
+    source_video_id = Column(String, nullable=True)
+    processed_video_path = Column(String, nullable=True)
+    events_path = Column(String, nullable=True)
+    results = Column(JSON, nullable=True)
+    hits = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_hit_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class QuickEstimate(Base):
+    """Estimativa rápida (amostragem de frames) e, depois do processamento completo da mesma combinação, a contagem real (calibração)."""
+    __tablename__ = "quick_estimates"
+
+    id = Column(Integer, primary_key=True, index=True)
+    video_id = Column(String, nullable=False, index=True)
+    content_hash = Column(String, nullable=True)
+    cfg_hash = Column(String, nullable=False)
+    sample_fps = Column(Float, nullable=False)
+    imgsz = Column(Integer, nullable=True) # None = imgsz padrão da detecção
+    frames_sampled = Column(Integer, nullable=False, default=0)
+    elapsed_s = Column(Float, nullable=True)
+    estimate = Column(JSON, nullable=False) # Resultados no formato de Video.results
+    actual = Column(JSON, nullable=True)    # Idem, preenchido quando a combinação é processada por completo
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    calibrated_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index('ix_quick_estimates_combo', 'content_hash', 'cfg_hash'),
+    )
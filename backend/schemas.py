@@ -45,7 +45,9 @@ class DeviceUpdate(BaseModel):
     # Configuração avançada
     processing_start_time: Optional[str] = None
     processing_end_time: Optional[str] = None
+    processing_days: Optional[str] = None # "0,1,2,3,4" (0 = segunda); "" = nenhum dia, omitido = mantém
     lines_config: Optional[dict] = None
+    group_name: Optional[str] = None # Loja/região para analytics ("" remove)
     
 class DeviceResponse(DeviceBase):
     id: int
@@ -56,7 +58,13 @@ class DeviceResponse(DeviceBase):
     rtsp_url: str | None = None
     processing_start_time: Optional[str] = None
     processing_end_time: Optional[str] = None
+    processing_days: Optional[str] = None
     lines_config: Optional[dict] = None
+    group_name: Optional[str] = None
+    stream_width: Optional[int] = None
+    stream_height: Optional[int] = None
+    stream_codec: Optional[str] = None
+    stream_fps: Optional[float] = None
 
     class Config:
         from_attributes = True
@@ -74,6 +82,40 @@ class VideoResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class CountSeriesPoint(BaseModel):
+    bucket: str
+    line: str
+    direction: str
+    count: int
+
+class AnalyticsPoint(BaseModel):
+    bucket: str
+    key: Optional[str] = None # device_id, grupo ou "total" (conforme o parâmetro by); null = câmeras sem grupo
+    line: str
+    direction: str
+    count: int
+
+# --- Job Schemas ---
+class JobResponse(BaseModel):
+    id: int
+    video_id: str
+    kind: str
+    priority: int
+    status: str
+    progress: float
+    frames_total: Optional[int] = None
+    attempts: int
+    error: Optional[str] = None
+    created_at: Optional[datetime.datetime] = None
+    started_at: Optional[datetime.datetime] = None
+    finished_at: Optional[datetime.datetime] = None
+    position: Optional[int] = None # 0 = em execução
+    eta_start_s: Optional[float] = None
+    eta_done_s: Optional[float] = None
+
+    class Config:
+        from_attributes = True
+
 # --- Token Schemas ---
 class Token(BaseModel):
     access_token: str
@@ -0,0 +1,132 @@
+"""
+Lotes de vídeos: importação de uma pasta do servidor, resumo por item e relatório combinado.
+
+Cada vídeo do lote vira um job na fila persistente (prioridade PRIORITY_BATCH), processado pelos
+mesmos workers dos uploads avulsos: YOLO/ReID já carregados são compartilhados e cada job recebe
+um tracker novo. Quando o último job termina, o lote é fechado com os totais somados e um
+relatório com uma linha por vídeo.
+"""
+
+import csv
+import os
+import tempfile
+
+from . import config, result_cache
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".m4v", ".mpg", ".mpeg", ".ts", ".webm")
+
+REPORT_FORMATS = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+COLUMNS = ["video_id", "arquivo", "status", "entrantes", "passantes", "total", "erro"]
+
+
+def resolve_folder(folder):
+    """Pasta do pedido -> caminho absoluto dentro de BATCH_IMPORT_DIR (ValueError fora dela ou inexistente)."""
+    root = os.path.realpath(config.BATCH_IMPORT_DIR)
+    path = os.path.realpath(os.path.join(root, folder))
+    if path != root and not path.startswith(root + os.sep):
+        raise ValueError("Pasta fora do diretório de importação")
+    if not os.path.isdir(path):
+        raise ValueError(f"Pasta não encontrada: {folder}")
+    return path
+
+
+def resolve_file(relpath):
+    """Arquivo do pedido (relativo a BATCH_IMPORT_DIR) -> caminho absoluto (ValueError fora dela ou inexistente)."""
+    path = os.path.join(resolve_folder(os.path.dirname(relpath) or "."), os.path.basename(relpath))
+    if not os.path.isfile(path):
+        raise ValueError(f"Arquivo não encontrado: {relpath}")
+    return path
+
+
+def list_folder(folder):
+    """Vídeos da pasta (não recursivo), em ordem alfabética."""
+    path = resolve_folder(folder)
+    return [os.path.join(path, name) for name in sorted(os.listdir(path))
+            if name.lower().endswith(VIDEO_EXTENSIONS) and os.path.isfile(os.path.join(path, name))]
+
+
+def import_file(src, dest_path):
+    """Traz um arquivo da pasta de importação para uploads (hardlink quando possível). Retorna o sha256."""
+    result_cache.link_or_copy(src, dest_path)
+    return result_cache.file_sha256(dest_path)
+
+
+def item_summary(job, video):
+    results = (video.results if video else None) or {}
+    return {
+        "video_id": job.video_id,
+        "job_id": job.id,
+        "source_name": (job.params or {}).get("source_name"),
+        "status": job.status,
+        "progress": job.progress,
+        "cached": bool((job.params or {}).get("cached")),
+        "results": results or None,
+        "error": job.error,
+    }
+
+
+def combine(items):
+    """Totais do lote (soma dos vídeos concluídos) e contagem de itens por status."""
+    totals = {"entrantes": 0, "passantes": 0, "total": 0}
+    by_status = {}
+    for it in items:
+        by_status[it["status"]] = by_status.get(it["status"], 0) + 1
+        if it["status"] != "done" or not it["results"]: continue
+        totals["entrantes"] += it["results"].get("entrantes", {}).get("Total", 0)
+        totals["passantes"] += it["results"].get("passantes", {}).get("Total", 0)
+        totals["total"] += it["results"].get("total_geral", {}).get("Total", 0)
+    return {"totals": totals, "by_status": by_status}
+
+
+def final_status(items):
+    """Status do lote fechado: cancelled se algum vídeo foi cancelado, failed se algum falhou, senão done."""
+    statuses = {it["status"] for it in items}
+    if "cancelled" in statuses: return "cancelled"
+    if "failed" in statuses: return "failed"
+    return "done"
+
+
+def report_path(batch_id, fmt):
+    return os.path.join(config.REPORTS_DIR, f"batch_{batch_id}_report.{fmt}")
+
+
+def _rows(items):
+    combined = combine(items)
+    for it in items:
+        r = it["results"] or {}
+        yield [it["video_id"], it["source_name"], it["status"],
+               r.get("entrantes", {}).get("Total"), r.get("passantes", {}).get("Total"), r.get("total_geral", {}).get("Total"), it["error"]]
+    t = combined["totals"]
+    yield ["TOTAL", None, None, t["entrantes"], t["passantes"], t["total"], None]
+
+
+def write_report(batch_id, items, fmt="xlsx"):
+    """Relatório combinado (uma linha por vídeo + total). Bloqueante: chamar via asyncio.to_thread."""
+    if fmt not in REPORT_FORMATS:
+        raise ValueError(f"Formato de relatório inválido: {fmt}")
+    path = report_path(batch_id, fmt)
+    # Temporário único: downloads simultâneos do mesmo lote não escrevem no mesmo arquivo
+    fd, tmp = tempfile.mkstemp(dir=config.REPORTS_DIR, prefix=os.path.basename(path) + ".", suffix=".part")
+    os.close(fd)
+    try:
+        if fmt == "csv":
+            with open(tmp, "w", newline="", encoding="utf-8") as f:
+                w = csv.writer(f)
+                w.writerow(COLUMNS)
+                w.writerows(_rows(items))
+        else:
+            from openpyxl import Workbook
+            wb = Workbook(write_only=True)
+            ws = wb.create_sheet("Lote")
+            ws.append(COLUMNS)
+            for row in _rows(items):
+                ws.append(row)
+            wb.save(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp): os.remove(tmp)
+    return path
@@ -0,0 +1,191 @@
+"""
+Checkpoints do contador ao vivo: journal append-only dos eventos de cruzamento + snapshots periódicos
+das contagens e dos estados dos tracks. Ao reiniciar (restart_camera, queda da tarefa ou do processo)
+o pipeline retoma exatamente do ponto em que parou: nenhuma pessoa no meio do cruzamento é recontada
+ou perdida, e os deltas por minuto que não chegaram ao banco são reenviados uma única vez.
+
+Arquivos por câmera em config.CHECKPOINT_DIR:
+    cam_{id}.snap.json      snapshot (gravação atômica + fsync)
+    cam_{id}.journal.jsonl  eventos desde o snapshot e marcas de deltas já gravados no banco
+"""
+
+import json
+import os
+import threading
+import time
+
+from . import config, counting
+
+
+class CounterCheckpoint:
+    def __init__(self, device_id, directory=None):
+        self.device_id = device_id
+        self.directory = directory or config.CHECKPOINT_DIR
+        os.makedirs(self.directory, exist_ok=True)
+        self.snap_path = os.path.join(self.directory, f"cam_{device_id}.snap.json")
+        self.journal_path = os.path.join(self.directory, f"cam_{device_id}.journal.jsonl")
+
+        self.seq = 0          # último evento registrado
+        self.buckets_seq = 0  # último evento cujos deltas por minuto já foram commitados
+        self._journal = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+        # Métricas
+        self.snapshots_total = 0
+        self.last_snapshot_ms = 0.0
+        self.restore_ms = 0.0
+
+    # --- Restauração ---
+    def load(self):
+        """
+        Lê snapshot + journal. Retorna None se não houver checkpoint, ou
+        {'video_id', 'epoch', 'saved_at', 'counts', 'track_states', 'unflushed_events'}.
+        """
+        t0 = time.perf_counter()
+        snap = None
+        try:
+            with open(self.snap_path, encoding="utf-8") as f:
+                snap = json.load(f)
+        except (FileNotFoundError, ValueError):
+            pass
+
+        records = []
+        try:
+            with open(self.journal_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        break # Última linha truncada pela queda
+        except FileNotFoundError:
+            pass
+
+        if snap is None and not records:
+            return None
+
+        snap = snap or {}
+        snap_seq = snap.get("seq", 0)
+        counts = snap.get("counts") or counting.empty_counts()
+        track_states = {int(tid): s for tid, s in (snap.get("track_states") or {}).items()}
+        buckets_seq = snap.get("buckets_seq", 0)
+        saved_at = snap.get("saved_at", 0)
+
+        events = []
+        seq = snap_seq
+        for rec in records:
+            if "buckets_seq" in rec:
+                buckets_seq = max(buckets_seq, rec["buckets_seq"])
+                continue
+            ev = rec.get("ev")
+            if not ev: continue
+            seq = max(seq, rec["seq"])
+            events.append((rec["seq"], ev))
+            saved_at = max(saved_at, rec.get("at", 0))
+            if rec["seq"] <= snap_seq: continue
+            # Evento posterior ao snapshot: reaplica na contagem e no estado do track
+            for key, delta in (("entrantes", 1 if ev["type"] in ("entrant", "switch") else 0),
+                               ("passantes", {"passerby": 1, "switch": -1}.get(ev["type"], 0))):
+                counts[key]["Person"] += delta
+                counts[key]["Total"] += delta
+            state = track_states.setdefault(ev["track_id"], {"status": "neutral", "last_point": None, "last_ts": ev.get("ts")})
+            state["status"] = "passerby" if ev["type"] == "passerby" else "entrant"
+
+        self.seq = seq
+        self.buckets_seq = buckets_seq
+        self.restore_ms = (time.perf_counter() - t0) * 1000
+        return {
+            "video_id": snap.get("video_id"),
+            "epoch": snap.get("epoch"),
+            "saved_at": saved_at,
+            "counts": counts,
+            "track_states": track_states,
+            "unflushed_events": [ev for s, ev in events if s > buckets_seq],
+        }
+
+    # --- Gravação ---
+    def _open_journal(self):
+        if self._journal is None:
+            self._journal = open(self.journal_path, "a", encoding="utf-8")
+        return self._journal
+
+    def append(self, events):
+        """Registra os eventos do frame (chamado no loop; só escrita em buffer do SO, sem fsync)."""
+        if not events: return
+        now = time.time()
+        with self._lock:
+            f = self._open_journal()
+            for ev in events:
+                self.seq += 1
+                f.write(json.dumps({"seq": self.seq, "at": now, "ev": ev}) + "\n")
+            f.flush()
+
+    def mark_buckets(self, seq):
+        """Deltas por minuto até `seq` commitados no banco (chamado pelo DBWriter após o commit)."""
+        with self._lock:
+            if seq <= self.buckets_seq: return
+            self.buckets_seq = seq
+            f = self._open_journal()
+            f.write(json.dumps({"buckets_seq": seq}) + "\n")
+            f.flush()
+            # Commit do último lote depois que a sessão encerrou: não mantém o arquivo aberto
+            if self._closed:
+                f.close()
+                self._journal = None
+
+    def capture(self, video_id, counter, epoch):
+        """Estado atual serializável (chamar no loop, entre frames)."""
+        return dict(counter.state(), seq=self.seq, video_id=video_id, epoch=epoch, saved_at=time.time())
+
+    def write_snapshot(self, state):
+        """
+        Grava o snapshot (tmp + fsync + rename) e compacta o journal, mantendo só os eventos
+        posteriores ao snapshot ou ainda não gravados em count_buckets. Bloqueante: rodar em thread.
+        """
+        t0 = time.perf_counter()
+        data = json.dumps(dict(state, buckets_seq=self.buckets_seq))
+        tmp = self.snap_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snap_path)
+
+        keep_after = min(state["seq"], self.buckets_seq)
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            kept = []
+            try:
+                with open(self.journal_path, encoding="utf-8") as f:
+                    for line in f:
+                        try: rec = json.loads(line)
+                        except ValueError: break
+                        if rec.get("seq", 0) > keep_after: kept.append(line)
+            except FileNotFoundError:
+                pass
+            tmp = self.journal_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.writelines(kept)
+                f.write(json.dumps({"buckets_seq": self.buckets_seq}) + "\n")
+            os.replace(tmp, self.journal_path)
+
+        self.snapshots_total += 1
+        self.last_snapshot_ms = (time.perf_counter() - t0) * 1000
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    def stats(self):
+        return {
+            "seq": self.seq,
+            "buckets_seq": self.buckets_seq,
+            "snapshots_total": self.snapshots_total,
+            "last_snapshot_ms": round(self.last_snapshot_ms, 2),
+            "restore_ms": round(self.restore_ms, 2),
+        }
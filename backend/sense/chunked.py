@@ -0,0 +1,323 @@
+"""
+Processamento paralelo de vídeos longos: o vídeo é dividido em segmentos de tempo com uma pequena
+sobreposição, cada segmento roda em um processo separado (YOLO + BoT-SORT próprios) e os tracks são
+costurados nas fronteiras por IoU das caixas e similaridade de aparência (ReID) nos frames sobrepostos.
+
+A contagem não é feita nos workers: o resultado costurado (IDs globais, frame a frame) passa pelo mesmo
+CrossingCounter do processamento sequencial. Cada frame vem de um único segmento e um track que atravessa
+a fronteira mantém o mesmo ID, então nenhum cruzamento é contado duas vezes.
+
+Arquivos de cada segmento (JSONL, uma linha por frame: [frame, [[tid, x1, y1, x2, y2, conf, cls], ...]])
+ficam em um diretório temporário do job.
+"""
+
+import asyncio
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing as mp
+
+import cv2
+import numpy as np
+
+from . import config
+
+# Frames da sobreposição usados para calcular a aparência (ReID) de cada track
+_EMBED_EVERY = 5
+
+# Processor do worker (um por processo, carregado no initializer)
+_processor = None
+
+
+def plan_segments(total_frames, fps, workers, segment_s=None, overlap_s=None):
+    """
+    Divide [0, total_frames) em segmentos. Retorna [(warm_start, start, end)]: o segmento é dono dos
+    frames [start, end) e processa antes [warm_start, start) só para aquecer o tracker e costurar.
+    """
+    segment_s = segment_s or config.CHUNK_SEGMENT_S
+    overlap_s = config.CHUNK_OVERLAP_S if overlap_s is None else overlap_s
+    fps = fps or 30.0
+    if total_frames <= 0: return []
+    # Pelo menos um segmento por worker; segmentos longos são quebrados (progresso e balanceamento melhores)
+    n = max(workers, math.ceil(total_frames / (segment_s * fps)))
+    n = min(n, max(1, total_frames // max(1, int(overlap_s * fps * 4)))) # Segmento bem maior que a sobreposição
+    overlap = int(round(overlap_s * fps))
+    bounds = [round(i * total_frames / n) for i in range(n + 1)]
+    return [(max(0, bounds[i] - overlap) if i else 0, bounds[i], bounds[i + 1]) for i in range(n)]
+
+
+def should_chunk(total_frames, fps):
+    """Modo automático: só vale a pena para vídeos longos e com mais de um worker."""
+    if config.CHUNK_WORKERS < 2 or not fps or total_frames <= 0: return False
+    return total_frames / fps >= config.CHUNK_MIN_DURATION_S
+
+
+# --- Worker (roda em outro processo) ---
+def _init_worker(threads):
+    global _processor
+    cv2.setNumThreads(threads)
+    import torch
+    torch.set_num_threads(threads) # Evita que N processos disputem todos os núcleos
+    from . import video_process
+    _processor = video_process.VideoProcessor()
+
+
+def _embed(frame, tracks):
+    """Embeddings ReID (normalizados) das caixas do frame: {tid: vetor}."""
+    h, w = frame.shape[:2]
+    crops, tids = [], []
+    for t in tracks:
+        x1, y1, x2, y2 = t["bbox"]
+        x1, y1, x2, y2 = max(0, x1), max(0, y1), min(w, x2), min(h, y2)
+        if x2 - x1 < 4 or y2 - y1 < 4: continue
+        crops.append(frame[y1:y2, x1:x2])
+        tids.append(t["track_id"])
+    if not crops: return {}
+    try:
+        feats = _processor.reid_model(crops)
+    except Exception:
+        return {}
+    return dict(zip(tids, feats))
+
+
+def process_segment(path, index, warm_start, start, end, overlap, out_dir):
+    """
+    Processa um segmento. Grava os tracks dos frames [start, end) em JSONL e retorna as caixas e a
+    aparência dos tracks nas duas regiões de sobreposição (cabeça: [warm_start, start), cauda: últimos frames).
+    """
+    _processor.tracker = _processor._new_tracker()
+    cap = cv2.VideoCapture(path)
+    if warm_start > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, warm_start)
+    frame_idx = int(cap.get(cv2.CAP_PROP_POS_FRAMES)) if warm_start > 0 else 0
+    tail_start = end - overlap
+
+    out_path = os.path.join(out_dir, f"seg_{index:04d}.jsonl")
+    head, tail = {}, {}
+    emb_head, emb_tail = {}, {}
+    ids, frames = set(), 0
+    with open(out_path, "w", encoding="utf-8") as f:
+        while frame_idx < end:
+            ret, frame = cap.read()
+            if not ret: break
+            tracks = _processor.process_frame(frame)
+            frames += 1
+
+            region = None
+            if frame_idx < start: region = (head, emb_head)
+            elif frame_idx >= tail_start: region = (tail, emb_tail)
+            if region is not None:
+                boxes, embs = region
+                for t in tracks:
+                    boxes.setdefault(t["track_id"], {})[frame_idx] = t["bbox"]
+                if tracks and frame_idx % _EMBED_EVERY == 0:
+                    for tid, vec in _embed(frame, tracks).items():
+                        embs[tid] = embs.get(tid, 0) + vec
+
+            if frame_idx >= start:
+                ids.update(t["track_id"] for t in tracks)
+                f.write(json.dumps([frame_idx, [[t["track_id"], *t["bbox"], round(t["confidence"], 3), t["class_id"]] for t in tracks]]) + "\n")
+            frame_idx += 1
+    cap.release()
+
+    def _norm(embs):
+        out = {}
+        for tid, v in embs.items():
+            n = float(np.linalg.norm(v))
+            if n > 0: out[tid] = (v / n).tolist()
+        return out
+
+    result = {
+        "index": index, "warm_start": warm_start, "start": start, "end": end, "path": out_path, "frames": frames, "ids": sorted(ids),
+        "head": head, "tail": tail, "emb_head": _norm(emb_head), "emb_tail": _norm(emb_tail),
+    }
+    # Metadados gravados por último: um segmento só é reaproveitado na retomada se terminou
+    meta = os.path.join(out_dir, f"seg_{index:04d}.json")
+    with open(meta + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(result, f)
+    os.replace(meta + ".tmp", meta)
+    return result
+
+
+def _load_segment(out_dir, index, warm_start, start, end):
+    """Resultado de um segmento já concluído (retomada do job) ou None."""
+    try:
+        with open(os.path.join(out_dir, f"seg_{index:04d}.json"), encoding="utf-8") as f:
+            seg = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if (seg.get("warm_start"), seg["start"], seg["end"]) != (warm_start, start, end) or not os.path.exists(seg["path"]):
+        return None
+    # JSON não preserva chaves inteiras
+    for key in ("head", "tail"):
+        seg[key] = {int(tid): {int(fr): box for fr, box in boxes.items()} for tid, boxes in seg[key].items()}
+    for key in ("emb_head", "emb_tail"):
+        seg[key] = {int(tid): vec for tid, vec in seg[key].items()}
+    return seg
+
+
+# --- Costura ---
+def _iou(a, b):
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+    if inter == 0: return 0.0
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def match_tracks(prev, nxt, min_iou=None, min_appearance=None, min_common=3):
+    """
+    Associa os tracks da cabeça do segmento `nxt` aos da cauda de `prev` (mesmos frames).
+    Score = IoU médio nos frames em comum, reforçado pela similaridade de aparência quando disponível.
+    Associação gulosa pelo maior score. Retorna {tid_nxt: tid_prev}.
+    """
+    min_iou = config.CHUNK_STITCH_IOU if min_iou is None else min_iou
+    min_appearance = config.CHUNK_STITCH_APPEARANCE if min_appearance is None else min_appearance
+    candidates = []
+    for tid_b, boxes_b in nxt["head"].items():
+        emb_b = nxt["emb_head"].get(tid_b)
+        for tid_a, boxes_a in prev["tail"].items():
+            common = boxes_a.keys() & boxes_b.keys()
+            if len(common) < min_common: continue
+            iou = sum(_iou(boxes_a[fr], boxes_b[fr]) for fr in common) / len(common)
+            emb_a = prev["emb_tail"].get(tid_a)
+            app = float(np.dot(emb_a, emb_b)) if emb_a is not None and emb_b is not None else None
+            # IoU alto basta (salvo aparência muito diferente); IoU moderado exige aparência parecida
+            by_iou = iou >= min_iou and (app is None or app >= min_appearance / 2)
+            by_app = app is not None and iou >= min_iou / 3 and app >= min_appearance
+            if not (by_iou or by_app): continue
+            score = iou if app is None else 0.6 * iou + 0.4 * app
+            candidates.append((score, tid_b, tid_a))
+
+    mapping, used = {}, set()
+    for score, tid_b, tid_a in sorted(candidates, reverse=True):
+        if tid_b in mapping or tid_a in used: continue
+        mapping[tid_b] = tid_a
+        used.add(tid_a)
+    return mapping
+
+
+class MergedTracks:
+    """Tracks costurados de todos os segmentos, lidos em ordem de frame com IDs globais."""
+
+    def __init__(self, segments):
+        self.segments = sorted(segments, key=lambda s: s["index"])
+        self.global_ids = [] # por segmento: {tid_local: tid_global}
+        self.stitched = 0
+        self.boundary_tracks = 0
+        next_gid = 1
+        prev, prev_map = None, None
+        for seg in self.segments:
+            mapping = match_tracks(prev, seg) if prev is not None else {}
+            local_ids = set(seg["head"]) | set(seg["tail"]) | set(seg["ids"])
+            gids = {}
+            for tid in sorted(local_ids):
+                if tid in mapping and mapping[tid] in prev_map:
+                    gids[tid] = prev_map[mapping[tid]]
+                    self.stitched += 1
+                else:
+                    gids[tid] = next_gid
+                    next_gid += 1
+            if prev is not None: self.boundary_tracks += len(seg["head"])
+            self.global_ids.append(gids)
+            prev, prev_map = seg, gids
+        self.tracks_total = next_gid - 1
+        self._iter = self._frames()
+        self._current = next(self._iter, None)
+
+    def _frames(self):
+        for seg, gids in zip(self.segments, self.global_ids):
+            with open(seg["path"], encoding="utf-8") as f:
+                for line in f:
+                    frame_idx, rows = json.loads(line)
+                    yield frame_idx, [{
+                        "bbox": [x1, y1, x2, y2], "track_id": gids[tid], "confidence": conf,
+                        "class_id": cls, "class_name": config.CLASS_NAMES.get(cls, f"{cls}"),
+                    } for tid, x1, y1, x2, y2, conf, cls in rows]
+
+    def at(self, frame_idx):
+        """Tracks do frame (chamar com frame_idx crescente)."""
+        while self._current is not None and self._current[0] < frame_idx:
+            self._current = next(self._iter, None)
+        if self._current is not None and self._current[0] == frame_idx:
+            return self._current[1]
+        return []
+
+    def stats(self):
+        return {
+            "segments": len(self.segments),
+            "frames": sum(s["frames"] for s in self.segments),
+            "tracks_total": self.tracks_total,
+            "boundary_tracks": self.boundary_tracks,
+            "stitched": self.stitched,
+        }
+
+
+# --- Pool de processos ---
+class ChunkPool:
+    def __init__(self, workers=None):
+        self.workers = workers or config.CHUNK_WORKERS
+        self._executor = None
+
+    def executor(self):
+        if self._executor is None:
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            # spawn: CUDA e torch não sobrevivem a fork
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=mp.get_context("spawn"),
+                                                 initializer=_init_worker, initargs=(threads,))
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+async def analyze(path, total_frames, fps, out_dir, cancel_event=None, on_progress=None, workers=None):
+    """
+    Processa o vídeo em paralelo e retorna os tracks costurados (MergedTracks).
+    on_progress(fração) é chamado a cada segmento concluído. Com cancel_event setado, os segmentos
+    pendentes são descartados e retorna None.
+    """
+    workers = workers or pool.workers
+    plan = plan_segments(total_frames, fps, workers)
+    overlap = int(round(config.CHUNK_OVERLAP_S * (fps or 30.0)))
+    os.makedirs(out_dir, exist_ok=True)
+    print(f"🧩 {os.path.basename(path)}: {len(plan)} segmentos em {workers} processos (sobreposição {overlap} frames)")
+
+    results, done_frames, todo = [], 0, []
+    for i, (w, s, e) in enumerate(plan):
+        seg = _load_segment(out_dir, i, w, s, e)
+        if seg is None:
+            todo.append((i, w, s, e))
+        else:
+            results.append(seg)
+            done_frames += e - s
+    if results:
+        print(f"♻️ {len(results)} segmentos reaproveitados de uma execução anterior")
+
+    executor = pool.executor() if todo else None
+    futures = [asyncio.wrap_future(executor.submit(process_segment, path, i, w, s, e, overlap, out_dir))
+               for i, w, s, e in todo]
+    try:
+        pending = set(futures)
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=1.0, return_when=asyncio.FIRST_COMPLETED)
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            for fut in done:
+                seg = fut.result()
+                results.append(seg)
+                done_frames += seg["end"] - seg["start"]
+                if on_progress: await on_progress(done_frames / total_frames)
+    finally:
+        for fut in futures:
+            fut.cancel()
+
+    return await asyncio.to_thread(MergedTracks, results)
+
+
+# Pool compartilhado pela API (criado no primeiro uso)
+pool = ChunkPool()
@@ -51,6 +51,141 @@ TRACKER_CONFIG = {
     'fuse_first_associate': True,
 }
 
+# Parâmetros efetivos do BoT-SORT (VideoProcessor) e da detecção YOLO.
+# Fazem parte da chave do cache de resultados: mudar qualquer valor invalida os resultados em cache.
+BOTSORT_PARAMS = {
+    'track_high_thresh': 0.45,  # Confiança para detecções boas
+    'new_track_thresh': 0.6,    # Confiança para criar novo rastro
+    'match_thresh': 0.7,        # IoU para associação
+    'track_buffer': 90,
+    # Proximidade (evita que IDs pulem entre pessoas muito próximas)
+    'proximity_thresh': 0.5,
+    'appearance_thresh': 0.25,
+}
+DETECTION_PARAMS = {'imgsz': 640, 'conf': 0.4, 'iou': 0.5}
+
 # --- CLASSES ---
 CLASS_NAMES = { 0: "Person" }
-CLASS_COLORS = { 0: (0, 255, 0) }
\ No newline at end of file
+CLASS_COLORS = { 0: (0, 255, 0) }
+# --- GO2RTC ---
+GO2RTC_API = os.getenv("GO2RTC_API", "http://sense_go2rtc:1984/api")
+GO2RTC_RTSP = os.getenv("GO2RTC_RTSP", "rtsp://sense_go2rtc:8554")
+
+# --- PIPELINE AO VIVO ---
+LIVE_FPS = 15
+# Quantos frames recentes o leitor mantém para a análise (1 = sempre o mais novo)
+LIVE_FRAME_WINDOW = int(os.getenv("LIVE_FRAME_WINDOW", "1"))
+# Tempo máximo (s) sem ver um track antes de descartar seu último ponto
+TRACK_MAX_GAP_S = float(os.getenv("TRACK_MAX_GAP_S", "2.0"))
+# Reinícios do pipe de leitura antes de re-executar o probe da stream
+STREAM_REVALIDATE_AFTER = 3
+# Taxa máxima (atualizações/s) de push das contagens ao vivo via WebSocket
+LIVE_PUSH_HZ = float(os.getenv("LIVE_PUSH_HZ", "2"))
+# Transporte de frames do leitor para a inferência: 'pipe' (thread no processo da API)
+# ou 'shm' (processo leitor por câmera + ring em memória compartilhada)
+LIVE_TRANSPORT = os.getenv("LIVE_TRANSPORT", "pipe")
+SHM_RING_SLOTS = int(os.getenv("SHM_RING_SLOTS", "4"))
+# Intervalo (s) de gravação dos deltas por minuto em count_buckets
+LIVE_BUCKET_FLUSH_S = 2.0
+# Intervalo (s) de gravação do snapshot de totais na linha da sessão (videos.results)
+LIVE_SNAPSHOT_INTERVAL_S = 30.0
+# Espera (s) antes de reiniciar uma câmera cuja tarefa caiu dentro do horário
+SCHEDULER_RETRY_S = 10.0
+# Sono máximo (s) do scheduler entre transições (tolera ajustes no relógio do sistema)
+SCHEDULER_MAX_SLEEP_S = 300.0
+
+# --- RETENÇÃO (disco e histórico) ---
+RETENTION_ENABLED = os.getenv("RETENTION_ENABLED", "1") == "1"
+# Modo simulação (padrão): calcula e registra o que seria removido, sem apagar nada.
+# Remoção real só com RETENTION_DRY_RUN=0, depois de conferir os logs
+RETENTION_DRY_RUN = os.getenv("RETENTION_DRY_RUN", "1") == "1"
+RETENTION_INTERVAL_S = float(os.getenv("RETENTION_INTERVAL_S", "600"))
+# Arquivos modificados há menos que isso nunca são removidos (uploads/gravações em andamento)
+RETENTION_MIN_AGE_S = float(os.getenv("RETENTION_MIN_AGE_S", "600"))
+# Espaço livre mínimo no disco de static/: abaixo disso remove os arquivos menos acessados de todas as pastas
+RETENTION_MIN_FREE_GB = float(os.getenv("RETENTION_MIN_FREE_GB", "2"))
+# Orçamento por pasta: (GB máximos, dias máximos desde o último acesso). None = sem limite
+RETENTION_BUDGETS = {
+    UPLOAD_DIR: (float(os.getenv("RETENTION_UPLOADS_GB", "20")), float(os.getenv("RETENTION_UPLOADS_DAYS", "30"))),
+    OUTPUT_DIR: (float(os.getenv("RETENTION_OUTPUTS_GB", "20")), float(os.getenv("RETENTION_OUTPUTS_DAYS", "30"))),
+    FRAMES_DIR: (float(os.getenv("RETENTION_FRAMES_GB", "1")), float(os.getenv("RETENTION_FRAMES_DAYS", "90"))),
+    REPORTS_DIR: (float(os.getenv("RETENTION_REPORTS_GB", "2")), float(os.getenv("RETENTION_REPORTS_DAYS", "90"))),
+}
+# Sessões ao vivo encerradas mais antigas que isso viram só rollups (a mais recente de cada câmera é mantida)
+LIVE_SESSION_RETENTION_DAYS = float(os.getenv("LIVE_SESSION_RETENTION_DAYS", "7"))
+
+# --- CHECKPOINTS DO CONTADOR AO VIVO ---
+CHECKPOINT_DIR = os.getenv("CHECKPOINT_DIR", os.path.join(BASE_DIR, 'checkpoints'))
+# Intervalo (s) entre snapshots (o journal registra cada evento na hora)
+CHECKPOINT_SNAPSHOT_S = float(os.getenv("CHECKPOINT_SNAPSHOT_S", "5"))
+# Idade máxima (s) do checkpoint para retomar os tracks em andamento (reinícios dentro da mesma janela)
+CHECKPOINT_TRACK_TTL_S = float(os.getenv("CHECKPOINT_TRACK_TTL_S", "60"))
+
+# --- FILA DE JOBS OFFLINE ---
+# Vídeos processados em paralelo (cada worker tem seu próprio tracker; YOLO/ReID são compartilhados)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+# Frames em inferência simultânea (câmeras ao vivo + jobs); na disputa, as câmeras ao vivo passam na frente
+INFERENCE_SLOTS = int(os.getenv("INFERENCE_SLOTS", "4"))
+# Estimativa inicial de frames/s por worker para o ETA (ajustada pela média dos jobs concluídos)
+JOB_DEFAULT_FPS = float(os.getenv("JOB_DEFAULT_FPS", "10"))
+# Preview dos jobs (/video-stream): só o último frame fica em memória e só é codificado com alguém assistindo
+PREVIEW_FPS = float(os.getenv("PREVIEW_FPS", "8"))
+PREVIEW_MAX_WIDTH = int(os.getenv("PREVIEW_MAX_WIDTH", "960"))
+PREVIEW_JPEG_QUALITY = int(os.getenv("PREVIEW_JPEG_QUALITY", "75"))
+
+# Intervalo mínimo (s) entre mensagens de progresso de um job (coalescidas, enviadas a todos que acompanham)
+PROGRESS_INTERVAL_S = float(os.getenv("PROGRESS_INTERVAL_S", "0.5"))
+
+# --- PROCESSAMENTO PARALELO DE VÍDEOS LONGOS ---
+# Processos por vídeo (cada um carrega YOLO/ReID); < 2 desativa o modo automático
+CHUNK_WORKERS = int(os.getenv("CHUNK_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+# Modo automático só para vídeos a partir desta duração (s)
+CHUNK_MIN_DURATION_S = float(os.getenv("CHUNK_MIN_DURATION_S", "600"))
+# Duração alvo (s) de cada segmento e sobreposição (s) usada para aquecer o tracker e costurar os tracks
+CHUNK_SEGMENT_S = float(os.getenv("CHUNK_SEGMENT_S", "300"))
+CHUNK_OVERLAP_S = float(os.getenv("CHUNK_OVERLAP_S", "2"))
+# Costura: IoU médio mínimo das caixas nos frames sobrepostos e similaridade mínima de aparência (cosseno ReID)
+CHUNK_STITCH_IOU = float(os.getenv("CHUNK_STITCH_IOU", "0.5"))
+CHUNK_STITCH_APPEARANCE = float(os.getenv("CHUNK_STITCH_APPEARANCE", "0.7"))
+
+# --- RETOMADA DE JOBS OFFLINE ---
+# Intervalo (s) entre checkpoints do processamento (fecha um segmento do vídeo de saída a cada checkpoint)
+JOB_CHECKPOINT_S = float(os.getenv("JOB_CHECKPOINT_S", "60"))
+
+# --- VÍDEO DE SAÍDA (H.264 via ffmpeg) ---
+# Qualidade (CRF do x264: menor = melhor e maior) e preset (ultrafast ... veryslow: mais lento = arquivo menor)
+OUTPUT_CRF = int(os.getenv("OUTPUT_CRF", "23"))
+OUTPUT_PRESET = os.getenv("OUTPUT_PRESET", "veryfast")
+# Frames aguardando o encoder; com a fila cheia o loop de inferência espera (memória limitada)
+OUTPUT_WRITER_QUEUE = int(os.getenv("OUTPUT_WRITER_QUEUE", "32"))
+
+# --- UPLOADS E CACHE DE RESULTADOS ---
+# Tamanho (bytes) dos blocos lidos no upload (hash calculado enquanto grava)
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "1") == "1"
+
+# --- LOTES ---
+# Pasta do servidor de onde os lotes podem importar vídeos (POST /batches com "folder": subpasta dela)
+BATCH_IMPORT_DIR = os.getenv("BATCH_IMPORT_DIR", os.path.join(STATIC_DIR, 'batch_inbox'))
+# Máximo de vídeos por lote
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+
+# --- ESTIMATIVA RÁPIDA (mode="quick" em /process-video/) ---
+# Frames/s amostrados do vídeo (o resto é pulado); abaixo de QUICK_SEEK_MIN_STRIDE frames pulados
+# por amostra, grab() sequencial sai mais barato que o seek
+QUICK_SAMPLE_FPS = float(os.getenv("QUICK_SAMPLE_FPS", "3"))
+QUICK_SEEK_MIN_STRIDE = int(os.getenv("QUICK_SEEK_MIN_STRIDE", "8"))
+# imgsz da detecção na estimativa (0 = o de DETECTION_PARAMS; ignorado com o modelo TensorRT, de tamanho fixo)
+QUICK_IMGSZ = int(os.getenv("QUICK_IMGSZ", "480"))
+# Limites por estimativa (roda dentro da requisição): vídeos longos aumentam o passo entre amostras
+# para caber em QUICK_MAX_SAMPLES; passou de QUICK_TIMEOUT_S, a estimativa é abortada (504)
+QUICK_MAX_SAMPLES = int(os.getenv("QUICK_MAX_SAMPLES", "1500"))
+QUICK_TIMEOUT_S = float(os.getenv("QUICK_TIMEOUT_S", "120"))
+# Intervalo (amostras) entre as verificações de cliente desconectado
+QUICK_DISCONNECT_CHECK_EVERY = 10
+# Faixa de confiança: percentis do erro relativo (completo vs. estimativa) das estimativas já calibradas
+# com o mesmo fps de amostragem; com menos de QUICK_CALIBRATION_MIN amostras usa a faixa padrão (±%, mínimo absoluto)
+QUICK_CALIBRATION_MIN = int(os.getenv("QUICK_CALIBRATION_MIN", "5"))
+QUICK_BAND_PERCENTILES = (10, 90)
+QUICK_DEFAULT_BAND = float(os.getenv("QUICK_DEFAULT_BAND", "0.3"))
+QUICK_DEFAULT_BAND_MIN = 2
@@ -0,0 +1,162 @@
+"""
+Lógica de contagem por cruzamento de linhas (Entrantes / Passantes).
+Compartilhada entre o pipeline ao vivo e o processamento offline.
+"""
+
+from datetime import datetime
+
+from . import geometry
+
+
+def empty_counts():
+    return {"entrantes": {"Person": 0, "Total": 0}, "passantes": {"Person": 0, "Total": 0}}
+
+
+def results_from_counts(counts):
+    """Contagens {'entrantes', 'passantes'} -> JSON de resultados no formato salvo em Video.results."""
+    ent = counts.get('entrantes') or {"Person": 0, "Total": 0}
+    pas = counts.get('passantes') or {"Person": 0, "Total": 0}
+    total = {
+        "Person": ent.get('Person', 0) + pas.get('Person', 0),
+        "Total": ent.get('Total', 0) + pas.get('Total', 0),
+    }
+    return {"total_geral": total, "entrantes": ent, "passantes": pas}
+
+
+# Evento de cruzamento -> deltas (linha, sentido, delta) nas séries de contagem
+EVENT_DELTAS = {
+    "entrant": [("entrant", "in", 1)],
+    "passerby": [("passerby", "cross", 1)],
+    "switch": [("passerby", "cross", -1), ("entrant", "in", 1)],
+}
+
+
+def accumulate_bucket_deltas(deltas, events, fallback_ts=None):
+    """Soma os eventos em `deltas` ({(linha, sentido, minuto): delta}) agrupando por minuto."""
+    for ev in events:
+        ts = ev.get("ts") or fallback_ts
+        if ts is None: continue
+        minute = datetime.fromtimestamp(ts).replace(second=0, microsecond=0)
+        for line, direction, delta in EVENT_DELTAS.get(ev["type"], []):
+            key = (line, direction, minute)
+            deltas[key] = deltas.get(key, 0) + delta
+    return deltas
+
+
+class CrossingCounter:
+    def __init__(self, line_ent, line_pass, in_side='right', max_gap_s=None):
+        """
+        Args:
+            line_ent: Pontos da linha de entrada (lista de [x, y] ou {'x', 'y'})
+            line_pass: Pontos da linha de passagem
+            in_side: Lado considerado "dentro" da loja ('right' | 'left')
+            max_gap_s: Tempo máximo (s) sem ver um track antes de descartar o último ponto.
+                       Com timestamps, frames descartados não quebram a detecção de cruzamento.
+        """
+        self.line_ent = line_ent
+        self.line_pass = line_pass
+        self.in_side = in_side
+        self.required_prev_side = 'left' if in_side == 'right' else 'right'
+        self.max_gap_s = max_gap_s
+
+        # track_states: tid -> {'status': 'neutral' | 'passerby' | 'entrant', 'last_point', 'last_ts'}
+        self.track_states = {}
+        self.counts = empty_counts()
+
+    def restore(self, counts=None, track_states=None):
+        """Retoma de um checkpoint (contagens e, opcionalmente, estados dos tracks em andamento)."""
+        if counts:
+            for key in ("entrantes", "passantes"):
+                if key in counts:
+                    self.counts[key] = {"Person": counts[key].get("Person", 0), "Total": counts[key].get("Total", 0)}
+        if track_states:
+            self.track_states = {
+                int(tid): {"status": s.get("status", "neutral"),
+                           "last_point": tuple(s["last_point"]) if s.get("last_point") else None,
+                           "last_ts": s.get("last_ts")}
+                for tid, s in track_states.items()
+            }
+
+    def state(self):
+        """Contagens e estados dos tracks em formato JSON (inverso de restore)."""
+        return {
+            "counts": {k: dict(v) for k, v in self.counts.items()},
+            "track_states": {str(tid): {"status": s["status"], "last_point": list(s["last_point"]) if s.get("last_point") else None, "last_ts": s.get("last_ts")}
+                             for tid, s in self.track_states.items()},
+        }
+
+    def _add(self, key, delta):
+        self.counts[key]['Person'] += delta
+        self.counts[key]['Total'] += delta
+
+    def _crossing_ts(self, prev_ts, ts, ratio):
+        if ts is None: return None
+        if prev_ts is None: return ts
+        return prev_ts + (ts - prev_ts) * ratio
+
+    def update(self, tracks, ts=None, frame_idx=None):
+        """
+        Atualiza os estados com os tracks do frame e retorna a lista de eventos de cruzamento.
+        Cada evento: {'type': 'passerby' | 'entrant' | 'switch', 'track_id', 'ts', 'frame'}
+        ('switch' = era passante e entrou: passantes -1, entrantes +1)
+        """
+        events = []
+        for t in tracks:
+            tid = t["track_id"]
+            bbox = t["bbox"]
+            ref_point = (int((bbox[0]+bbox[2])/2), int((bbox[1]+bbox[3])/2))
+
+            if tid not in self.track_states:
+                self.track_states[tid] = {'status': 'neutral', 'last_point': ref_point, 'last_ts': ts}
+
+            state = self.track_states[tid]
+            prev_point = state.get('last_point') or ref_point
+            prev_ts = state.get('last_ts')
+
+            # Track sumiu por tempo demais: o deslocamento não é confiável, recomeça do ponto atual
+            if self.max_gap_s and ts is not None and prev_ts is not None and ts - prev_ts > self.max_gap_s:
+                prev_point, prev_ts = ref_point, ts
+
+            # Só processa se houve deslocamento
+            if tuple(prev_point) != ref_point:
+
+                # 1. VERIFICAÇÃO PASSANTES (Qualquer sentido)
+                for i in range(len(self.line_pass) - 1):
+                    if geometry.segments_intersect(prev_point, ref_point, self.line_pass[i], self.line_pass[i+1]):
+                        if state['status'] == 'neutral':
+                            state['status'] = 'passerby'
+                            self._add('passantes', 1)
+                            ratio = geometry.segment_crossing_ratio(prev_point, ref_point, self.line_pass[i], self.line_pass[i+1])
+                            events.append({"type": "passerby", "track_id": tid, "ts": self._crossing_ts(prev_ts, ts, ratio), "frame": frame_idx})
+                        break
+
+                # 2. VERIFICAÇÃO ENTRANTES (Sentido OUT -> IN)
+                for i in range(len(self.line_ent) - 1):
+                    p_start = self.line_ent[i]
+                    p_end = self.line_ent[i+1]
+
+                    if geometry.segments_intersect(prev_point, ref_point, p_start, p_end):
+                        side_prev = geometry.get_side_of_segment(prev_point, p_start, p_end)
+
+                        if side_prev == self.required_prev_side:
+                            ratio = geometry.segment_crossing_ratio(prev_point, ref_point, p_start, p_end)
+                            if state['status'] == 'neutral':
+                                state['status'] = 'entrant'
+                                self._add('entrantes', 1)
+                                events.append({"type": "entrant", "track_id": tid, "ts": self._crossing_ts(prev_ts, ts, ratio), "frame": frame_idx})
+
+                            elif state['status'] == 'passerby':
+                                state['status'] = 'entrant'
+                                self._add('passantes', -1)
+                                self._add('entrantes', 1)
+                                events.append({"type": "switch", "track_id": tid, "ts": self._crossing_ts(prev_ts, ts, ratio), "frame": frame_idx})
+                            break
+
+            state['last_point'] = ref_point
+            state['last_ts'] = ts
+
+        return events
+
+    def results(self):
+        """JSON de resultados no formato salvo em Video.results."""
+        return results_from_counts(self.counts)
@@ -0,0 +1,224 @@
+"""
+Writer write-behind do banco: uma única task recebe as escritas de todos os pipelines
+(câmeras ao vivo e jobs offline) e as aplica em poucas transações por segundo.
+No SQLite isso evita que N câmeras disputem o lock de escrita e travem as leituras da API.
+"""
+
+import asyncio
+import itertools
+import time
+
+from sqlalchemy.exc import OperationalError
+
+from database import SessionLocal
+
+
+def _transient(e):
+    """Erro que passa tentando de novo (banco travado, conexão caída), diferente de um erro da própria operação."""
+    if not isinstance(e, OperationalError): return False
+    msg = str(e).lower()
+    return not any(s in msg for s in ("no such", "syntax error", "has no column"))
+
+
+def _noop(db, commit=False):
+    """Operação vazia usada por flush() para marcar um ponto na fila."""
+
+
+class DBWriter:
+    def __init__(self, session_factory=SessionLocal, flush_interval=0.25, max_batch=500, retries=4, retry_backoff_s=0.2):
+        """
+        Args:
+            session_factory: Fábrica de sessões síncronas
+            flush_interval: Janela (s) para acumular operações antes de cada commit
+            max_batch: Máximo de operações por transação
+            retries: Novas tentativas do lote em erro operacional (ex: "database is locked")
+            retry_backoff_s: Espera antes da primeira nova tentativa (dobra a cada tentativa)
+        """
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.retries = retries
+        self.retry_backoff_s = retry_backoff_s
+
+        # key -> (fn, args, kwargs, on_commit). Operações com a mesma key são agrupadas (a mais nova vence)
+        self._pending = {}
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._task = None
+        self._closing = False
+
+        # Métricas
+        self.ops_total = 0
+        self.batches_total = 0
+        self.errors_total = 0
+        self.retries_total = 0
+        self.dropped_total = 0
+        self.coalesced_total = 0
+        self.last_commit_ms = 0.0
+        self.avg_commit_ms = 0.0
+        self.max_commit_ms = 0.0
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    def submit(self, fn, *args, key=None, on_commit=None, **kwargs):
+        """
+        Agenda `fn(db, *args, commit=False, **kwargs)` para o próximo lote.
+        As funções do crud usadas aqui devem aceitar o parâmetro `commit`.
+        on_commit: chamado (na thread do writer) depois que o lote com a operação foi commitado.
+        """
+        if key is None:
+            key = ("_", next(self._seq))
+        elif key in self._pending:
+            self.coalesced_total += 1
+        self._pending[key] = (fn, args, kwargs, on_commit)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        elif self._task is None:
+            # Writer não iniciado (ex: scripts): aplica na hora
+            self._commit_batch([(key, self._pending.pop(key))])
+
+    async def flush(self, timeout=30.0):
+        """Espera o commit de tudo que já foi agendado (ex: antes de ler o resultado final de um job)."""
+        if self._task is None: return
+        loop = asyncio.get_running_loop()
+        done = loop.create_future()
+        def _set(): done.done() or done.set_result(None)
+        self.submit(_noop, on_commit=lambda: loop.call_soon_threadsafe(_set))
+        try:
+            await asyncio.wait_for(done, timeout)
+        except asyncio.TimeoutError:
+            print("⚠️ DBWriter: flush expirou (lote com erro?)")
+
+    def _apply(self, ops):
+        """Todas as operações numa transação (caminho normal)."""
+        with self.session_factory() as db:
+            try:
+                for _, (fn, args, kwargs, _) in ops:
+                    fn(db, *args, commit=False, **kwargs)
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+        return ops
+
+    def _apply_each(self, ops):
+        """
+        Lote com erro que não é de lock: cada operação num savepoint, só a que falha é descartada.
+        Erro operacional aqui sobe para o retry do lote inteiro (nada foi commitado).
+        """
+        applied = []
+        with self.session_factory() as db:
+            try:
+                for item in ops:
+                    key, (fn, args, kwargs, _) = item
+                    try:
+                        with db.begin_nested():
+                            fn(db, *args, commit=False, **kwargs)
+                        applied.append(item)
+                    except Exception as e:
+                        if _transient(e): raise
+                        self.errors_total += 1
+                        self.dropped_total += 1
+                        print(f"❌ DBWriter: operação descartada {getattr(fn, '__name__', fn)} {key}: {e}")
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+        return applied
+
+    def _commit_batch(self, ops):
+        """
+        Aplica o lote e retorna as operações que não puderam ser gravadas (banco travado mesmo depois dos retries):
+        o loop as devolve para a fila em vez de perdê-las.
+        """
+        t0 = time.perf_counter()
+        apply = self._apply
+        attempt = 0
+        while True:
+            try:
+                ops = apply(ops)
+                break
+            except Exception as e:
+                self.errors_total += 1
+                if not _transient(e):
+                    if apply == self._apply_each:
+                        # Falha no commit final, fora de qualquer operação: nada a isolar
+                        self.dropped_total += len(ops)
+                        print(f"❌ DBWriter: lote de {len(ops)} operações descartado ({e}): {[k for k, _ in ops]}")
+                        return None
+                    print(f"⚠️ Erro no lote do DBWriter ({len(ops)} operações): {e}; aplicando uma a uma")
+                    apply = self._apply_each
+                    continue
+                if attempt == self.retries:
+                    print(f"❌ DBWriter: lote de {len(ops)} operações não gravado após {attempt + 1} tentativas ({e}); volta para a fila")
+                    return ops
+                self.retries_total += 1
+                time.sleep(self.retry_backoff_s * (2 ** attempt))
+                attempt += 1
+        for _, (*_, on_commit) in ops:
+            if on_commit is None: continue
+            try: on_commit()
+            except Exception as e: print(f"⚠️ Erro no callback do DBWriter: {e}")
+        elapsed = (time.perf_counter() - t0) * 1000
+        self.ops_total += len(ops)
+        self.batches_total += 1
+        self.last_commit_ms = elapsed
+        self.avg_commit_ms = elapsed if self.batches_total == 1 else 0.9 * self.avg_commit_ms + 0.1 * elapsed
+        self.max_commit_ms = max(self.max_commit_ms, elapsed)
+
+    def _take_batch(self):
+        keys = list(itertools.islice(self._pending, self.max_batch))
+        return [(k, self._pending.pop(k)) for k in keys]
+
+    def _requeue(self, ops):
+        """Devolve operações não gravadas; se a mesma key já foi reagendada, a versão mais nova vence."""
+        for key, op in ops:
+            self._pending.setdefault(key, op)
+
+    async def _run(self):
+        while not self._closing or self._pending:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            # Janela curta para agrupar as escritas que chegam juntas
+            if not self._closing:
+                await asyncio.sleep(self.flush_interval)
+            failed = await asyncio.to_thread(self._commit_batch, self._take_batch())
+            if failed and self._closing:
+                # Encerrando com o banco ainda travado: não segura o desligamento para sempre
+                self.dropped_total += len(failed)
+                print(f"❌ DBWriter: {len(failed)} operações perdidas no encerramento: {[k for k, _ in failed]}")
+            elif failed:
+                self._requeue(failed)
+                await asyncio.sleep(self.retry_backoff_s * (2 ** self.retries))
+
+    async def stop(self):
+        """Aplica o que ainda está pendente e encerra a task."""
+        if self._task is None: return
+        self._closing = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+        self._wakeup = None
+
+    def stats(self):
+        return {
+            "queue_depth": len(self._pending),
+            "ops_total": self.ops_total,
+            "batches_total": self.batches_total,
+            "coalesced_total": self.coalesced_total,
+            "errors_total": self.errors_total,
+            "retries_total": self.retries_total,
+            "dropped_total": self.dropped_total,
+            "last_commit_ms": round(self.last_commit_ms, 2),
+            "avg_commit_ms": round(self.avg_commit_ms, 2),
+            "max_commit_ms": round(self.max_commit_ms, 2),
+        }
+
+
+# Instância compartilhada por toda a API
+writer = DBWriter()
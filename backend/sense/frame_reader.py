@@ -0,0 +1,130 @@
+"""
+Leitor desacoplado do pipe do FFmpeg (Latest-Frame-Wins).
+Uma thread drena o pipe continuamente e mantém apenas os frames mais recentes,
+para que a análise nunca fique atrasada em relação ao tempo real.
+"""
+
+import subprocess
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class LatestFrameReader:
+    def __init__(self, command, width, height, window=1, restart_delay=0.5):
+        """
+        Args:
+            command: Comando do FFmpeg que escreve frames bgr24 no stdout
+            width, height: Resolução dos frames
+            window: Quantos frames recentes manter (1 = sempre o último)
+            restart_delay: Espera (s) antes de reabrir o pipe após falha de leitura
+        """
+        self.command = command
+        self.width = width
+        self.height = height
+        self.frame_size = width * height * 3
+        self.restart_delay = restart_delay
+
+        self._buffer = deque(maxlen=max(1, window))
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self.process = None
+
+        # Métricas
+        self.seq = 0
+        self.frames_read = 0
+        self.frames_dropped = 0
+        self.frames_processed = 0
+        self.restarts = 0
+        self.latency_ms = 0.0
+        self.max_latency_ms = 0.0
+        self._started_at = None
+
+    def _open(self):
+        self.process = subprocess.Popen(self.command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=0)
+
+    def _read_exact(self):
+        buf = bytearray(self.frame_size)
+        view = memoryview(buf)
+        pos = 0
+        while pos < self.frame_size:
+            n = self.process.stdout.readinto(view[pos:])
+            if not n: return None
+            pos += n
+        return buf
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                raw = self._read_exact()
+            except (ValueError, OSError):
+                raw = None
+
+            if raw is None:
+                if self._stop.is_set(): break
+                print("⚠️ Frame incompleto. Reiniciando pipe...")
+                self.restarts += 1
+                if self.process: self.process.terminate()
+                time.sleep(self.restart_delay)
+                self._open()
+                continue
+
+            ts = time.time()
+            with self._cond:
+                self.seq += 1
+                self.frames_read += 1
+                # Buffer cheio: o frame mais antigo é descartado explicitamente
+                if len(self._buffer) == self._buffer.maxlen:
+                    self.frames_dropped += 1
+                self._buffer.append((self.seq, ts, raw))
+                self._cond.notify()
+
+    def start(self):
+        self._started_at = time.time()
+        self._open()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def get(self, timeout=2.0):
+        """
+        Bloqueia até haver um frame e retorna (seq, ts, frame) do mais antigo da janela.
+        Retorna None em caso de timeout.
+        """
+        with self._cond:
+            if not self._buffer and not self._cond.wait_for(lambda: self._buffer or self._stop.is_set(), timeout):
+                return None
+            if not self._buffer: return None
+            seq, ts, raw = self._buffer.popleft()
+        frame = np.frombuffer(raw, np.uint8).reshape((self.height, self.width, 3))
+        return seq, ts, frame
+
+    def mark_processed(self, ts):
+        """Registra a latência ponta-a-ponta (captura -> fim da análise) de um frame."""
+        latency = (time.time() - ts) * 1000
+        self.frames_processed += 1
+        self.latency_ms = latency if self.frames_processed == 1 else 0.9 * self.latency_ms + 0.1 * latency
+        self.max_latency_ms = max(self.max_latency_ms, latency)
+
+    def stats(self):
+        elapsed = max(time.time() - (self._started_at or time.time()), 1e-6)
+        return {
+            "frames_read": self.frames_read,
+            "frames_processed": self.frames_processed,
+            "frames_dropped": self.frames_dropped,
+            "drop_rate": round(self.frames_dropped / self.frames_read, 3) if self.frames_read else 0.0,
+            "input_fps": round(self.frames_read / elapsed, 2),
+            "processed_fps": round(self.frames_processed / elapsed, 2),
+            "latency_ms": round(self.latency_ms, 1),
+            "max_latency_ms": round(self.max_latency_ms, 1),
+            "restarts": self.restarts,
+        }
+
+    def stop(self):
+        self._stop.set()
+        with self._cond: self._cond.notify_all()
+        if self.process: self.process.terminate()
+        if self._thread: self._thread.join(timeout=2.0)
@@ -159,4 +159,19 @@ def segments_intersect(p1, p2, p3, p4):
 
     # Verifica se os pontos p1 e p2 estão em lados opostos da linha p3-p4
     # E se p3 e p4 estão em lados opostos da linha p1-p2
-    return ccw(p1, p3, p4) != ccw(p2, p3, p4) and ccw(p1, p2, p3) != ccw(p1, p2, p4)
\ No newline at end of file
+    return ccw(p1, p3, p4) != ccw(p2, p3, p4) and ccw(p1, p2, p3) != ccw(p1, p2, p4)
+
+def segment_crossing_ratio(p1, p2, p3, p4):
+    """
+    Retorna a fração (0..1) do movimento p1->p2 em que a linha p3-p4 foi cruzada.
+    Usado para interpolar o instante do cruzamento entre dois frames.
+    """
+    x1, y1 = _get_xy(p1)
+    x2, y2 = _get_xy(p2)
+    x3, y3 = _get_xy(p3)
+    x4, y4 = _get_xy(p4)
+
+    denom = (x2 - x1) * (y4 - y3) - (y2 - y1) * (x4 - x3)
+    if denom == 0: return 1.0
+    t = ((x3 - x1) * (y4 - y3) - (y3 - y1) * (x4 - x3)) / denom
+    return max(0.0, min(1.0, t))
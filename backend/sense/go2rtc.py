@@ -0,0 +1,106 @@
+"""
+Cliente assíncrono para a API do Go2RTC.
+Centraliza pool de conexões, timeouts, retry com backoff e cache de streams registradas,
+para que nenhuma rota ou pipeline bloqueie o event loop (ou uma thread do pool) esperando o Go2RTC.
+"""
+
+import asyncio
+
+import httpx
+
+from . import config
+
+
+class Go2RTCError(Exception):
+    pass
+
+
+class Go2RTCClient:
+    def __init__(self, base_url=None, timeout=5.0, retries=3, backoff=0.5, max_connections=20, transport=None):
+        """
+        Args:
+            base_url: URL base da API (ex: http://sense_go2rtc:1984/api)
+            timeout: Timeout (s) de cada requisição
+            retries: Tentativas extras em caso de erro de rede ou 5xx
+            backoff: Espera inicial (s) entre tentativas, dobrada a cada falha
+            transport: Transporte httpx alternativo (ex: httpx.MockTransport nos testes)
+        """
+        self.base_url = (base_url or config.GO2RTC_API).rstrip('/')
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections // 2)
+        self.transport = transport
+        self._client = None
+        # Cache de registros: stream_name -> src (evita PUTs repetidos)
+        self._registered = {}
+
+    def _get_client(self):
+        # Criado sob demanda para ficar atrelado ao event loop em execução
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=self.limits, transport=self.transport)
+        return self._client
+
+    async def _request(self, method, path, params=None, retries=None):
+        retries = self.retries if retries is None else retries
+        delay = self.backoff
+        last_error = None
+        for attempt in range(retries + 1):
+            try:
+                res = await self._get_client().request(method, path, params=params)
+                if res.status_code == 404:
+                    # Stream desconhecida: o Go2RTC reiniciou (ou perdeu a config) e os registros do cache não valem mais
+                    self.invalidate()
+                if res.status_code < 500:
+                    return res
+                last_error = Go2RTCError(f"{method} {path} -> {res.status_code}")
+            except httpx.HTTPError as e:
+                last_error = e
+            if attempt < retries:
+                await asyncio.sleep(delay)
+                delay *= 2
+        raise Go2RTCError(str(last_error))
+
+    async def ensure_stream(self, name, src, force=False):
+        """Registra a stream no Go2RTC apenas se ainda não foi registrada com o mesmo src."""
+        if not force and self._registered.get(name) == src:
+            return True
+        res = await self._request("PUT", "/streams", params={"src": src, "name": name})
+        if res.status_code in (200, 201):
+            self._registered[name] = src
+            return True
+        print(f"⚠️ Aviso: Go2RTC retornou {res.status_code} - {res.text}")
+        return False
+
+    async def get_frame(self, name, attempts=5, wait=1.0):
+        """
+        Busca um snapshot JPEG da stream. Se a stream estava parada, o Go2RTC demora
+        alguns segundos para ter frame: tenta novamente sem bloquear o event loop.
+        """
+        for attempt in range(attempts):
+            try:
+                res = await self._request("GET", "/frame.jpeg", params={"src": name}, retries=0)
+                if res.status_code == 200:
+                    return res.content
+                print(f"⏳ Go2RTC ainda não tem frame (Status {res.status_code}). Aguardando...")
+            except Go2RTCError as e:
+                print(f"❌ Erro na requisição ao Go2RTC: {e}")
+            if attempt < attempts - 1:
+                await asyncio.sleep(wait)
+
+        # Go2RTC pode ter reiniciado e perdido o registro
+        self.invalidate(name)
+        return None
+
+    def invalidate(self, name=None):
+        if name is None: self._registered.clear()
+        else: self._registered.pop(name, None)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# Instância compartilhada (pool único de conexões para toda a API)
+client = Go2RTCClient()
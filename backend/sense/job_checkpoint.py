@@ -0,0 +1,99 @@
+"""
+Checkpoints dos jobs offline: a cada JOB_CHECKPOINT_S o processamento fecha o segmento de vídeo de saída
+atual (um mp4 válido), grava a posição do decoder, o estado da contagem, o offset do log de eventos e as
+caixas recentes dos tracks, e abre um novo segmento. Se o servidor cair, o job volta para a fila e retoma
+do último checkpoint; no final os segmentos são concatenados sem recodificar (ffmpeg concat -c copy).
+
+Arquivos em config.CHECKPOINT_DIR/jobs/{video_id}/:
+    state.json      último checkpoint (gravação atômica + fsync)
+    part_NNNN.mp4   segmentos do vídeo de saída já fechados
+    chunks/         resultados dos segmentos do modo paralelo (reaproveitados na retomada)
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import time
+
+from . import config
+
+STATE_VERSION = 1
+
+
+class JobCheckpoint:
+    def __init__(self, video_id, cfg_hash, directory=None):
+        self.video_id = video_id
+        self.cfg_hash = cfg_hash
+        self.directory = os.path.join(directory or config.CHECKPOINT_DIR, "jobs", video_id)
+        self.state_path = os.path.join(self.directory, "state.json")
+        self.chunk_dir = os.path.join(self.directory, "chunks")
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Métricas
+        self.saves_total = 0
+        self.last_save_ms = 0.0
+
+    def load(self):
+        """Último checkpoint válido para esta configuração de linhas, ou None (descarta checkpoints de outra config)."""
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if state.get("version") != STATE_VERSION or state.get("cfg_hash") != self.cfg_hash \
+                or not all(os.path.exists(p) for p in self.parts(state)):
+            self.reset()
+            return None
+        return state
+
+    def part_path(self, index):
+        return os.path.join(self.directory, f"part_{index:04d}.mp4")
+
+    def parts(self, state):
+        return [self.part_path(i) for i in range(state.get("parts", 0))]
+
+    def save(self, state):
+        """Grava o checkpoint (tmp + fsync + rename). Os segmentos listados já devem estar fechados."""
+        t0 = time.perf_counter()
+        data = json.dumps(dict(state, version=STATE_VERSION, cfg_hash=self.cfg_hash, saved_at=time.time()))
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.state_path)
+        self.saves_total += 1
+        self.last_save_ms = (time.perf_counter() - t0) * 1000
+
+    def concat(self, parts, out_path):
+        """Junta os segmentos em `out_path` sem recodificar. Bloqueante: rodar em thread."""
+        parts = [p for p in parts if os.path.exists(p) and os.path.getsize(p) > 0]
+        if not parts:
+            raise RuntimeError("Nenhum segmento de vídeo para concatenar")
+        if len(parts) == 1:
+            shutil.move(parts[0], out_path)
+            return
+        list_path = os.path.join(self.directory, "concat.txt")
+        with open(list_path, "w", encoding="utf-8") as f:
+            for p in parts:
+                f.write(f"file '{os.path.abspath(p)}'\n")
+        tmp = out_path + ".tmp.mp4"
+        cmd = ['ffmpeg', '-v', 'error', '-f', 'concat', '-safe', '0', '-i', list_path, '-c', 'copy', '-movflags', '+faststart', '-y', tmp]
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            try: os.remove(tmp)
+            except OSError: pass
+            raise RuntimeError(f"ffmpeg concat falhou: {proc.stderr.strip()[-300:]}")
+        os.replace(tmp, out_path)
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def reset(self):
+        """Descarta o checkpoint (inclusive os segmentos do modo paralelo) e recomeça do zero."""
+        self.clear()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def stats(self):
+        return {"saves_total": self.saves_total, "last_save_ms": round(self.last_save_ms, 2)}
@@ -0,0 +1,244 @@
+"""
+Fila persistente de processamento offline (tabela jobs) com pool limitado de workers.
+Os jobs sobrevivem a reinícios (os que estavam rodando voltam para a fila), são executados
+por prioridade e ordem de chegada, podem ser cancelados e informam posição/ETA na fila.
+
+A inferência é compartilhada com as câmeras ao vivo: o InferenceGate limita quantos frames
+rodam ao mesmo tempo e sempre atende primeiro quem tem maior prioridade (câmeras ao vivo).
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+
+from . import config, db_writer
+import crud, crud_async
+from database import AsyncSessionLocal
+
+# Prioridades (menor = antes)
+PRIORITY_LIVE = 0
+PRIORITY_UPLOAD = 10
+PRIORITY_BATCH = 20 # Lotes não passam na frente de uploads avulsos
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class InferenceGate:
+    """Semáforo com prioridade: quando há disputa, os slots liberados vão para o menor `priority`."""
+
+    def __init__(self, slots):
+        self.slots = slots
+        self.in_use = 0
+        self._waiters = []
+        self._seq = itertools.count()
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+    @asynccontextmanager
+    async def slot(self, priority):
+        await self._acquire(priority)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, priority):
+        if self.in_use < self.slots and not self._waiters:
+            self.in_use += 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            # Slot já repassado para este waiter: devolve
+            if fut.done() and not fut.cancelled():
+                self._release()
+            raise
+
+    def _release(self):
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None) # O slot passa direto para o próximo (in_use não muda)
+                return
+        self.in_use -= 1
+
+
+class JobQueue:
+    def __init__(self, workers=None, default_fps=None):
+        """
+        Args:
+            workers: Quantidade de jobs processados em paralelo
+            default_fps: Estimativa inicial de frames/s por worker (ETA antes da primeira medição)
+        """
+        self.workers = workers or config.JOB_WORKERS
+        self.fps = default_fps or config.JOB_DEFAULT_FPS
+
+        # Definidos pela API: handler(job, processor, cancel_event), fábrica de processors por worker
+        # e on_finished(job, status), chamado depois que o status final foi gravado
+        self.handler = None
+        self.processor_factory = None
+        self.on_finished = None
+
+        self._cancel = {} # job_id -> asyncio.Event dos jobs em execução
+        self._claiming = 0 # Workers dentro de claim_next_job
+        self._pending_cancel = set() # Cancelados durante um claim, antes do evento ser registrado
+        self._tasks = []
+        self._wakeup = None
+
+        # Métricas
+        self.completed_total = 0
+        self.failed_total = 0
+        self.cancelled_total = 0
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        async with AsyncSessionLocal() as db:
+            n = await crud_async.requeue_running_jobs(db)
+        if n:
+            print(f"♻️ {n} jobs interrompidos voltaram para a fila.")
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        print(f"🧵 Fila de jobs iniciada com {self.workers} worker(s).")
+        return self
+
+    async def stop(self):
+        # Jobs em execução ficam como running no banco e voltam para a fila no próximo start
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        """Novo job na fila: acorda os workers ociosos."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def cancel(self, job_id):
+        """Cancela um job na fila (na hora) ou em execução (no próximo frame). Retorna o novo status."""
+        async with AsyncSessionLocal() as db:
+            if await crud_async.cancel_queued_job(db, job_id):
+                self.cancelled_total += 1
+                return "cancelled"
+        if job_id in self._cancel:
+            self._cancel[job_id].set()
+            return "cancelling"
+        if self._claiming:
+            # Pode ter acabado de ser reivindicado por um worker que ainda não registrou o evento
+            self._pending_cancel.add(job_id)
+            return "cancelling"
+        return None
+
+    def record_fps(self, fps):
+        if fps > 0:
+            self.fps = 0.8 * self.fps + 0.2 * fps
+
+    async def _worker(self, idx):
+        while True:
+            job = None
+            self._claiming += 1
+            try:
+                async with AsyncSessionLocal() as db:
+                    job = await crud_async.claim_next_job(db)
+                    # Evento registrado antes de qualquer outro await: cancel() já encontra o job
+                    if job is not None:
+                        cancel_event = self._cancel[job.id] = asyncio.Event()
+                        if job.id in self._pending_cancel: cancel_event.set()
+            except Exception as e:
+                print(f"❌ Worker {idx}: erro ao consultar a fila: {e}")
+                job = None
+            finally:
+                self._claiming -= 1
+                if not self._claiming: self._pending_cancel.clear()
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=30.0)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            print(f"▶️ Worker {idx}: job {job.id} (vídeo {job.video_id}, prioridade {job.priority})")
+            status, error = "done", None
+            t0 = time.time()
+            try:
+                # Tracker novo a cada job (o fork só copia referências para YOLO/ReID)
+                processor = await asyncio.to_thread(self.processor_factory) if self.processor_factory else None
+                await self.handler(job, processor, cancel_event)
+            except JobCancelled:
+                status = "cancelled"
+            except asyncio.CancelledError:
+                # Servidor desligando: o job volta para a fila no próximo start
+                raise
+            except Exception as e:
+                status, error = "failed", str(e)[:500]
+                print(f"❌ Job {job.id} falhou: {e}")
+            finally:
+                self._cancel.pop(job.id, None)
+
+            if status == "done":
+                self.completed_total += 1
+                if job.frames_total:
+                    self.record_fps(job.frames_total / max(time.time() - t0, 1e-3))
+            elif status == "failed":
+                self.failed_total += 1
+            else:
+                self.cancelled_total += 1
+            # Erro transitório aqui (ex: "database is locked") não pode matar o worker: com JOB_WORKERS=1 a fila pararia.
+            # Na falha o status final vai pelo writer write-behind, que tenta de novo até gravar
+            fields = {"status": status, "error": error}
+            if status == "done": fields["progress"] = 100.0
+            try:
+                async with AsyncSessionLocal() as db:
+                    await crud_async.update_job(db, job.id, **fields)
+            except Exception as e:
+                print(f"❌ Worker {idx}: falha ao gravar o status do job {job.id} ({status}): {e}; reagendado no DBWriter")
+                db_writer.writer.submit(crud.update_job, job.id, key=("job_final", job.id), **fields)
+            if self.on_finished:
+                try:
+                    await self.on_finished(job, status)
+                except Exception as e:
+                    print(f"⚠️ Pós-processamento do job {job.id} falhou: {e}")
+
+    async def position(self, job_id):
+        """Posição na fila (0 = em execução) e ETA (s) para começar e terminar."""
+        async with AsyncSessionLocal() as db:
+            active = await crud_async.get_queue_snapshot(db)
+
+        rate = self.fps * self.workers
+        ahead_frames, queued_ahead = 0.0, 0
+        for jid, status, _, frames_total, progress in active:
+            remaining = (frames_total or 0) * (1 - (progress or 0) / 100)
+            if jid == job_id:
+                if status == "running":
+                    return {"position": 0, "eta_start_s": 0, "eta_done_s": round(remaining / self.fps, 1) if self.fps else None}
+                eta_start = ahead_frames / rate if rate else None
+                return {
+                    "position": queued_ahead + 1,
+                    "eta_start_s": round(eta_start, 1) if eta_start is not None else None,
+                    "eta_done_s": round(eta_start + remaining / self.fps, 1) if eta_start is not None and self.fps else None,
+                }
+            ahead_frames += remaining
+            if status == "queued": queued_ahead += 1
+        return None
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "running": list(self._cancel),
+            "fps_estimate": round(self.fps, 2),
+            "completed_total": self.completed_total,
+            "failed_total": self.failed_total,
+            "cancelled_total": self.cancelled_total,
+            "inference_slots": {"slots": gate.slots, "in_use": gate.in_use, "waiting": gate.waiting},
+        }
+
+
+gate = InferenceGate(config.INFERENCE_SLOTS)
+queue = JobQueue()
@@ -0,0 +1,98 @@
+"""
+Canal publish/subscribe por câmera para as contagens ao vivo.
+O loop ao vivo publica as contagens em memória e os assinantes (WebSockets) recebem
+atualizações agrupadas a uma taxa fixa, sem consultar o banco.
+"""
+
+import asyncio
+import copy
+import time
+from datetime import datetime
+
+from . import config
+
+
+class LiveChannel:
+    def __init__(self, device_id, rate_hz=None, queue_size=16):
+        self.device_id = device_id
+        self.interval = 1.0 / (rate_hz or config.LIVE_PUSH_HZ)
+        self.queue_size = queue_size
+        self.subscribers = set()
+
+        self.status = "offline"
+        self.counts = None
+        self._last_sent = None
+        self._pending_events = []
+        self._last_flush = 0.0
+        self._flush_task = None
+
+    def subscribe(self):
+        q = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        self.subscribers.discard(q)
+
+    def snapshot(self):
+        """Mensagem no mesmo formato do endpoint /live_stats."""
+        msg = {"type": "stats", "status": self.status, "data": copy.deepcopy(self.counts) or {}}
+        if self.status == "online":
+            msg["server_time"] = datetime.now().strftime("%H:%M:%S")
+        return msg
+
+    def set_status(self, status, counts=None):
+        self.status = status
+        if counts is not None:
+            self.counts = copy.deepcopy(counts)
+        self._broadcast(self.snapshot())
+
+    def publish(self, counts, events=None):
+        """Chamado a cada frame pelo loop ao vivo: só agenda o envio, nunca bloqueia."""
+        self.counts = counts
+        if not self.subscribers:
+            return
+        if events:
+            self._pending_events.extend(events)
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    def _delta(self, counts):
+        delta = {}
+        for key, values in counts.items():
+            if not isinstance(values, dict): continue
+            prev = (self._last_sent or {}).get(key, {})
+            diff = {k: v - prev.get(k, 0) for k, v in values.items() if v != prev.get(k, 0)}
+            if diff: delta[key] = diff
+        return delta
+
+    async def _flush_later(self):
+        try:
+            wait = self._last_flush + self.interval - time.monotonic()
+            if wait > 0: await asyncio.sleep(wait)
+
+            msg = self.snapshot()
+            msg["delta"] = self._delta(self.counts or {})
+            msg["events"] = self._pending_events
+            self._pending_events = []
+            self._last_sent = copy.deepcopy(self.counts)
+            self._last_flush = time.monotonic()
+            self._broadcast(msg)
+        finally:
+            self._flush_task = None
+
+    def _broadcast(self, msg):
+        for q in list(self.subscribers):
+            # Assinante lento: descarta a mensagem mais antiga em vez de acumular
+            if q.full():
+                try: q.get_nowait()
+                except asyncio.QueueEmpty: pass
+            q.put_nowait(msg)
+
+
+channels = {}
+
+def get_channel(device_id):
+    if device_id not in channels:
+        channels[device_id] = LiveChannel(device_id)
+    return channels[device_id]
@@ -3,15 +3,17 @@ import cv2
 import time
 import os
 import json
-import requests
+import copy
 import subprocess
 import numpy as np
 import traceback
-from datetime import datetime
-from sqlalchemy.orm import Session
-from . import config, video_process, geometry
-import crud, models
-from database import SessionLocal
+import heapq
+import functools
+from datetime import datetime, timedelta
+from . import config, video_process, geometry, counting, frame_reader, go2rtc, live_channel, shm_ring, db_writer, scheduler, checkpoint, jobs
+import crud
+from database import AsyncSessionLocal
+import crud_async
 
 # Filas para transmissão de vídeo processado (MJPEG)
 monitor_queues = {} 
@@ -19,108 +21,229 @@ monitor_queues = {}
 active_tasks = {}
 stop_signals = {} 
 
+# Métricas por câmera (frames descartados, latência ponta-a-ponta)
+camera_metrics = {}
+
+# Sessão (video_id) atual de cada câmera: leitura O(1) pelos endpoints ao vivo
+current_sessions = {}
+
+async def _stop_camera(device_id, timeout=5.0):
+    """Sinaliza a parada da câmera, aguarda o loop encerrar e limpa o estado em memória."""
+    if device_id in stop_signals:
+        stop_signals[device_id].set()
+    task = active_tasks.get(device_id)
+    if task is not None:
+        try:
+            await asyncio.wait_for(task, timeout=timeout)
+        except: pass
+    active_tasks.pop(device_id, None)
+    stop_signals.pop(device_id, None)
+    monitor_queues.pop(device_id, None)
+
 async def restart_camera(device_id):
     """
-    Força a parada de uma câmera. 
-    O Scheduler (Self-Healing) detectará que ela parou e a reiniciará automaticamente 
-    no próximo ciclo (dentro de ~10s) com as novas configurações do banco.
+    Força a parada de uma câmera e avisa o scheduler, que recarrega o Device do banco
+    e a reinicia imediatamente (se estiver dentro do horário) com as novas configurações.
     """
     if device_id in stop_signals:
         print(f"🔄 Reiniciando Câmera {device_id} para aplicar novas configurações...")
-        stop_signals[device_id].set()
-        
-        if device_id in active_tasks:
-            try:
-                # Aguarda brevemente para garantir que o loop anterior encerre
-                await asyncio.wait_for(active_tasks[device_id], timeout=2.0)
-            except: pass
-            del active_tasks[device_id]
-        
-        if device_id in stop_signals: del stop_signals[device_id]
-        if device_id in monitor_queues: del monitor_queues[device_id]
+        await _stop_camera(device_id, timeout=2.0)
+    notify_device_changed(device_id)
 
-def get_stream_resolution(rtsp_url):
+def probe_stream(rtsp_url, transport='tcp'):
+    """
+    Probe completo da stream (resolução, codec, fps). Caro: só é chamado quando
+    não há metadados salvos no Device ou quando a decodificação falha.
+    A stream sondada é o restream local do Go2RTC (TCP), não a câmera: o transporte
+    da câmera fica por conta do Go2RTC.
+    """
     try:
-        cmd = ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "stream=width,height", "-of", "csv=p=0", rtsp_url]
-        output = subprocess.check_output(cmd, stderr=subprocess.DEVNULL).decode().strip()
-        if output:
-            parts = output.split(',')
-            if len(parts) >= 2:
-                w, h = int(parts[0]), int(parts[1])
-                if w > 0 and h > 0: return w, h
+        cmd = ["ffprobe", "-v", "error", "-rtsp_transport", transport, "-select_streams", "v:0",
+               "-show_entries", "stream=width,height,codec_name,avg_frame_rate", "-of", "json", rtsp_url]
+        output = subprocess.check_output(cmd, stderr=subprocess.DEVNULL, timeout=15).decode()
+        streams = json.loads(output).get("streams", [])
+        if streams:
+            st = streams[0]
+            w, h = int(st.get("width", 0)), int(st.get("height", 0))
+            num, _, den = st.get("avg_frame_rate", "0/1").partition('/')
+            fps = float(num) / float(den) if den and float(den) else None
+            if w > 0 and h > 0:
+                return {"width": w, "height": h, "codec": st.get("codec_name"), "fps": fps}
     except: pass
     try:
         cap = cv2.VideoCapture(rtsp_url)
         if cap.isOpened():
             w, h = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            fps = cap.get(cv2.CAP_PROP_FPS) or None
             cap.release()
-            if w > 0 and h > 0: return w, h
+            if w > 0 and h > 0: return {"width": w, "height": h, "codec": None, "fps": fps}
     except: pass
-    return 1920, 1080
+    return None
+
+async def get_stream_metadata(device_id, rtsp_url):
+    """Usa os metadados salvos no Device; só faz probe (fora do event loop) se ainda não existirem."""
+    async with AsyncSessionLocal() as db:
+        meta = await crud_async.get_stream_metadata(db, device_id)
+    if meta:
+        return meta
+
+    print(f"🔎 Sem metadados salvos para Câmera {device_id}. Executando probe...")
+    meta = await asyncio.to_thread(probe_stream, rtsp_url)
+    if not meta:
+        return {"width": 1920, "height": 1080, "codec": None, "fps": None}
+    async with AsyncSessionLocal() as db:
+        await crud_async.save_stream_metadata(db, device_id, meta)
+    return meta
+
+_revalidating = set()
+
+async def revalidate_stream(device_id, rtsp_url):
+    """Re-probe em background quando a decodificação falha (ex: câmera mudou de resolução)."""
+    if device_id in _revalidating: return
+    _revalidating.add(device_id)
+    try:
+        meta = await asyncio.to_thread(probe_stream, rtsp_url)
+        if meta:
+            async with AsyncSessionLocal() as db:
+                await crud_async.save_stream_metadata(db, device_id, meta)
+            print(f"🔎 Metadados da Câmera {device_id} revalidados: {meta['width']}x{meta['height']} {meta['codec']}")
+    except Exception as e:
+        print(f"⚠️ Falha ao revalidar stream da Câmera {device_id}: {e}")
+    finally:
+        _revalidating.discard(device_id)
+
+# --- SCHEDULER ---
+# Heap de (próxima transição, device_id, geração). Entradas com geração antiga são ignoradas.
+_schedule_heap = []
+_schedule_gen = {}
+# Câmeras cujo Device mudou (None = recarregar todas) e evento para acordar o scheduler
+_changed_devices = set()
+_scheduler_wakeup = None
+# Próxima tentativa de reinício de câmeras que caíram dentro do horário
+_retry_at = {}
+
+def notify_device_changed(device_id=None):
+    """Avisa o scheduler que o Device mudou (config, remoção, tarefa encerrada). Sem device_id = todos."""
+    _changed_devices.add(device_id)
+    if _scheduler_wakeup is not None:
+        _scheduler_wakeup.set()
+
+def _on_task_done(device_id, task):
+    if task.cancelled(): return
+    exc = task.exception()
+    if exc:
+        print(f"⚠️ Tarefa da Câmera {device_id} caiu com erro: {exc}")
+    # Parada pedida (fim do horário / restart): quem parou já cuida do estado
+    if device_id in stop_signals and stop_signals[device_id].is_set(): return
+    # Self-Healing: o scheduler decide se reinicia (ainda dentro do horário) ou só limpa
+    if active_tasks.get(device_id) is task:
+        notify_device_changed(device_id)
+
+def _start_camera(dev, processor_ref):
+    stop_event = asyncio.Event()
+    stop_signals[dev.id] = stop_event
+    monitor_queues[dev.id] = asyncio.Queue(maxsize=2)
+    schedule = scheduler.Schedule.from_device(dev)
+    task = asyncio.create_task(run_live_camera_ffmpeg(dev.id, dev.rtsp_url, dev.lines_config, stop_event, processor_ref, schedule))
+    task.add_done_callback(lambda t, dev_id=dev.id: _on_task_done(dev_id, t))
+    active_tasks[dev.id] = task
+
+async def _reconcile(dev_id, dev, processor_ref, now):
+    """Aplica o estado esperado (ativa/parada) da câmera e agenda sua próxima transição."""
+    task = active_tasks.get(dev_id)
+    if task is not None and task.done():
+        print(f"♻️ Câmera {dev_id} limpa da memória e pronta para reiniciar.")
+        await _stop_camera(dev_id)
+        # Encerrou sozinha dentro do horário: espera um pouco antes de reiniciar (evita loop de falhas)
+        _retry_at[dev_id] = now + timedelta(seconds=config.SCHEDULER_RETRY_S)
+
+    schedule = scheduler.Schedule.from_device(dev) if dev is not None and dev.is_configured else None
+    is_time = schedule is not None and schedule.is_active(now)
+    next_at = schedule.next_transition(now) if schedule is not None else None
+
+    if is_time and dev_id not in active_tasks:
+        retry_at = _retry_at.get(dev_id)
+        if retry_at and retry_at > now:
+            next_at = min(next_at, retry_at) if next_at else retry_at
+        else:
+            _retry_at.pop(dev_id, None)
+            print(f"▶️ Iniciando: {dev.name} ({now:%a %H:%M} dentro de {dev.processing_start_time}-{dev.processing_end_time})")
+            _start_camera(dev, processor_ref)
+
+    elif not is_time and dev_id in active_tasks:
+        name = dev.name if dev is not None else dev_id
+        print(f"⏹️ Parando: {name} (Fora do horário)")
+        _retry_at.pop(dev_id, None)
+        await _stop_camera(dev_id)
+
+    gen = _schedule_gen.get(dev_id, 0) + 1
+    _schedule_gen[dev_id] = gen
+    if next_at is not None:
+        heapq.heappush(_schedule_heap, (next_at, dev_id, gen))
+
+async def _load_devices(device_ids):
+    """Recarrega do banco os Devices alterados ({None} = todos os configurados)."""
+    async with AsyncSessionLocal() as db:
+        if None in device_ids:
+            devices = {d.id: d for d in await crud_async.get_devices(db, configured_only=True)}
+            # Câmeras que saíram da lista (removidas/desconfiguradas) também precisam ser paradas
+            for dev_id in set(active_tasks) | set(_schedule_gen):
+                devices.setdefault(dev_id, None)
+            return devices
+        return {dev_id: await crud_async.get_device(db, dev_id) for dev_id in device_ids}
 
 async def scheduler_loop(processor_ref):
+    """
+    Scheduler orientado a eventos: calcula a próxima transição (início/fim) de cada câmera,
+    dorme até a mais próxima e acorda na hora exata ou quando notify_device_changed() é chamado.
+    """
+    global _scheduler_wakeup
     print("⏰ Scheduler de Câmeras Iniciado (Modo Self-Healing).")
+    _scheduler_wakeup = asyncio.Event()
+    notify_device_changed()
+
     while True:
         try:
-            # 1. Limpeza de tarefas mortas (Self-Healing)
-            for dev_id in list(active_tasks.keys()):
-                task = active_tasks[dev_id]
-                if task.done():
-                    try:
-                        exc = task.exception()
-                        if exc:
-                            print(f"⚠️ Tarefa da Câmera {dev_id} caiu com erro: {exc}")
-                        else:
-                            print(f"ℹ️ Tarefa da Câmera {dev_id} finalizou normalmente.")
-                    except: pass
-                    
-                    if dev_id in active_tasks: del active_tasks[dev_id]
-                    if dev_id in stop_signals: del stop_signals[dev_id]
-                    if dev_id in monitor_queues: del monitor_queues[dev_id]
-                    print(f"♻️ Câmera {dev_id} limpa da memória e pronta para reiniciar.")
-
-            # 2. Verificação de Agendamento
-            db = SessionLocal()
-            devices = db.query(models.Device).filter(models.Device.is_configured == True).all()
+            _scheduler_wakeup.clear()
             now = datetime.now()
-            current_time_str = now.strftime("%H:%M")
-            
-            for dev in devices:
-                if not dev.processing_start_time or not dev.processing_end_time or not dev.lines_config:
-                    continue
-                
-                start, end = dev.processing_start_time, dev.processing_end_time
-                is_time = start <= current_time_str < end
-                
-                # INICIAR
-                if is_time and dev.id not in active_tasks:
-                    print(f"▶️ Iniciando: {dev.name} ({current_time_str} dentro de {start}-{end})")
-                    stop_event = asyncio.Event()
-                    stop_signals[dev.id] = stop_event
-                    
-                    monitor_queues[dev.id] = asyncio.Queue(maxsize=2)
-                    
-                    task = asyncio.create_task(run_live_camera_ffmpeg(dev.id, dev.rtsp_url, dev.lines_config, stop_event, processor_ref))
-                    active_tasks[dev.id] = task
-
-                # PARAR
-                elif not is_time and dev.id in active_tasks:
-                    print(f"⏹️ Parando: {dev.name} (Fora do horário {start}-{end})")
-                    stop_signals[dev.id].set()
-                    try:
-                        await asyncio.wait_for(active_tasks[dev.id], timeout=5.0)
-                    except: pass
-                    
-                    if dev_id in active_tasks: del active_tasks[dev_id]
-                    if dev_id in stop_signals: del stop_signals[dev_id]
-                    if dev_id in monitor_queues: del monitor_queues[dev_id]
 
-            db.close()
+            # 1. Câmeras alteradas (config, remoção, tarefa caiu): recarrega só essas do banco
+            if _changed_devices:
+                changed = set(_changed_devices)
+                _changed_devices.clear()
+                for dev_id, dev in (await _load_devices(changed)).items():
+                    await _reconcile(dev_id, dev, processor_ref, now)
+
+            # 2. Transições vencidas
+            due = set()
+            while _schedule_heap and _schedule_heap[0][0] <= now:
+                _, dev_id, gen = heapq.heappop(_schedule_heap)
+                if _schedule_gen.get(dev_id) == gen: due.add(dev_id)
+            if due:
+                for dev_id, dev in (await _load_devices(due)).items():
+                    await _reconcile(dev_id, dev, processor_ref, now)
+
+            # Descarta entradas obsoletas do topo do heap
+            while _schedule_heap and _schedule_gen.get(_schedule_heap[0][1]) != _schedule_heap[0][2]:
+                heapq.heappop(_schedule_heap)
+
         except Exception as e:
             print(f"❌ Erro Crítico no Scheduler: {e}")
             traceback.print_exc()
-        
-        await asyncio.sleep(3)
+            await asyncio.sleep(config.SCHEDULER_RETRY_S)
+            notify_device_changed()
+            continue
+
+        # 3. Dorme até a próxima transição (limitado para tolerar ajustes no relógio do sistema)
+        timeout = config.SCHEDULER_MAX_SLEEP_S
+        if _schedule_heap:
+            timeout = min(timeout, max(0.0, (_schedule_heap[0][0] - datetime.now()).total_seconds()))
+        if _changed_devices:
+            continue
+        try:
+            await asyncio.wait_for(_scheduler_wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
 
 def draw_visuals(frame, tracks, line_ent, line_pass, counts, fps):
     # Desenha Linhas
@@ -154,43 +277,88 @@ def draw_visuals(frame, tracks, line_ent, line_pass, counts, fps):
 
     return frame
 
-async def run_live_camera_ffmpeg(device_id, rtsp_url, lines_config, stop_event, processor_ref):
-    db = SessionLocal()
+def _tracker_epoch(processor):
+    """Identifica a instância do tracker: IDs de track só são comparáveis dentro dela."""
+    return f"{os.getpid()}:{id(getattr(processor, 'tracker', processor))}"
+
+async def _register_stream(stream_name, rtsp_url):
+    try:
+        await go2rtc.client.ensure_stream(stream_name, rtsp_url)
+    except go2rtc.Go2RTCError as e:
+        print(f"⚠️ Erro ao registrar stream no Go2RTC: {e}")
+
+def _session_started_at(video_id):
+    """Início da sessão ao vivo pelo id (live_{device}_{YYYYmmdd_HHMMSS}, hora local)."""
+    try:
+        return datetime.strptime("".join(video_id.rsplit("_", 2)[-2:]), "%Y%m%d%H%M%S")
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+def _in_window(video_id, window_start):
+    started = _session_started_at(video_id)
+    return window_start is not None and started is not None and started >= window_start
+
+async def run_live_camera_ffmpeg(device_id, rtsp_url, lines_config, stop_event, processor_ref, schedule=None):
     video_id = f"live_{device_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-    process = None
+    reader = None
+    counter = None
+    ckpt = None
+    epoch = None
+    pending_deltas = {}
+    stream_name = f"camera_{device_id}"
     
     try:
         # Configuração Go2RTC
-        stream_name = f"camera_{device_id}"
-        go2rtc_api = "http://sense_go2rtc:1984/api/streams"
-        try:
-            requests.put(go2rtc_api, params={"src": rtsp_url, "name": stream_name}, timeout=5)
-        except: pass
+        await _register_stream(stream_name, rtsp_url)
 
-        local_rtsp = f"rtsp://sense_go2rtc:8554/{stream_name}"
+        local_rtsp = f"{config.GO2RTC_RTSP}/{stream_name}"
         
         # 1. Recupera Contagem Anterior (Persistência)
-        last_results = crud.get_latest_live_results(db, device_id)
+        # O checkpoint local (journal + snapshot) é mais recente que o snapshot de totais do banco
+        ckpt = checkpoint.CounterCheckpoint(device_id)
+        restored = await asyncio.to_thread(ckpt.load)
+        async with AsyncSessionLocal() as db:
+            latest = await crud_async.get_latest_live_session(db, device_id)
+        last_results = latest.results if latest else None
+
+        # Só continua a contagem de uma sessão da janela atual do agendamento (reinício/queda no meio do horário);
+        # uma janela nova começa do zero
+        window_start = schedule.window_start() if schedule is not None else None
+        if latest is not None and not _in_window(latest.id, window_start):
+            last_results = None
         
-        initial_stats = {"total_geral": {"Total": 0}, "entrantes": {"Person": 0, "Total": 0}, "passantes": {"Person": 0, "Total": 0}}
+        initial_stats = counting.empty_counts()
+        track_states = None
         
-        if last_results:
+        if restored and _in_window(restored["video_id"], window_start) and (latest is None or restored["video_id"] == latest.id):
+            # Checkpoint é a continuação da última sessão: contagem exata até o último evento
+            initial_stats = restored["counts"]
+            # Tracks em andamento só valem com o mesmo tracker (mesmo processo) e checkpoint recente
+            if restored["epoch"] == _tracker_epoch(processor_ref.get("processor")) and time.time() - restored["saved_at"] <= config.CHECKPOINT_TRACK_TTL_S:
+                track_states = restored["track_states"]
+            print(f"♻️ Checkpoint da Câmera {device_id} restaurado em {ckpt.restore_ms:.1f}ms "
+                  f"({len(track_states or {})} tracks em andamento)")
+        elif last_results:
             print(f"♻️ Restaurando histórico da Câmera {device_id}: {last_results['total_geral']}")
             # Copia os dados anteriores para iniciar deste ponto
             initial_stats = last_results
 
-        # Inicializa DB com os dados recuperados ou zerados
-        crud.create_user_video(db, 0, video_id, rtsp_url, "")
-        crud.update_video_after_processing(db, video_id, None, None, initial_stats, "live_processing")
+        # Eventos registrados no journal cujos deltas por minuto ainda não chegaram ao banco
+        if restored and restored["unflushed_events"]:
+            counting.accumulate_bucket_deltas(pending_deltas, restored["unflushed_events"])
+            print(f"♻️ Reenviando {len(restored['unflushed_events'])} eventos pendentes da Câmera {device_id}")
 
-        # Inicializa variáveis de contagem com os valores iniciais
-        counts = {
-            "entrantes": initial_stats.get("entrantes", {"Person": 0, "Total": 0}),
-            "passantes": initial_stats.get("passantes", {"Person": 0, "Total": 0})
-        }
+        # Inicializa DB com os dados recuperados ou zerados
+        # count_base: o que a sessão herdou, para a compactação separar a contagem própria da sessão
+        initial_results = counting.results_from_counts(initial_stats)
+        count_base = {key: ((initial_results.get(key) or {}).get("Total") or 0) for key in ("entrantes", "passantes")}
+        async with AsyncSessionLocal() as db:
+            await crud_async.create_user_video(db, 0, video_id, rtsp_url, "", device_id=device_id, session_type="live", count_base=count_base)
+            await crud_async.update_video_after_processing(db, video_id, None, None, initial_results, "live_processing")
+        current_sessions[device_id] = video_id
 
-        WIDTH, HEIGHT = get_stream_resolution(local_rtsp)
-        FRAME_SIZE = WIDTH * HEIGHT * 3 
+        meta = await get_stream_metadata(device_id, local_rtsp)
+        WIDTH, HEIGHT = meta["width"], meta["height"]
 
         print(f"🔌 Iniciando Processamento Visual: {local_rtsp} ({WIDTH}x{HEIGHT})")
         
@@ -198,8 +366,16 @@ async def run_live_camera_ffmpeg(device_id, rtsp_url, lines_config, stop_event,
             print("❌ Resolução inválida (0x0). Tentando novamente em breve...")
             return
 
-        command = ['ffmpeg', '-rtsp_transport', 'tcp', '-i', local_rtsp, '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-r', '15', '-an', '-sn', '-y', '-']
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=10**8)
+        # '-s' força a resolução salva: se a câmera mudar, os frames continuam alinhados até a revalidação
+        command = ['ffmpeg', '-rtsp_transport', 'tcp', '-i', local_rtsp, '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{WIDTH}x{HEIGHT}', '-r', str(config.LIVE_FPS), '-an', '-sn', '-y', '-']
+        if config.LIVE_TRANSPORT == "shm":
+            # Decodificação em processo separado, frames lidos direto da memória compartilhada
+            reader = shm_ring.ShmFrameSource(f"sense_cam_{device_id}_{os.getpid()}", command, WIDTH, HEIGHT, slots=config.SHM_RING_SLOTS).start()
+        else:
+            # Leitor desacoplado: drena o pipe continuamente e mantém só os frames mais novos
+            reader = frame_reader.LatestFrameReader(command, WIDTH, HEIGHT, window=config.LIVE_FRAME_WINDOW).start()
+        # Frames do ring são views na memória compartilhada (sem cópia): conferidos após a inferência
+        zero_copy = isinstance(reader, shm_ring.ShmFrameSource)
 
         # Configs e LIMPEZA DOS PONTOS
         lc = lines_config if isinstance(lines_config, dict) else json.loads(lines_config)
@@ -218,36 +394,41 @@ async def run_live_camera_ffmpeg(device_id, rtsp_url, lines_config, stop_event,
         line_pass = clean_points(lc.get('passerby', []))
         in_side = lc.get('in_side', 'right')
 
-        track_states = {}
-        counts = {"entrantes": {"Person": 0, "Total": 0}, "passantes": {"Person": 0, "Total": 0}}
+        counter = counting.CrossingCounter(line_ent, line_pass, in_side, max_gap_s=config.TRACK_MAX_GAP_S)
+        # Retoma as contagens (e os tracks em andamento) em vez de recomeçar do zero
+        counter.restore(initial_stats, track_states)
+        counts = counter.counts
+        epoch = _tracker_epoch(processor_ref.get("processor"))
+        await asyncio.to_thread(ckpt.write_snapshot, ckpt.capture(video_id, counter, epoch))
+        last_checkpoint = time.time()
+
+        channel = live_channel.get_channel(device_id)
+        channel.set_status("online", counter.results())
         
         frame_count = 0
         t0 = time.time()
         fps = 0
         last_save = time.time()
+        last_snapshot = time.time()
+        checked_restarts = 0
+        seen_restarts = 0
         
         while not stop_event.is_set():
-            try:
-                raw_frame = await asyncio.to_thread(process.stdout.read, FRAME_SIZE)
-            except ValueError:
-                break # Pipe fechado
-            
-            if len(raw_frame) != FRAME_SIZE:
-                print(f"⚠️ Frame incompleto dev {device_id}. Reiniciando pipe...")
-                # Reduzido tempo de espera na falha de leitura
-                process.terminate()
-                await asyncio.sleep(0.5)
-                process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=10**8)
-                continue
-
-            # Frame bufferizado -> Numpy
-            try:
-                frame = np.frombuffer(raw_frame, np.uint8).reshape((HEIGHT, WIDTH, 3)).copy()
-            except Exception:
-                continue
+            item = await asyncio.to_thread(reader.get, 2.0)
 
-            # PROTEÇÃO: Se frame estiver vazio
-            if frame.size == 0: continue
+            # ffmpeg reiniciou: o Go2RTC pode ter perdido o registro da stream, registra de novo
+            if reader.restarts != seen_restarts:
+                seen_restarts = reader.restarts
+                go2rtc.client.invalidate(stream_name)
+                asyncio.create_task(_register_stream(stream_name, rtsp_url))
+
+            # Falhas repetidas de decodificação: revalida os metadados em background
+            if reader.restarts - checked_restarts >= config.STREAM_REVALIDATE_AFTER:
+                checked_restarts = reader.restarts
+                asyncio.create_task(revalidate_stream(device_id, local_rtsp))
+
+            if item is None: continue
+            seq, frame_ts, frame = item
 
             frame_count += 1
             if time.time() - t0 > 1:
@@ -255,70 +436,28 @@ async def run_live_camera_ffmpeg(device_id, rtsp_url, lines_config, stop_event,
                 frame_count = 0
                 t0 = time.time()
 
-            # IA Processing (já roda em thread via to_thread dentro do scheduler, mas aqui chamamos direto)
-            # Como estamos dentro de uma task async, o ideal é manter o processamento pesado também off-loaded se possível
-            # Mas como `processor.process_frame` é CPU-bound, o ideal é:
             processor = processor_ref.get("processor")
             if not processor: break
             
             # Offload do processamento da IA para não bloquear o loop enquanto calcula
-            tracks = await asyncio.to_thread(processor.process_frame, frame)
+            # (câmeras ao vivo têm prioridade sobre os jobs offline na disputa pela inferência)
+            async with jobs.gate.slot(jobs.PRIORITY_LIVE):
+                tracks = await asyncio.to_thread(processor.process_frame, frame)
+            if zero_copy:
+                # Frame sobrescrito durante a inferência: descarta em vez de contar sobre pixels rasgados
+                if not reader.is_valid(seq): continue
+                # A view pertence ao slot do ring: desenha numa cópia
+                frame = frame.copy()
 
             # --- LÓGICA DE CONTAGEM ---
-            for t in tracks:
-                tid = t["track_id"]
-                bbox = t["bbox"]
-                ref_point = (int((bbox[0]+bbox[2])/2), int((bbox[1]+bbox[3])/2))
-
-                if tid not in track_states:
-                    track_states[tid] = {
-                        'status': 'neutral', 
-                        'last_point': ref_point
-                    }
-                
-                state = track_states[tid]
-                prev_point = state.get('last_point', ref_point)
-
-                # Só processa se houve deslocamento
-                if prev_point != ref_point:
-                    
-                    # 1. VERIFICAÇÃO PASSANTES (Qualquer sentido)
-                    crossed_pass = False
-                    for i in range(len(line_pass) - 1):
-                        if geometry.segments_intersect(prev_point, ref_point, line_pass[i], line_pass[i+1]):
-                            crossed_pass = True
-                            break
-                    
-                    if crossed_pass:
-                        if state['status'] == 'neutral':
-                            state['status'] = 'passerby'
-                            counts['passantes']['Person'] += 1
-                            counts['passantes']['Total'] += 1
-
-                    # 2. VERIFICAÇÃO ENTRANTES (Sentido OUT -> IN)
-                    for i in range(len(line_ent) - 1):
-                        p_start = line_ent[i]
-                        p_end = line_ent[i+1]
-                        
-                        if geometry.segments_intersect(prev_point, ref_point, p_start, p_end):
-                            side_prev = geometry.get_side_of_segment(prev_point, p_start, p_end)
-                            required_prev_side = 'left' if in_side == 'right' else 'right'
-
-                            if side_prev == required_prev_side:
-                                if state['status'] == 'neutral':
-                                    state['status'] = 'entrant'
-                                    counts['entrantes']['Person'] += 1
-                                    counts['entrantes']['Total'] += 1
-                                    
-                                elif state['status'] == 'passerby':
-                                    state['status'] = 'entrant'
-                                    counts['passantes']['Person'] -= 1
-                                    counts['passantes']['Total'] -= 1
-                                    counts['entrantes']['Person'] += 1
-                                    counts['entrantes']['Total'] += 1
-                                break 
-
-                state['last_point'] = ref_point
+            # Usa o timestamp de captura: frames descartados não quebram a detecção de cruzamento
+            events = counter.update(tracks, ts=frame_ts, frame_idx=seq)
+            if events:
+                # Journal antes de qualquer efeito: o evento sobrevive a uma queda logo em seguida
+                ckpt.append(events)
+                counting.accumulate_bucket_deltas(pending_deltas, events, frame_ts)
+            # Push em memória para os assinantes WebSocket (agrupado em LIVE_PUSH_HZ)
+            channel.publish(counter.results(), events)
 
             # --- DESENHO E STREAMING ---
             processed_frame = draw_visuals(frame, tracks, line_ent, line_pass, counts, fps)
@@ -333,29 +472,47 @@ async def run_live_camera_ffmpeg(device_id, rtsp_url, lines_config, stop_event,
                 if ret:
                     await q.put(buffer.tobytes())
 
-            # DB Save - Otimizado com Context Manager para evitar Connection Leaks
-            if time.time() - last_save > 2:
-                total = {"Total": counts['entrantes']['Total'] + counts['passantes']['Total']}
-                res = {"total_geral": total, "entrantes": counts['entrantes'], "passantes": counts['passantes']}
-                try:
-                    # Uso correto de context manager garante o fechamento da sessão mesmo com erro
-                    with SessionLocal() as db_save:
-                        crud.update_video_after_processing(db_save, video_id, None, None, res, "live_processing")
-                except Exception as e:
-                    print(f"Erro ao salvar stats live (ignorado): {e}")
-                last_save = time.time()
+            reader.mark_processed(frame_ts)
+            camera_metrics[device_id] = dict(reader.stats(), checkpoint=ckpt.stats())
+
+            # DB Save - Deltas por minuto e, com menos frequência, o snapshot de totais.
+            # As escritas vão para o writer write-behind (um commit em lote para todas as câmeras)
+            now = time.time()
+            if now - last_save > config.LIVE_BUCKET_FLUSH_S:
+                if pending_deltas:
+                    # Após o commit, marca no journal até onde os deltas já estão no banco
+                    db_writer.writer.submit(crud.upsert_count_buckets, device_id, pending_deltas, on_commit=functools.partial(ckpt.mark_buckets, ckpt.seq))
+                    pending_deltas = {}
+                if now - last_snapshot > config.LIVE_SNAPSHOT_INTERVAL_S:
+                    db_writer.writer.submit(crud.update_live_results, video_id, copy.deepcopy(counter.results()), key=("live_results", video_id))
+                    last_snapshot = now
+                last_save = now
+
+            if now - last_checkpoint > config.CHECKPOINT_SNAPSHOT_S:
+                # Captura no loop (consistente com o frame atual); fsync e compactação em thread
+                await asyncio.to_thread(ckpt.write_snapshot, ckpt.capture(video_id, counter, epoch))
+                last_checkpoint = now
             
             await asyncio.sleep(0.001)
 
     except Exception as e:
         print(f"❌ Erro fatal thread {device_id}: {traceback.format_exc()}")
+        # Próximo início registra a stream de novo em vez de confiar no cache
+        go2rtc.client.invalidate(stream_name)
     finally:
-        if process: process.terminate()
-        db.close()
+        if reader: await asyncio.to_thread(reader.stop)
         if device_id in monitor_queues: del monitor_queues[device_id]
-        try:
-            db_final = SessionLocal()
-            crud.update_video_status(db_final, video_id, "done")
-            db_final.close()
-        except: pass
+        camera_metrics.pop(device_id, None)
+        live_channel.get_channel(device_id).set_status("stopped")
+        if counter is not None:
+            try:
+                await asyncio.to_thread(ckpt.write_snapshot, ckpt.capture(video_id, counter, epoch))
+            except Exception as e:
+                print(f"⚠️ Falha ao gravar checkpoint final da Câmera {device_id}: {e}")
+            if pending_deltas:
+                db_writer.writer.submit(crud.upsert_count_buckets, device_id, pending_deltas, on_commit=functools.partial(ckpt.mark_buckets, ckpt.seq))
+            db_writer.writer.submit(crud.update_live_results, video_id, copy.deepcopy(counter.results()), "done", key=("live_results", video_id))
+        else:
+            db_writer.writer.submit(crud.update_video_status, video_id, "done", key=("live_results", video_id))
+        if ckpt is not None: ckpt.close()
         print(f"✅ Finalizado: {device_id}")
\ No newline at end of file
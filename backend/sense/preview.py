@@ -0,0 +1,82 @@
+"""
+Canal de preview dos jobs offline (stream MJPEG em /video-stream/{id}).
+
+Guarda só o último frame JPEG (memória constante, independente da duração do vídeo). O processamento
+consulta wants_frame() antes de desenhar; o canal só codifica quando há alguém assistindo, no máximo PREVIEW_FPS
+vezes por segundo e reduzido para PREVIEW_MAX_WIDTH. Cada espectador recebe o frame mais recente:
+quem está lento pula frames em vez de acumular fila.
+"""
+
+import asyncio
+import time
+
+import cv2
+
+from . import config
+
+
+class PreviewChannel:
+    def __init__(self, fps=None, max_width=None, quality=None):
+        self.interval = 1.0 / (fps or config.PREVIEW_FPS)
+        self.max_width = max_width or config.PREVIEW_MAX_WIDTH
+        self.quality = quality or config.PREVIEW_JPEG_QUALITY
+        self.viewers = 0
+        self.closed = False
+        self._frame = None       # Último JPEG
+        self._seq = 0            # Incrementa a cada frame novo
+        self._last_encode = 0.0
+        self._changed = asyncio.Condition()
+
+        # Métricas
+        self.encoded = 0
+        self.encode_ms = 0.0
+
+    def wants_frame(self):
+        """Só vale a pena preparar/codificar o frame se alguém assiste e já passou o intervalo do fps."""
+        return self.viewers > 0 and not self.closed and time.monotonic() - self._last_encode >= self.interval
+
+    async def publish(self, frame):
+        """Publica um frame BGR (reduzido); ignorado se wants_frame() for falso."""
+        if not self.wants_frame(): return
+        self._last_encode = time.monotonic()
+        t0 = time.perf_counter()
+        h, w = frame.shape[:2]
+        if w > self.max_width:
+            frame = cv2.resize(frame, (self.max_width, int(h * self.max_width / w)), interpolation=cv2.INTER_AREA)
+        ok, buf = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        self.encode_ms += (time.perf_counter() - t0) * 1000
+        if not ok: return
+        self.encoded += 1
+        async with self._changed:
+            self._frame = buf.tobytes()
+            self._seq += 1
+            self._changed.notify_all()
+
+    async def close(self):
+        """Fim do job: libera os espectadores e descarta o último frame."""
+        async with self._changed:
+            self.closed = True
+            self._frame = None
+            self._changed.notify_all()
+
+    async def frames(self):
+        """Gerador de JPEGs para um espectador (mais recente a cada iteração) até o canal fechar."""
+        self.viewers += 1
+        seen = 0
+        try:
+            while True:
+                async with self._changed:
+                    await self._changed.wait_for(lambda: self.closed or self._seq != seen)
+                    if self.closed: return
+                    seen, frame = self._seq, self._frame
+                yield frame
+        finally:
+            self.viewers -= 1
+
+    def stats(self):
+        return {
+            "viewers": self.viewers,
+            "frames_encoded": self.encoded,
+            "avg_encode_ms": round(self.encode_ms / self.encoded, 2) if self.encoded else None,
+            "buffered_bytes": len(self._frame) if self._frame else 0,
+        }
@@ -0,0 +1,74 @@
+"""
+Progresso detalhado dos jobs offline (WebSocket /ws/progress).
+
+O loop de processamento registra o tempo de cada etapa por frame (decode, detect, reid, track, count,
+render, encode); o JobProgress agrega numa janela e, no máximo a cada PROGRESS_INTERVAL_S, monta uma
+mensagem com %, frames/s, ETA, tracks ativos, latência média por etapa e profundidade das filas.
+A mensagem é enviada a todos os clientes que acompanham o vídeo (ConnectionManager.broadcast).
+"""
+
+import time
+
+from . import config
+
+STAGES = ("decode", "detect", "reid", "track", "count", "render", "encode")
+
+
+class JobProgress:
+    def __init__(self, video_id, total_frames, job_id=None, interval=None):
+        self.video_id = video_id
+        self.job_id = job_id
+        self.total = total_frames
+        self.interval = config.PROGRESS_INTERVAL_S if interval is None else interval
+        self.frame = 0
+        self.active_tracks = 0
+        self._stage_s = dict.fromkeys(STAGES, 0.0)
+        self._window_frames = 0
+        self._window_start = time.monotonic()
+        self._next_emit = 0.0
+        self.fps = None
+
+    def add(self, stage, seconds):
+        self._stage_s[stage] = self._stage_s.get(stage, 0.0) + seconds
+
+    def add_timings(self, timings):
+        """Tempos (s) por etapa medidos dentro do VideoProcessor (detect/reid/track)."""
+        for stage, seconds in timings.items():
+            self.add(stage, seconds)
+
+    def frame_done(self, frame_idx, active_tracks):
+        self.frame = frame_idx
+        self.active_tracks = active_tracks
+        self._window_frames += 1
+
+    def due(self):
+        """Coalescência: no máximo uma mensagem por intervalo, qualquer que seja a taxa de frames."""
+        return time.monotonic() >= self._next_emit
+
+    def message(self, pct, queues=None, stage=None):
+        """Monta a mensagem de progresso e reinicia a janela de medição."""
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        n = self._window_frames
+        if n and elapsed > 0:
+            self.fps = n / elapsed
+        remaining = max(0, (self.total or 0) - self.frame)
+        msg = {
+            "type": "progress",
+            "value": round(pct, 2),
+            "video_id": self.video_id,
+            "job_id": self.job_id,
+            "stage": stage,
+            "frame": self.frame,
+            "frames_total": self.total,
+            "fps": round(self.fps, 2) if self.fps else None,
+            "eta_s": round(remaining / self.fps, 1) if self.fps and self.total else None,
+            "active_tracks": self.active_tracks,
+            "stage_ms": {k: round(v / n * 1000, 2) for k, v in self._stage_s.items()} if n else None,
+            "queues": queues or {},
+        }
+        self._stage_s = dict.fromkeys(STAGES, 0.0)
+        self._window_frames = 0
+        self._window_start = now
+        self._next_emit = now + self.interval
+        return msg
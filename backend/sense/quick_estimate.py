@@ -0,0 +1,155 @@
+"""
+Estimativa rápida de contagem (mode="quick" em /process-video/).
+
+Processa só uma amostra dos frames (QUICK_SAMPLE_FPS): cada amostra é buscada por seek em vez de
+decodificar o vídeo inteiro, e a detecção pode rodar com imgsz menor. O CrossingCounter recebe o
+timestamp real de cada amostra, então o instante de um cruzamento é interpolado entre as duas amostras
+em que o track aparece de cada lado da linha.
+
+A faixa de confiança vem da calibração: estimativas anteriores cuja combinação (conteúdo + linhas) depois
+foi processada por completo guardam as duas contagens; os percentis do erro relativo delas viram a faixa.
+Sem amostras suficientes, usa uma faixa padrão (±QUICK_DEFAULT_BAND).
+
+Cada estimativa é limitada a QUICK_MAX_SAMPLES amostras e QUICK_TIMEOUT_S, e para se o cliente desconectar.
+"""
+
+import asyncio
+import itertools
+import math
+import time
+
+import cv2
+import numpy as np
+
+from . import config, counting, jobs
+
+KEYS = ("entrantes", "passantes", "total_geral")
+
+
+class EstimateAborted(Exception):
+    """Estimativa interrompida (cliente desconectou ou QUICK_TIMEOUT_S)."""
+
+
+def stride_for(fps, sample_fps):
+    """Frames do vídeo por amostra (1 = todos)."""
+    if not fps or not sample_fps or sample_fps >= fps:
+        return 1
+    return max(1, int(round(fps / sample_fps)))
+
+
+def effective_imgsz(imgsz):
+    """imgsz da estimativa; None (o padrão da detecção) com o modelo TensorRT, compilado para um tamanho fixo."""
+    if not imgsz or config.YOLO_MODEL_PATH.endswith(".engine"):
+        return None
+    return int(imgsz)
+
+
+class FrameSampler:
+    """Lê um frame a cada `stride`: seek direto quando o salto é grande, grab() (sem decodificar a imagem) quando é pequeno."""
+
+    def __init__(self, path, sample_fps):
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise RuntimeError(f"Não foi possível abrir {path}")
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 0.0
+        self.total = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT)) or None
+        self.stride = stride_for(self.fps, sample_fps)
+        if self.total and config.QUICK_MAX_SAMPLES:
+            # Vídeo longo: espaça as amostras para não passar do limite
+            self.stride = max(self.stride, math.ceil(self.total / config.QUICK_MAX_SAMPLES))
+        self.seek = self.stride >= config.QUICK_SEEK_MIN_STRIDE
+        self.pos = 0 # Próximo frame que o cap entrega
+        self.seeks = 0
+
+    def indices(self):
+        return range(0, self.total, self.stride) if self.total else itertools.count(0, self.stride)
+
+    def read(self, idx):
+        """Frame `idx` (>= posição atual) ou None no fim do vídeo. Bloqueante: chamar via asyncio.to_thread."""
+        if idx > self.pos:
+            if self.seek:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
+                self.seeks += 1
+            else:
+                for _ in range(idx - self.pos):
+                    if not self.cap.grab():
+                        return None
+        ret, frame = self.cap.read()
+        self.pos = idx + 1
+        return frame if ret else None
+
+    def release(self):
+        self.cap.release()
+
+
+async def estimate(processor, path, line_ent, line_pass, in_side, sample_fps=None, imgsz=None, is_disconnected=None):
+    """
+    Contagem aproximada do vídeo. `processor` precisa de tracker próprio (VideoProcessor.fork()).
+    A inferência passa pelo mesmo portão dos jobs (cede às câmeras ao vivo).
+    `is_disconnected`: corrotina (ex: Request.is_disconnected) consultada entre amostras; True aborta.
+    Levanta EstimateAborted.
+    """
+    sample_fps = sample_fps or config.QUICK_SAMPLE_FPS
+    imgsz = effective_imgsz(config.QUICK_IMGSZ if imgsz is None else imgsz)
+    started = time.monotonic()
+    sampler = await asyncio.to_thread(FrameSampler, path, sample_fps)
+    counter = counting.CrossingCounter(line_ent, line_pass, in_side)
+    sampled = 0
+    try:
+        for idx in sampler.indices():
+            # Duração desconhecida (sem contagem de frames): o limite vale sobre as amostras lidas
+            if config.QUICK_MAX_SAMPLES and sampled >= config.QUICK_MAX_SAMPLES: break
+            if time.monotonic() - started > config.QUICK_TIMEOUT_S:
+                raise EstimateAborted(f"tempo limite de {config.QUICK_TIMEOUT_S:.0f}s")
+            if is_disconnected is not None and sampled % config.QUICK_DISCONNECT_CHECK_EVERY == 0 and await is_disconnected():
+                raise EstimateAborted("cliente desconectado")
+            frame = await asyncio.to_thread(sampler.read, idx)
+            if frame is None: break
+            async with jobs.gate.slot(jobs.PRIORITY_UPLOAD):
+                tracks = await asyncio.to_thread(processor.process_frame, frame, imgsz)
+            counter.update(tracks, ts=idx / sampler.fps if sampler.fps else None, frame_idx=idx)
+            sampled += 1
+    finally:
+        sampler.release()
+    return {
+        "results": counter.results(),
+        "frames_sampled": sampled,
+        "frames_total": sampler.total,
+        "stride": sampler.stride,
+        "sample_fps": round(sampler.fps / sampler.stride, 3) if sampler.fps else None,
+        "seek": sampler.seek,
+        "imgsz": imgsz,
+        "elapsed_s": round(time.monotonic() - started, 2),
+    }
+
+
+def _total(results, key):
+    return ((results or {}).get(key) or {}).get("Total", 0)
+
+
+def band(results, calibration):
+    """
+    Faixa de confiança de cada contagem. `calibration`: pares (estimativa, contagem completa) no formato de Video.results.
+    Com calibração, o valor central corrige o viés mediano e a faixa vai dos percentis QUICK_BAND_PERCENTILES do erro relativo.
+    """
+    p_low, p_high = config.QUICK_BAND_PERCENTILES
+    calibrated = len(calibration) >= config.QUICK_CALIBRATION_MIN
+    counts = {}
+    for key in KEYS:
+        est = _total(results, key)
+        if calibrated:
+            errors = [(_total(actual, key) - _total(est_r, key)) / max(_total(est_r, key), 1) for est_r, actual in calibration]
+            lo, mid, hi = np.percentile(errors, [p_low, 50, p_high])
+            base = max(est, 1)
+            value, low, high = est + base * mid, est + base * lo, est + base * hi
+        else:
+            margin = max(config.QUICK_DEFAULT_BAND * est, config.QUICK_DEFAULT_BAND_MIN)
+            value, low, high = est, est - margin, est + margin
+        counts[key] = {"estimate": est, "value": max(0, int(round(value))),
+                       "low": max(0, math.floor(low)), "high": max(0, math.ceil(high))}
+    return {
+        "counts": counts,
+        "calibrated": calibrated,
+        "calibration_samples": len(calibration),
+        "level": (p_high - p_low) / 100 if calibrated else None,
+    }
@@ -6,6 +6,8 @@ from PIL import Image
 import cv2
 import numpy as np
 import os
+import threading
+import time
 import torch.nn.functional as F
 
 class OSNetWrapper(nn.Module):
@@ -35,6 +37,9 @@ class OSNetWrapper(nn.Module):
 
         self.model.to(device).eval()
 
+        # Tempo gasto em get_features por thread (workers offline compartilham o modelo)
+        self._timing = threading.local()
+
         # Pré-processamento (Resize -> Tensor -> Normalize)
         self.transform = T.Compose([
             T.Resize((256, 128)),
@@ -78,7 +83,20 @@ class OSNetWrapper(nn.Module):
         # CORREÇÃO CRÍTICA 1: Traz de volta da GPU para CPU e converte para Numpy
         return features.cpu().numpy()
 
+    def take_elapsed(self):
+        """Segundos de ReID acumulados nesta thread desde a última chamada (zera o contador)."""
+        elapsed = getattr(self._timing, "seconds", 0.0)
+        self._timing.seconds = 0.0
+        return elapsed
+
     def get_features(self, bboxes, img):
+        t0 = time.perf_counter()
+        try:
+            return self._get_features(bboxes, img)
+        finally:
+            self._timing.seconds = getattr(self._timing, "seconds", 0.0) + time.perf_counter() - t0
+
+    def _get_features(self, bboxes, img):
         """
         CORREÇÃO CRÍTICA 2: Função exigida pelo BoT-SORT.
         Recorta a imagem original usando as bboxes e chama o forward.
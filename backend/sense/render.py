@@ -0,0 +1,74 @@
+"""
+Desenho do vídeo processado (linhas, caixas, cruzamentos e placar).
+
+Modos de renderização do processamento offline:
+    full     desenha, grava o mp4 anotado e alimenta o preview
+    preview  desenha só para o preview (sem vídeo de saída)
+    none     sem desenho, encoder nem preview: só contagens, eventos e trajetórias
+"""
+
+import cv2
+import numpy as np
+
+RENDER_MODES = ("none", "preview", "full")
+
+
+def draw_line_visuals(frame, line_points, color, label, in_side=None):
+    if len(line_points) < 2: return
+    for i in range(len(line_points) - 1):
+        p1 = (int(line_points[i]['x']), int(line_points[i]['y']))
+        p2 = (int(line_points[i+1]['x']), int(line_points[i+1]['y']))
+        cv2.line(frame, p1, p2, color, 3)
+
+    mid = len(line_points) // 2
+    p1, p2 = line_points[mid-1], line_points[mid]
+    mx, my = (p1['x']+p2['x'])/2, (p1['y']+p2['y'])/2
+
+    if in_side: # Lógica Entrantes
+        dx, dy = p2['x']-p1['x'], p2['y']-p1['y']
+        norm = {'x': -dy, 'y': dx}; length = np.sqrt(norm['x']**2 + norm['y']**2) or 1
+        un = {'x': norm['x']/length, 'y': norm['y']/length}
+        t1 = (int(mx + un['x']*40), int(my + un['y']*40))
+        t2 = (int(mx - un['x']*40), int(my - un['y']*40))
+        cv2.putText(frame, "IN" if in_side=='right' else "OUT", t1, cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
+        cv2.putText(frame, "OUT" if in_side=='right' else "IN", t2, cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
+    else: # Lógica Passantes
+        cv2.putText(frame, label, (int(mx), int(my-10)), cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
+
+
+def annotate(frame, processor, tracks, events, counts, line_ent, line_pass, in_side):
+    """Desenha linhas, tracks, cruzamentos do frame e placar. Retorna o frame anotado."""
+    draw_line_visuals(frame, line_ent, (0, 255, 0), "Entrantes", in_side)
+    draw_line_visuals(frame, line_pass, (0, 255, 255), "Passantes")
+
+    # Desenha as caixas e IDs primeiro (para a bolinha ficar por cima depois)
+    annotated = processor.draw_tracks(frame, tracks)
+
+    bboxes = {t["track_id"]: t["bbox"] for t in tracks}
+    for t in tracks:
+        bbox = t["bbox"]
+        ref_point = (int((bbox[0]+bbox[2])/2), int((bbox[1]+bbox[3])/2))
+        # Desenha a "Bolinha Vermelha" garantida na imagem de saída
+        cv2.circle(annotated, ref_point, 5, (0, 0, 255), -1)
+
+    # Feedback visual dos cruzamentos deste frame
+    for ev in events:
+        bbox = bboxes[ev["track_id"]]
+        ref_point = (int((bbox[0]+bbox[2])/2), int((bbox[1]+bbox[3])/2))
+        if ev["type"] == "passerby":
+            cv2.rectangle(annotated, (int(bbox[0]), int(bbox[1])), (int(bbox[2]), int(bbox[3])), (0, 255, 255), 4)
+        else:
+            cv2.circle(annotated, ref_point, 15, (0, 255, 0), -1)
+            if ev["type"] == "switch":
+                cv2.putText(annotated, "ENTROU!", (int(bbox[0]), int(bbox[1]-30)), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0,255,0), 2)
+
+    # Desenha placar no vídeo (Sem "Na Loja")
+    cv2.putText(annotated, f"Entrantes: {counts['entrantes']['Total']}", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 255, 0), 3)
+    cv2.putText(annotated, f"Passantes: {counts['passantes']['Total']}", (50, 100), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 255, 255), 3)
+    return annotated
+
+
+def trajectory_record(frame_idx, ts, tracks):
+    """Linha do log de trajetórias: ponto de referência (centro da caixa) de cada track no frame."""
+    return {"frame": frame_idx, "ts": ts,
+            "tracks": [[t["track_id"], int((t["bbox"][0]+t["bbox"][2])/2), int((t["bbox"][1]+t["bbox"][3])/2)] for t in tracks]}
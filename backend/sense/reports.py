@@ -0,0 +1,236 @@
+"""
+Relatórios de contagem (CSV / XLSX / Parquet) gerados a partir do log de eventos de cruzamento.
+O processamento grava cada evento em um arquivo JSONL; os relatórios são montados em streaming
+(linha a linha, sem DataFrame) com totais e quebras por minuto/hora por linha e sentido.
+Os arquivos ficam em cache por (video_id, hash da configuração das linhas).
+"""
+
+import csv
+import glob
+import hashlib
+import json
+import os
+import tempfile
+from datetime import timedelta
+
+from . import config, counting
+
+# Muda quando o layout do relatório muda (invalida o cache)
+REPORT_VERSION = 1
+
+FORMATS = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+INTERVALS = {"minuto": 60, "hora": 3600}
+
+LINE_LABELS = {"entrant": "Entrantes", "passerby": "Passantes"}
+DIRECTION_LABELS = {"in": "entrada", "cross": "passagem"}
+
+COLUMNS = ["granularidade", "inicio", "fim", "linha", "sentido", "contagem"]
+
+
+def config_hash(line_ent, line_pass, in_side):
+    """Hash curto da configuração de linhas usada no processamento."""
+    raw = json.dumps({"v": REPORT_VERSION, "ent": line_ent, "pass": line_pass, "in": in_side}, sort_keys=True)
+    return hashlib.sha1(raw.encode()).hexdigest()[:12]
+
+
+def events_path(video_id, cfg_hash):
+    return os.path.join(config.REPORTS_DIR, f"{video_id}_{cfg_hash}.events.jsonl")
+
+
+def tracks_path(video_id, cfg_hash):
+    return os.path.join(config.REPORTS_DIR, f"{video_id}_{cfg_hash}.tracks.jsonl")
+
+
+def report_path(video_id, cfg_hash, fmt):
+    return os.path.join(config.REPORTS_DIR, f"{video_id}_{cfg_hash}_report.{fmt}")
+
+
+def latest_events(video_id):
+    """Log de eventos mais recente do vídeo -> (caminho, cfg_hash) ou (None, None)."""
+    paths = glob.glob(os.path.join(config.REPORTS_DIR, f"{glob.escape(video_id)}_*.events.jsonl"))
+    if not paths:
+        return None, None
+    path = max(paths, key=os.path.getmtime)
+    cfg_hash = os.path.basename(path)[len(video_id) + 1:-len(".events.jsonl")]
+    return path, cfg_hash
+
+
+def delete_reports(video_id):
+    for path in glob.glob(os.path.join(config.REPORTS_DIR, f"{glob.escape(video_id)}_*")):
+        try: os.remove(path)
+        except OSError: pass
+
+
+class EventLog:
+    """Grava os eventos de cruzamento em JSONL conforme acontecem."""
+
+    def __init__(self, path, resume_at=None):
+        """
+        Args:
+            path: Caminho final do log
+            resume_at: Offset (bytes) de um checkpoint: continua o .part existente a partir dele
+        """
+        self.path = path
+        self._tmp = path + ".part"
+        if resume_at is not None and os.path.exists(self._tmp):
+            self._f = open(self._tmp, "r+", encoding="utf-8")
+            self._f.truncate(resume_at) # Descarta eventos gravados depois do checkpoint
+            self._f.seek(resume_at)
+        else:
+            self._f = open(self._tmp, "w", encoding="utf-8")
+
+    def write(self, events):
+        for ev in events:
+            self._f.write(json.dumps(ev) + "\n")
+
+    def tell(self):
+        """Offset atual (com flush + fsync): usado nos checkpoints do job."""
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        return self._f.tell()
+
+    def close(self):
+        """Fecha e publica o log (rename atômico: um log parcial nunca vira relatório)."""
+        if self._f is None: return
+        self._f.close()
+        self._f = None
+        os.replace(self._tmp, self.path)
+
+    def discard(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+        try: os.remove(self._tmp)
+        except OSError: pass
+
+
+def iter_events(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _fmt_offset(seconds):
+    return str(timedelta(seconds=int(seconds)))
+
+
+def breakdown(path):
+    """
+    Lê o log em streaming e agrega por intervalo: {(granularidade, inicio_s, linha, sentido): contagem}.
+    Um 'switch' (passante que entrou) desconta o passante do intervalo em que ele foi contado.
+    """
+    buckets = {}
+    passerby_at = {}
+
+    def add(t, line, direction, delta):
+        for name, size in INTERVALS.items():
+            key = (name, int(t // size) * size, line, direction)
+            buckets[key] = buckets.get(key, 0) + delta
+
+    for ev in iter_events(path):
+        t = ev.get("ts") or 0.0
+        if ev["type"] == "passerby":
+            passerby_at[ev["track_id"]] = t
+        for line, direction, delta in counting.EVENT_DELTAS.get(ev["type"], []):
+            # O desconto do passante vai para o intervalo original dele
+            when = passerby_at.pop(ev["track_id"], t) if delta < 0 else t
+            add(when, line, direction, delta)
+    return buckets
+
+
+def iter_rows(path, results=None):
+    """Linhas do relatório (COLUMNS): totais primeiro, depois as quebras por minuto e por hora."""
+    buckets = breakdown(path)
+
+    totals = {}
+    for (name, _, line, direction), count in buckets.items():
+        if name == "hora":
+            totals[(line, direction)] = totals.get((line, direction), 0) + count
+    if results:
+        # Os totais salvos no vídeo são a referência (mesma contagem exibida na tela)
+        totals[("entrant", "in")] = results.get("entrantes", {}).get("Total", totals.get(("entrant", "in"), 0))
+        totals[("passerby", "cross")] = results.get("passantes", {}).get("Total", totals.get(("passerby", "cross"), 0))
+    for (line, direction), count in sorted(totals.items()):
+        yield ["total", None, None, LINE_LABELS.get(line, line), DIRECTION_LABELS.get(direction, direction), count]
+
+    for name, size in INTERVALS.items():
+        for (gran, start, line, direction), count in sorted(k_v for k_v in buckets.items() if k_v[0][0] == name):
+            yield [gran, _fmt_offset(start), _fmt_offset(start + size),
+                   LINE_LABELS.get(line, line), DIRECTION_LABELS.get(direction, direction), count]
+
+
+def _write_csv(rows, path):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(COLUMNS)
+        for row in rows:
+            w.writerow(row)
+
+
+def _write_xlsx(rows, path):
+    from openpyxl import Workbook
+
+    # write_only: as linhas vão direto para o arquivo, sem montar a planilha em memória
+    wb = Workbook(write_only=True)
+    sheets = {}
+    titles = {"total": "Resumo", "minuto": "Por minuto", "hora": "Por hora"}
+    for gran, title in titles.items():
+        sheets[gran] = wb.create_sheet(title)
+        sheets[gran].append(COLUMNS[3:] if gran == "total" else COLUMNS[1:])
+    for row in rows:
+        sheets[row[0]].append(row[3:] if row[0] == "total" else row[1:])
+    wb.save(path)
+
+
+def _write_parquet(rows, path, batch_size=10000):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("Formato parquet requer o pacote pyarrow")
+
+    schema = pa.schema([(c, pa.int64() if c == "contagem" else pa.string()) for c in COLUMNS])
+    with pq.ParquetWriter(path, schema) as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                writer.write_table(pa.Table.from_pylist([dict(zip(COLUMNS, r)) for r in batch], schema=schema))
+                batch = []
+        if batch:
+            writer.write_table(pa.Table.from_pylist([dict(zip(COLUMNS, r)) for r in batch], schema=schema))
+
+
+_WRITERS = {"csv": _write_csv, "xlsx": _write_xlsx, "parquet": _write_parquet}
+
+
+def generate_report(video_id, fmt="xlsx", results=None):
+    """
+    Gera (ou reaproveita do cache) o relatório do vídeo e retorna o caminho do arquivo.
+    Bloqueante: chamar via asyncio.to_thread.
+    """
+    if fmt not in _WRITERS:
+        raise ValueError(f"Formato de relatório inválido: {fmt}")
+    events, cfg_hash = latest_events(video_id)
+    if events is None:
+        return None
+
+    path = report_path(video_id, cfg_hash, fmt)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(events):
+        return path
+
+    # Temporário único: duas requisições gerando o mesmo relatório não escrevem no mesmo arquivo
+    fd, tmp = tempfile.mkstemp(dir=config.REPORTS_DIR, prefix=os.path.basename(path) + ".", suffix=".part")
+    os.close(fd)
+    try:
+        _WRITERS[fmt](iter_rows(events, results), tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp): os.remove(tmp)
+    return path
@@ -0,0 +1,103 @@
+"""
+Uploads endereçados por conteúdo e cache de resultados.
+
+Cada upload tem o SHA-256 calculado enquanto é gravado. Arquivos idênticos viram hardlinks do mesmo
+conteúdo (cada vídeo continua com seu próprio nome, então exclusão e retenção não mudam), e o resultado
+de um processamento fica registrado pela chave (hash do conteúdo, linhas, parâmetros do tracker, versão
+dos modelos). Reenviar a mesma combinação reaproveita vídeo processado, log de eventos e contagens na hora.
+"""
+
+import functools
+import hashlib
+import json
+import os
+import shutil
+
+from . import config, reports
+
+
+def store_upload(src, dest_path, chunk_size=None):
+    """Copia o upload em blocos calculando o hash. Retorna (sha256, bytes). Bloqueante: rodar em thread."""
+    chunk_size = chunk_size or config.UPLOAD_CHUNK_BYTES
+    h, size = hashlib.sha256(), 0
+    tmp = dest_path + ".uploading"
+    with open(tmp, "wb") as out:
+        while True:
+            chunk = src.read(chunk_size)
+            if not chunk: break
+            h.update(chunk)
+            out.write(chunk)
+            size += len(chunk)
+    os.replace(tmp, dest_path)
+    return h.hexdigest(), size
+
+
+def file_sha256(path, chunk_size=None):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size or config.UPLOAD_CHUNK_BYTES), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def link_or_copy(src, dst):
+    """Hardlink (mesmo conteúdo, sem ocupar disco de novo); cópia se o sistema de arquivos não suportar."""
+    if os.path.exists(dst): os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def dedupe_upload(new_path, existing_path):
+    """Troca o upload recém-gravado por um hardlink do arquivo idêntico já existente."""
+    if not existing_path or not os.path.exists(existing_path) or os.path.samefile(new_path, existing_path):
+        return False
+    try:
+        tmp = new_path + ".link"
+        os.link(existing_path, tmp)
+        os.replace(tmp, new_path)
+        return True
+    except OSError:
+        return False
+
+
+@functools.lru_cache(maxsize=1)
+def model_version():
+    """Hash dos pesos (YOLO + ReID) e dos parâmetros de detecção. Calculado uma vez: rodar em thread."""
+    h = hashlib.sha1(json.dumps(config.DETECTION_PARAMS, sort_keys=True).encode())
+    for path in (config.YOLO_MODEL_PATH, config.REID_MODEL_PATH):
+        h.update(os.path.basename(path).encode())
+        if os.path.exists(path):
+            h.update(file_sha256(path).encode())
+    return h.hexdigest()[:12]
+
+
+def tracker_version():
+    return hashlib.sha1(json.dumps(config.BOTSORT_PARAMS, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def cache_key(content_hash, cfg_hash):
+    raw = f"{content_hash}:{cfg_hash}:{tracker_version()}:{model_version()}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def restore(entry, video_id):
+    """
+    Reaproveita um resultado em cache para `video_id` (links do vídeo processado e do log de eventos).
+    Retorna o caminho do vídeo processado, ou None se os arquivos do cache já foram removidos (retenção).
+    """
+    if not (entry.processed_video_path and os.path.exists(entry.processed_video_path)
+            and entry.events_path and os.path.exists(entry.events_path)):
+        return None
+    out_path = os.path.join(config.OUTPUT_DIR, f"{video_id}_processed.mp4")
+    if os.path.abspath(entry.processed_video_path) != os.path.abspath(out_path):
+        link_or_copy(entry.processed_video_path, out_path)
+    events = reports.events_path(video_id, entry.cfg_hash)
+    if os.path.abspath(entry.events_path) != os.path.abspath(events):
+        link_or_copy(entry.events_path, events)
+        # Trajetórias ficam ao lado do log de eventos
+        tracks = reports.tracks_path(entry.source_video_id, entry.cfg_hash)
+        if os.path.exists(tracks):
+            link_or_copy(tracks, reports.tracks_path(video_id, entry.cfg_hash))
+    return out_path
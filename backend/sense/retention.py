@@ -0,0 +1,252 @@
+"""
+Retenção de mídia e histórico: mantém cada pasta de static/ dentro de um orçamento de bytes e idade
+(removendo primeiro os arquivos acessados há mais tempo - LRU por atime) e compacta as sessões ao vivo
+antigas em rollups. Roda em background; com dry_run só calcula e registra o que seria removido.
+"""
+
+import asyncio
+import os
+import shutil
+import time
+from datetime import datetime, timedelta
+
+from . import config
+import crud
+from database import SessionLocal
+
+_GB = 1024 ** 3
+
+# Sufixos de arquivo -> video_id (para atualizar o banco quando a mídia de um vídeo é removida)
+_PROCESSED_SUFFIX = "_processed.mp4"
+
+
+def _scan(directory, now, min_age_s):
+    """
+    Lista (caminho, tamanho, último acesso, inode, nº de links) dos arquivos da pasta e o total em bytes.
+    Arquivos recentes ficam de fora.
+    """
+    files, total = [], 0
+    inodes = set()
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return files, total
+    for entry in entries:
+        if not entry.is_file(follow_symlinks=False): continue
+        try:
+            st = os.stat(entry.path, follow_symlinks=False) # st_ino confiável (o scandir no Windows não preenche)
+        except FileNotFoundError:
+            continue
+        # Uploads/resultados deduplicados são hardlinks: o uso da pasta conta cada conteúdo uma vez
+        if (st.st_dev, st.st_ino) not in inodes:
+            total += st.st_size
+            inodes.add((st.st_dev, st.st_ino))
+        # relatime/noatime: o atime pode ficar para trás do mtime
+        last_access = max(st.st_atime, st.st_mtime)
+        if now - st.st_mtime < min_age_s: continue
+        files.append((entry.path, st.st_size, last_access, (st.st_dev, st.st_ino), st.st_nlink))
+    return files, total
+
+
+class _LinkTracker:
+    """Bytes liberados por remoção: um hardlink só libera espaço quando o último link do inode sai."""
+
+    def __init__(self, files):
+        self.candidates = {} # inode -> links entre os candidatos
+        for f in files:
+            self.candidates[f[3]] = self.candidates.get(f[3], 0) + 1
+        self.planned = {}
+
+    def can_free(self, f):
+        """Todos os links do inode podem ser removidos (nenhum fora das pastas, protegido ou recente)."""
+        return self.candidates.get(f[3], 0) >= f[4]
+
+    def remove(self, f):
+        """Marca o link como removido; retorna os bytes liberados (0 enquanto restar outro link)."""
+        n = self.planned[f[3]] = self.planned.get(f[3], 0) + 1
+        return f[1] if n >= f[4] else 0
+
+
+class RetentionService:
+    def __init__(self, budgets=None, min_free_gb=None, min_age_s=None, live_retention_days=None, dry_run=None):
+        """
+        Args:
+            budgets: {pasta: (GB máximos, dias máximos sem acesso)}. None em um dos limites = sem limite
+            min_free_gb: Espaço livre mínimo no disco (remove LRU de todas as pastas abaixo disso)
+            min_age_s: Arquivos modificados há menos tempo que isso nunca são removidos
+            live_retention_days: Idade a partir da qual sessões ao vivo viram rollups
+            dry_run: Só calcula o que seria removido
+        """
+        self.budgets = budgets if budgets is not None else config.RETENTION_BUDGETS
+        self.min_free_gb = config.RETENTION_MIN_FREE_GB if min_free_gb is None else min_free_gb
+        self.min_age_s = config.RETENTION_MIN_AGE_S if min_age_s is None else min_age_s
+        self.live_retention_days = config.LIVE_SESSION_RETENTION_DAYS if live_retention_days is None else live_retention_days
+        self.dry_run = config.RETENTION_DRY_RUN if dry_run is None else dry_run
+
+        # Chamado antes de cada execução: ids de vídeos em uso (nunca removidos)
+        self.protected_ids = lambda: set()
+        self.last_run = None
+        self.runs_total = 0
+        self.bytes_freed_total = 0
+        self.files_removed_total = 0
+        self.sessions_compacted_total = 0
+        self.errors_total = 0
+
+    def _is_protected(self, path, protected):
+        name = os.path.basename(path)
+        return any(name.startswith(vid) for vid in protected)
+
+    def _plan_files(self, protected, now):
+        """Escolhe os arquivos a remover: idade máxima, depois orçamento de bytes por pasta, depois espaço livre."""
+        plan = {} # caminho -> (pasta, bytes liberados, motivo)
+        usage = {}
+        candidates = []
+
+        scanned = {}
+        for directory in self.budgets:
+            files, usage[directory] = _scan(directory, now, self.min_age_s)
+            files = [f for f in files if not self._is_protected(f[0], protected)]
+            files.sort(key=lambda f: f[2]) # LRU: menos acessados primeiro
+            scanned[directory] = files
+        links = _LinkTracker([f for files in scanned.values() for f in files])
+
+        for directory, (max_gb, max_days) in self.budgets.items():
+            files = scanned[directory]
+            if max_days:
+                for f in files:
+                    if now - f[2] > max_days * 86400:
+                        plan[f[0]] = (directory, links.remove(f), "age")
+            remaining = usage[directory] - sum(v[1] for v in plan.values() if v[0] == directory)
+            if max_gb is not None:
+                for f in files:
+                    if remaining <= max_gb * _GB: break
+                    # Hardlink com outro link que não pode sair: removê-lo não libera nada
+                    if f[0] in plan or not links.can_free(f): continue
+                    freed = links.remove(f)
+                    plan[f[0]] = (directory, freed, "budget")
+                    remaining -= freed
+            candidates.extend((f, directory) for f in files if f[0] not in plan)
+
+        # Pressão de disco: remove os menos acessados de qualquer pasta até voltar ao mínimo livre
+        if self.min_free_gb and self.budgets:
+            try:
+                free = shutil.disk_usage(config.STATIC_DIR).free + sum(v[1] for v in plan.values())
+            except OSError:
+                free = None
+            if free is not None and free < self.min_free_gb * _GB:
+                candidates.sort(key=lambda c: c[0][2])
+                for f, directory in candidates:
+                    if free >= self.min_free_gb * _GB: break
+                    if not links.can_free(f): continue
+                    freed = links.remove(f)
+                    plan[f[0]] = (directory, freed, "disk")
+                    free += freed
+        return plan, usage
+
+    def run_once(self, dry_run=None):
+        """Uma passada completa (bloqueante: chamar via asyncio.to_thread)."""
+        dry_run = self.dry_run if dry_run is None else dry_run
+        t0 = time.perf_counter()
+        now = time.time()
+        protected = set(self.protected_ids())
+        plan, usage = self._plan_files(protected, now)
+
+        removed, freed, by_reason, by_dir = [], 0, {}, {}
+        processed_gone, uploads_gone, frames_gone = [], [], []
+        for path, (directory, size, reason) in sorted(plan.items()):
+            if not dry_run:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                except OSError as e:
+                    self.errors_total += 1
+                    print(f"⚠️ Retenção: falha ao remover {path}: {e}")
+                    continue
+                name = os.path.basename(path)
+                if directory == config.OUTPUT_DIR and name.endswith(_PROCESSED_SUFFIX):
+                    processed_gone.append(name[:-len(_PROCESSED_SUFFIX)])
+                elif directory == config.UPLOAD_DIR:
+                    uploads_gone.append(path)
+                elif directory == config.FRAMES_DIR:
+                    frames_gone.append(path)
+            removed.append({"path": os.path.relpath(path, config.STATIC_DIR), "bytes": size, "reason": reason})
+            freed += size
+            by_reason[reason] = by_reason.get(reason, 0) + size
+            key = os.path.basename(directory)
+            by_dir[key] = by_dir.get(key, 0) + size
+
+        compacted = {"sessions": 0, "folded": 0, "flagged": 0}
+        with SessionLocal() as db:
+            try:
+                for video_id in processed_gone:
+                    crud.clear_processed_video(db, video_id, commit=False)
+                # Original/primeiro frame apagados: o vídeo não pode mais ser processado (/process-video/ responde 410)
+                crud.clear_evicted_sources(db, uploads_gone, frames_gone, commit=False)
+                db.commit()
+                if self.live_retention_days:
+                    before = datetime.now() - timedelta(days=self.live_retention_days)
+                    compacted = crud.compact_live_sessions(db, before, dry_run=dry_run)
+            except Exception as e:
+                db.rollback()
+                self.errors_total += 1
+                print(f"❌ Retenção: erro ao compactar o histórico: {e}")
+
+        result = {
+            "finished_at": datetime.now().isoformat(timespec="seconds"),
+            "dry_run": dry_run,
+            "duration_ms": round((time.perf_counter() - t0) * 1000, 1),
+            "files_removed": len(removed),
+            "bytes_freed": freed,
+            "bytes_by_reason": by_reason,
+            "bytes_by_dir": by_dir,
+            "usage_bytes": {os.path.basename(d): v for d, v in usage.items()},
+            "sessions_compacted": compacted["sessions"],
+            "sessions_folded": compacted["folded"],
+            "sessions_flagged": compacted["flagged"],
+            "files": removed[:200],
+        }
+        self.last_run = result
+        self.runs_total += 1
+        if not dry_run:
+            self.bytes_freed_total += freed
+            self.files_removed_total += len(removed)
+            self.sessions_compacted_total += compacted["sessions"]
+
+        if removed or compacted["sessions"]:
+            prefix = "🧪 [dry-run] Retenção removeria" if dry_run else "🧹 Retenção removeu"
+            print(f"{prefix} {len(removed)} arquivos ({freed / 1024**2:.1f} MB) e {compacted['sessions']} sessões ao vivo")
+        return result
+
+    def stats(self):
+        try:
+            disk = shutil.disk_usage(config.STATIC_DIR)
+            disk_info = {"total_bytes": disk.total, "free_bytes": disk.free}
+        except OSError:
+            disk_info = None
+        return {
+            "dry_run": self.dry_run,
+            "runs_total": self.runs_total,
+            "files_removed_total": self.files_removed_total,
+            "bytes_freed_total": self.bytes_freed_total,
+            "sessions_compacted_total": self.sessions_compacted_total,
+            "errors_total": self.errors_total,
+            "disk": disk_info,
+            "budgets": {os.path.basename(d): {"max_gb": gb, "max_days": days} for d, (gb, days) in self.budgets.items()},
+            "last_run": self.last_run,
+        }
+
+    async def loop(self, interval=None):
+        interval = interval or config.RETENTION_INTERVAL_S
+        print(f"🧹 Retenção iniciada (a cada {interval:.0f}s{', dry-run' if self.dry_run else ''}).")
+        while True:
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                self.errors_total += 1
+                print(f"❌ Erro na retenção: {e}")
+            await asyncio.sleep(interval)
+
+
+# Instância compartilhada por toda a API
+service = RetentionService()
@@ -0,0 +1,89 @@
+"""
+Janelas de processamento das câmeras (horário de início/fim e dias da semana).
+Calcula se a câmera deve estar ativa agora e quando é a próxima transição,
+para o scheduler dormir até o próximo limite em vez de consultar o banco em polling.
+"""
+
+from datetime import datetime, timedelta
+
+# 0 = segunda ... 6 = domingo (datetime.weekday())
+ALL_DAYS = frozenset(range(7))
+
+
+def parse_hhmm(value):
+    """'08:30' -> timedelta(hours=8, minutes=30). Retorna None se inválido."""
+    try:
+        h, _, m = str(value).strip().partition(':')
+        h, m = int(h), int(m or 0)
+    except (TypeError, ValueError):
+        return None
+    if not (0 <= h <= 24 and 0 <= m < 60) or (h == 24 and m):
+        return None
+    return timedelta(hours=h, minutes=m)
+
+
+def parse_days(value):
+    """
+    '0,1,2,3,4' -> {0, 1, 2, 3, 4}. None = todos os dias (sem restrição configurada);
+    '' = nenhum dia (todos desmarcados no frontend: a câmera nunca liga pelo agendamento).
+    """
+    if value is None:
+        return ALL_DAYS
+    days = set()
+    for part in str(value).split(','):
+        part = part.strip()
+        if part.isdigit() and int(part) < 7:
+            days.add(int(part))
+    # Texto sem nenhum dia válido (lixo): mantém o comportamento anterior em vez de desligar a câmera
+    return frozenset(days) if days or not str(value).strip() else ALL_DAYS
+
+
+class Schedule:
+    def __init__(self, start, end, days=None):
+        """
+        Args:
+            start: Horário de início ('HH:MM')
+            end: Horário de fim ('HH:MM'). Se for menor que o início, a janela cruza a meia-noite
+                 (ex: 22:00-06:00). Início == fim = dia inteiro.
+            days: Dias da semana em que a janela COMEÇA ('0,1,2,3,4' = seg-sex)
+        """
+        self.start = parse_hhmm(start)
+        self.end = parse_hhmm(end)
+        self.days = parse_days(days)
+        if self.start is None or self.end is None:
+            raise ValueError(f"Horário inválido: {start}-{end}")
+        self.duration = (self.end - self.start) % timedelta(days=1) or timedelta(days=1)
+
+    @classmethod
+    def from_device(cls, dev):
+        """Schedule do Device ou None se a câmera não tiver agendamento válido."""
+        if not dev.processing_start_time or not dev.processing_end_time or not dev.lines_config:
+            return None
+        try:
+            return cls(dev.processing_start_time, dev.processing_end_time, getattr(dev, "processing_days", None))
+        except ValueError:
+            return None
+
+    def _windows(self, now):
+        """Janelas (início, fim) que podem conter `now` ou começar na próxima semana."""
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        for offset in range(-1, 8):
+            day = today + timedelta(days=offset)
+            if day.weekday() in self.days:
+                begin = day + self.start
+                yield begin, begin + self.duration
+
+    def is_active(self, now=None):
+        now = now or datetime.now()
+        return any(begin <= now < end for begin, end in self._windows(now))
+
+    def window_start(self, now=None):
+        """Início da janela ativa que contém `now` (None fora do horário)."""
+        now = now or datetime.now()
+        return max((begin for begin, end in self._windows(now) if begin <= now < end), default=None)
+
+    def next_transition(self, now=None):
+        """Próximo instante (> now) em que a câmera deve iniciar ou parar."""
+        now = now or datetime.now()
+        boundaries = [t for w in self._windows(now) for t in w if t > now]
+        return min(boundaries) if boundaries else None
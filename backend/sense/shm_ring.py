@@ -0,0 +1,267 @@
+"""
+Transporte de frames por memória compartilhada (multiprocessing.shared_memory).
+Um processo leitor por câmera decodifica o RTSP (FFmpeg) direto para um ring de slots;
+os consumidores (inferência) anexam ao ring e leem os frames sem pickle nem cópia.
+
+Este módulo não importa torch/config para que o processo leitor suba leve.
+"""
+
+import contextlib
+import multiprocessing as mp
+import subprocess
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Estados de cada slot
+EMPTY, WRITING, READY, READING = 0, 1, 2, 3
+STATE_NAMES = {EMPTY: "empty", WRITING: "writing", READY: "ready", READING: "reading"}
+
+# Cabeçalho global (int64): write_seq, read_seq, dropped, width, height, slots, restarts
+_H_WRITE_SEQ, _H_READ_SEQ, _H_DROPPED, _H_WIDTH, _H_HEIGHT, _H_SLOTS, _H_RESTARTS = range(7)
+_HEADER_LEN = 8
+# Cabeçalho por slot (int64): seq, state, ts (ns)
+_S_SEQ, _S_STATE, _S_TS = range(3)
+_SLOT_HEADER_LEN = 3
+
+
+class FrameRing:
+    def __init__(self, shm, owner=False, lock=None):
+        """
+        lock: multiprocessing.Lock compartilhado por escritor e consumidor. Toda transição de estado dos slots
+        (verificar + trocar) acontece sob ele; sem isso o escritor pode ver READY e marcar WRITING no mesmo
+        instante em que o consumidor marca READING, e a inferência roda num frame sendo sobrescrito.
+        """
+        self.shm = shm
+        self.owner = owner
+        self.lock = lock
+        self.header = np.ndarray((_HEADER_LEN,), dtype=np.int64, buffer=shm.buf)
+        self.slots = int(self.header[_H_SLOTS])
+        self.width = int(self.header[_H_WIDTH])
+        self.height = int(self.header[_H_HEIGHT])
+        self.frame_size = self.width * self.height * 3
+
+        offset = self.header.nbytes
+        self.slot_header = np.ndarray((self.slots, _SLOT_HEADER_LEN), dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += self.slot_header.nbytes
+        self.data = np.ndarray((self.slots, self.height, self.width, 3), dtype=np.uint8, buffer=shm.buf, offset=offset)
+        self._next = 0
+
+    def _guard(self):
+        return self.lock if self.lock is not None else contextlib.nullcontext()
+
+    @classmethod
+    def create(cls, name, width, height, slots=4, lock=None):
+        size = (_HEADER_LEN + slots * _SLOT_HEADER_LEN) * 8 + slots * width * height * 3
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((_HEADER_LEN,), dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[_H_WIDTH], header[_H_HEIGHT], header[_H_SLOTS] = width, height, slots
+        ring = cls(shm, owner=True, lock=lock)
+        ring.slot_header[:] = 0
+        return ring
+
+    @classmethod
+    def attach(cls, name, lock=None):
+        return cls(shared_memory.SharedMemory(name=name), lock=lock)
+
+    # --- Lado do escritor (processo leitor da câmera) ---
+    def begin_write(self):
+        """Reserva o próximo slot livre (pulando os que estão em leitura) e retorna (idx, memoryview)."""
+        for _ in range(self.slots):
+            idx = self._next
+            self._next = (self._next + 1) % self.slots
+            with self._guard():
+                if self.slot_header[idx, _S_STATE] == READING: continue
+                # Sobrescrevendo um frame que nunca foi lido: descarte explícito
+                if self.slot_header[idx, _S_STATE] == READY and self.slot_header[idx, _S_SEQ] > self.header[_H_READ_SEQ]:
+                    self.header[_H_DROPPED] += 1
+                self.slot_header[idx, _S_STATE] = WRITING
+            return idx, memoryview(self.data[idx]).cast('B')
+        return None, None
+
+    def commit(self, idx, ts=None):
+        with self._guard():
+            seq = int(self.header[_H_WRITE_SEQ]) + 1
+            self.slot_header[idx, _S_SEQ] = seq
+            self.slot_header[idx, _S_TS] = int((ts or time.time()) * 1e9)
+            self.slot_header[idx, _S_STATE] = READY
+            self.header[_H_WRITE_SEQ] = seq
+        return seq
+
+    def abort(self, idx):
+        with self._guard():
+            self.slot_header[idx, _S_STATE] = EMPTY
+
+    # --- Lado do consumidor (inferência) ---
+    def read_latest(self, after_seq=0):
+        """
+        Retorna (idx, seq, ts, frame) do frame pronto mais recente com seq > after_seq, ou None.
+        `frame` é uma view direta na memória compartilhada (sem cópia): chame release(idx) ao terminar.
+        """
+        with self._guard():
+            ready = [i for i in range(self.slots)
+                     if self.slot_header[i, _S_STATE] == READY and self.slot_header[i, _S_SEQ] > after_seq]
+            if not ready: return None
+            idx = max(ready, key=lambda i: self.slot_header[i, _S_SEQ])
+            self.slot_header[idx, _S_STATE] = READING
+            seq = int(self.slot_header[idx, _S_SEQ])
+            ts = float(self.slot_header[idx, _S_TS]) / 1e9
+            self.header[_H_READ_SEQ] = seq
+        return idx, seq, ts, self.data[idx]
+
+    def is_valid(self, idx, seq):
+        """Confere se o slot ainda contém o frame `seq` e continua em leitura (não foi sobrescrito durante a inferência)."""
+        with self._guard():
+            return int(self.slot_header[idx, _S_SEQ]) == seq and self.slot_header[idx, _S_STATE] == READING
+
+    def release(self, idx):
+        with self._guard():
+            if self.slot_header[idx, _S_STATE] == READING:
+                self.slot_header[idx, _S_STATE] = EMPTY
+
+    def stats(self):
+        write_seq, read_seq = int(self.header[_H_WRITE_SEQ]), int(self.header[_H_READ_SEQ])
+        return {
+            "write_seq": write_seq,
+            "read_seq": read_seq,
+            "lag": write_seq - read_seq,
+            "dropped": int(self.header[_H_DROPPED]),
+            "restarts": int(self.header[_H_RESTARTS]),
+            "slots": [STATE_NAMES.get(int(s), "?") for s in self.slot_header[:, _S_STATE]],
+        }
+
+    def close(self):
+        # Libera as views antes de fechar o segmento
+        self.header = self.slot_header = self.data = None
+        try: self.shm.close()
+        except BufferError: pass # Ainda há frames em uso; o SO libera ao fim do processo
+        if self.owner:
+            try: self.shm.unlink()
+            except FileNotFoundError: pass
+
+
+def reader_process_main(ring_name, command, stop_event, lock=None, restart_delay=0.5):
+    """Processo leitor: FFmpeg -> slots do ring (readinto direto na memória compartilhada)."""
+    ring = FrameRing.attach(ring_name, lock=lock)
+    process = None
+    try:
+        while not stop_event.is_set():
+            if process is None:
+                process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=0)
+
+            idx, view = ring.begin_write()
+            if idx is None:
+                time.sleep(0.005)
+                continue
+
+            pos = 0
+            while pos < ring.frame_size:
+                n = process.stdout.readinto(view[pos:])
+                if not n: break
+                pos += n
+            view.release()
+
+            if pos < ring.frame_size:
+                ring.abort(idx)
+                if stop_event.is_set(): break
+                print("⚠️ Frame incompleto (shm). Reiniciando pipe...")
+                ring.header[_H_RESTARTS] += 1
+                process.terminate()
+                process = None
+                time.sleep(restart_delay)
+                continue
+
+            ring.commit(idx)
+    finally:
+        if process: process.terminate()
+        ring.close()
+
+
+class ShmFrameSource:
+    """
+    Fonte de frames com a mesma interface do LatestFrameReader (start/get/mark_processed/stats/stop),
+    mas com a decodificação rodando em um processo separado.
+    """
+
+    def __init__(self, name, command, width, height, slots=4):
+        self.name = name
+        self.command = command
+        self.width = width
+        self.height = height
+        self.slots = slots
+        self.ring = None
+        self.process = None
+        self._stop = None
+        self._held = None
+        self._last_seq = 0
+
+        self.frames_processed = 0
+        self.frames_torn = 0
+        self.latency_ms = 0.0
+        self.max_latency_ms = 0.0
+
+    @property
+    def restarts(self):
+        return self.ring.stats()["restarts"] if self.ring else 0
+
+    def start(self):
+        # 'spawn' evita herdar o estado do processo da API (CUDA, event loop)
+        ctx = mp.get_context("spawn")
+        lock = ctx.Lock()
+        self.ring = FrameRing.create(self.name, self.width, self.height, self.slots, lock=lock)
+        self._stop = ctx.Event()
+        self.process = ctx.Process(target=reader_process_main, args=(self.name, self.command, self._stop, lock), daemon=True)
+        self.process.start()
+        return self
+
+    def get(self, timeout=2.0):
+        # Libera o frame anterior: o consumidor terminou de usá-lo
+        if self._held is not None:
+            self.ring.release(self._held)
+            self._held = None
+
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            item = self.ring.read_latest(self._last_seq)
+            if item:
+                idx, seq, ts, frame = item
+                self._held, self._last_seq = idx, seq
+                return seq, ts, frame
+            time.sleep(0.002)
+        return None
+
+    def is_valid(self, seq):
+        """O frame `seq` devolvido por get() continua intacto no slot (conferir depois da inferência)."""
+        if self._held is not None and self.ring.is_valid(self._held, seq): return True
+        self.frames_torn += 1
+        return False
+
+    def mark_processed(self, ts):
+        latency = (time.time() - ts) * 1000
+        self.frames_processed += 1
+        self.latency_ms = latency if self.frames_processed == 1 else 0.9 * self.latency_ms + 0.1 * latency
+        self.max_latency_ms = max(self.max_latency_ms, latency)
+
+    def stats(self):
+        ring = self.ring.stats()
+        return {
+            "frames_read": ring["write_seq"],
+            "frames_processed": self.frames_processed,
+            "frames_dropped": ring["dropped"],
+            "frames_torn": self.frames_torn,
+            "drop_rate": round(ring["dropped"] / ring["write_seq"], 3) if ring["write_seq"] else 0.0,
+            "latency_ms": round(self.latency_ms, 1),
+            "max_latency_ms": round(self.max_latency_ms, 1),
+            "lag": ring["lag"],
+            "slots": ring["slots"],
+            "restarts": ring["restarts"],
+        }
+
+    def stop(self):
+        if self._stop is not None: self._stop.set()
+        if self.process is not None:
+            self.process.join(timeout=2.0)
+            if self.process.is_alive(): self.process.terminate()
+        if self.ring is not None: self.ring.close()
@@ -4,6 +4,7 @@ from boxmot import BotSort
 import torch
 import numpy as np
 import time
+import copy
 
 from . import config
 from .reid_osnet import OSNetWrapper
@@ -31,33 +32,46 @@ class VideoProcessor:
 
         # 3. Inicializa BoT-SORT (Versão Simplificada)
         print("[Tracker] Inicializando BoT-SORT...")
-        self.tracker = BotSort(
+        self.tracker = self._new_tracker()
+
+        # Tempo (s) por etapa do último process_frame: detect / reid / track
+        self.last_timings = {}
+        
+        print("✅ VideoProcessor (BoT-SORT) pronto!")
+
+    def _new_tracker(self):
+        return BotSort(
             reid_weights=self.reid_model, # O tracker usa o ReID internamente
             device=self.device,
             half=True,                    # FP16 para performance
-            track_high_thresh=0.45,        # Confiança para detecções boas
-            new_track_thresh=0.6,         # Confiança para criar novo rastro
-            match_thresh=0.7,             # IoU para associação
-            track_buffer=90,
-    
-            # Proximidade (evita que IDs pulem entre pessoas muito próximas)
-            proximity_thresh=0.5,
-            appearance_thresh=0.25,
+            **config.BOTSORT_PARAMS,
         )
-        
-        print("✅ VideoProcessor (BoT-SORT) pronto!")
 
-    def process_frame(self, frame):
+    def fork(self):
+        """
+        Cópia que compartilha YOLO e ReID (sem duplicar memória de GPU) mas tem seu próprio tracker.
+        Usada pelos workers offline: cada vídeo precisa de IDs de track independentes.
+        """
+        clone = copy.copy(self)
+        clone.tracker = self._new_tracker()
+        return clone
+
+    def process_frame(self, frame, imgsz=None):
+        """imgsz: tamanho de entrada da detecção só para esta chamada (estimativa rápida); None = DETECTION_PARAMS."""
+        t0 = time.perf_counter()
+        params = config.DETECTION_PARAMS if imgsz is None else dict(config.DETECTION_PARAMS, imgsz=imgsz)
         # Detecção YOLO OTIMIZADA
         results = self.yolo_model(frame, 
-                                  imgsz=640, 
-                                  conf=0.4, 
-                                  iou=0.5, 
+                                  **params,
                                   half=True, 
                                   verbose=False)
         
+        t1 = time.perf_counter()
+        self.reid_model.take_elapsed()
+
         if len(results[0].boxes) == 0:
             self.tracker.update(np.empty((0, 6)), frame)
+            self._set_timings(t0, t1)
             return []
 
         # O BoT-SORT espera: [x1, y1, x2, y2, conf, class_id]
@@ -65,6 +79,7 @@ class VideoProcessor:
         
         # Atualiza Tracker (Associação por movimento + aparência visual)
         tracks = self.tracker.update(detections, frame)
+        self._set_timings(t0, t1)
         
         processed_data = []
         if len(tracks) > 0:
@@ -85,6 +100,11 @@ class VideoProcessor:
         
         return processed_data
 
+    def _set_timings(self, t0, t1):
+        # O ReID roda dentro do tracker.update: é descontado do tempo do tracker
+        reid = self.reid_model.take_elapsed()
+        self.last_timings = {"detect": t1 - t0, "reid": reid, "track": max(0.0, time.perf_counter() - t1 - reid)}
+
     def draw_tracks(self, frame, tracks_data):
         for data in tracks_data:
             x1, y1, x2, y2 = data["bbox"]
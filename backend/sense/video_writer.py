@@ -0,0 +1,183 @@
+"""
+Gravação do vídeo de saída em H.264 via pipe para o ffmpeg.
+
+Os frames BGR vão para uma fila limitada e uma thread dedicada os escreve no stdin do ffmpeg
+(libx264, CRF/preset configuráveis, yuv420p + faststart: toca inline no navegador). O loop de
+inferência só enfileira; se o encoder ficar para trás, a fila cheia segura o produtor (backpressure)
+em vez de acumular frames na memória. Sem ffmpeg no PATH, cai para cv2.VideoWriter (mp4v).
+"""
+
+import asyncio
+import queue
+import shutil
+import subprocess
+import threading
+import time
+
+import cv2
+
+from . import config
+
+_STOP = object()
+_warned_fallback = False
+
+
+class FFmpegWriter:
+    def __init__(self, path, width, height, fps, crf=None, preset=None, queue_size=None):
+        """
+        Args:
+            path: Arquivo de saída (.mp4)
+            width, height: Dimensões dos frames recebidos
+            fps: Taxa de quadros do vídeo de saída
+            crf: Qualidade do x264 (menor = melhor/maior). Padrão config.OUTPUT_CRF
+            preset: Velocidade do x264 (ultrafast ... veryslow). Padrão config.OUTPUT_PRESET
+            queue_size: Frames aguardando o encoder antes de segurar o produtor
+        """
+        self.path = path
+        self.width, self.height = width, height
+        self.fps = fps or 30.0
+        crf = config.OUTPUT_CRF if crf is None else crf
+        preset = preset or config.OUTPUT_PRESET
+        cmd = [
+            'ffmpeg', '-v', 'error', '-y',
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}', '-r', f'{self.fps:.3f}', '-i', '-',
+            '-an', '-c:v', 'libx264', '-preset', preset, '-crf', str(crf),
+            # yuv420p exige dimensões pares; faststart move o índice para o início (play antes do download terminar)
+            '-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2', '-pix_fmt', 'yuv420p', '-movflags', '+faststart',
+            path,
+        ]
+        self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        self._queue = queue.Queue(maxsize=queue_size or config.OUTPUT_WRITER_QUEUE)
+        self._error = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"ffmpeg-writer-{id(self):x}", daemon=True)
+
+        # Métricas
+        self.frames_written = 0
+        self.encode_s = 0.0    # Tempo da thread escrevendo no pipe (inclui esperar o encoder)
+        self.blocked_s = 0.0   # Tempo que o produtor ficou segurado pela fila cheia
+        self.max_queue = 0
+        self.started_at = time.perf_counter()
+        self._thread.start()
+
+    def _run(self):
+        stdin = self._proc.stdin
+        while True:
+            try:
+                frame = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                # abort() com a fila cheia pode não ter conseguido enfileirar o _STOP
+                if self._closed and self._error is not None: break
+                continue
+            if frame is _STOP: break
+            if self._error is not None: continue # Drena a fila depois de um erro
+            t0 = time.perf_counter()
+            try:
+                stdin.write(frame.tobytes())
+            except (BrokenPipeError, OSError) as e:
+                self._error = e
+                continue
+            self.encode_s += time.perf_counter() - t0
+            self.frames_written += 1
+
+    def _check(self):
+        if self._error is not None:
+            raise RuntimeError(f"ffmpeg encerrou durante a gravação de {self.path}: {self._error}")
+
+    def write(self, frame):
+        """Enfileira um frame (bloqueia se o encoder estiver atrasado)."""
+        self._check()
+        try:
+            self._queue.put_nowait(frame)
+        except queue.Full:
+            t0 = time.perf_counter()
+            self._queue.put(frame)
+            self.blocked_s += time.perf_counter() - t0
+        self.max_queue = max(self.max_queue, self._queue.qsize())
+
+    async def awrite(self, frame):
+        """Versão para o event loop: só sai do loop (thread) quando a fila está cheia."""
+        self._check()
+        try:
+            self._queue.put_nowait(frame)
+        except queue.Full:
+            t0 = time.perf_counter()
+            await asyncio.to_thread(self._queue.put, frame)
+            self.blocked_s += time.perf_counter() - t0
+        self.max_queue = max(self.max_queue, self._queue.qsize())
+
+    def release(self):
+        """Espera o encoder terminar e fecha o arquivo (bloqueante). Levanta erro se o ffmpeg falhou."""
+        if self._closed: return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+        try: self._proc.stdin.close()
+        except OSError: pass
+        stderr = self._proc.stderr.read().decode(errors="replace")
+        code = self._proc.wait()
+        if code != 0 or self._error is not None:
+            raise RuntimeError(f"ffmpeg falhou ({code}) em {self.path}: {stderr.strip()[-300:]}")
+
+    def abort(self):
+        """Encerra sem finalizar o arquivo (job cancelado/servidor desligando)."""
+        if self._closed: return
+        self._closed = True
+        self._error = self._error or RuntimeError("abortado")
+        self._proc.kill() # Desbloqueia a thread se ela estiver presa no write do pipe
+        # Descarta os frames pendentes para o _STOP caber (com a fila cheia ele ficaria de fora e a thread vazaria)
+        try:
+            while True: self._queue.get_nowait()
+        except queue.Empty:
+            pass
+        try: self._queue.put_nowait(_STOP)
+        except queue.Full: pass # Produtor bloqueado ocupou a vaga: a thread sai pelo timeout do get
+
+    def stats(self):
+        elapsed = time.perf_counter() - self.started_at
+        return {
+            "encoder": "libx264",
+            "frames_written": self.frames_written,
+            "queue_depth": self._queue.qsize(),
+            "max_queue": self.max_queue,
+            "encode_fps": round(self.frames_written / self.encode_s, 1) if self.encode_s else None,
+            "encode_s": round(self.encode_s, 2),
+            "blocked_s": round(self.blocked_s, 2),
+            "elapsed_s": round(elapsed, 2),
+        }
+
+
+class CV2Writer:
+    """Fallback sem ffmpeg: mesma interface sobre cv2.VideoWriter (mp4v, sem thread)."""
+
+    def __init__(self, path, width, height, fps):
+        self.path = path
+        self._out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps or 30.0, (width, height))
+        self.frames_written = 0
+
+    def write(self, frame):
+        self._out.write(frame)
+        self.frames_written += 1
+
+    async def awrite(self, frame):
+        self.write(frame)
+
+    def release(self):
+        self._out.release()
+
+    def abort(self):
+        self._out.release()
+
+    def stats(self):
+        return {"encoder": "mp4v", "frames_written": self.frames_written}
+
+
+def open_writer(path, width, height, fps):
+    """Writer H.264 (ffmpeg) ou, sem ffmpeg instalado, o fallback mp4v."""
+    global _warned_fallback
+    if shutil.which('ffmpeg'):
+        return FFmpegWriter(path, width, height, fps)
+    if not _warned_fallback:
+        _warned_fallback = True
+        print("⚠️ ffmpeg não encontrado: gravando saída em mp4v (cv2.VideoWriter)")
+    return CV2Writer(path, width, height, fps)
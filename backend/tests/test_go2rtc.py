@@ -0,0 +1,134 @@
+"""Cliente do Go2RTC contra um servidor falso (httpx.MockTransport): retry/backoff, timeouts e cache de registros."""
+
+import asyncio
+
+import httpx
+import pytest
+
+from sense import go2rtc
+
+
+class FakeGo2RTC:
+    """Servidor falso: responde com os status da fila `script` (depois 200) e guarda as requisições."""
+
+    def __init__(self, script=()):
+        self.script = list(script)
+        self.requests = []
+
+    def __call__(self, request):
+        self.requests.append(request)
+        step = self.script.pop(0) if self.script else 200
+        if isinstance(step, Exception):
+            raise step
+        return httpx.Response(step, content=b"jpeg" if request.url.path.endswith("/frame.jpeg") else b"")
+
+    def calls(self, method):
+        return [r for r in self.requests if r.method == method]
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Registra as esperas do backoff sem dormir de verdade."""
+    delays = []
+
+    async def fake_sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(go2rtc.asyncio, "sleep", fake_sleep)
+    return delays
+
+
+def make_client(server, **kwargs):
+    return go2rtc.Go2RTCClient(base_url="http://go2rtc.test/api", transport=httpx.MockTransport(server), **kwargs)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_retries_5xx_with_exponential_backoff(sleeps):
+    server = FakeGo2RTC([503, 502])
+    client = make_client(server, retries=3, backoff=0.5)
+
+    assert run(client.ensure_stream("camera_1", "rtsp://cam/1")) is True
+    assert len(server.calls("PUT")) == 3
+    assert sleeps == [0.5, 1.0]
+
+
+def test_gives_up_after_retries(sleeps):
+    server = FakeGo2RTC([500] * 10)
+    client = make_client(server, retries=2, backoff=0.1)
+
+    with pytest.raises(go2rtc.Go2RTCError):
+        run(client.ensure_stream("camera_1", "rtsp://cam/1"))
+    assert len(server.requests) == 3
+    assert sleeps == [0.1, 0.2]
+    # Falha não entra no cache
+    assert "camera_1" not in client._registered
+
+
+def test_timeout_is_retried_then_raised(sleeps):
+    server = FakeGo2RTC([httpx.ReadTimeout("timeout")] * 10)
+    client = make_client(server, retries=1, timeout=2.0)
+
+    with pytest.raises(go2rtc.Go2RTCError):
+        run(client.ensure_stream("camera_1", "rtsp://cam/1"))
+    assert len(server.requests) == 2
+    # O timeout configurado chega em cada requisição
+    assert server.requests[0].extensions["timeout"]["read"] == 2.0
+
+
+def test_timeout_then_success(sleeps):
+    server = FakeGo2RTC([httpx.ConnectTimeout("timeout")])
+    client = make_client(server, retries=1)
+
+    assert run(client.ensure_stream("camera_1", "rtsp://cam/1")) is True
+    assert len(server.calls("PUT")) == 2
+
+
+def test_cache_skips_repeated_put(sleeps):
+    server = FakeGo2RTC()
+    client = make_client(server)
+
+    async def scenario():
+        await client.ensure_stream("camera_1", "rtsp://cam/1")
+        await client.ensure_stream("camera_1", "rtsp://cam/1")
+        # src diferente e force registram de novo
+        await client.ensure_stream("camera_1", "rtsp://cam/1b")
+        await client.ensure_stream("camera_1", "rtsp://cam/1b", force=True)
+
+    run(scenario())
+    puts = server.calls("PUT")
+    assert len(puts) == 3
+    assert puts[0].url.params["name"] == "camera_1"
+    assert puts[0].url.params["src"] == "rtsp://cam/1"
+
+
+def test_404_invalidates_cache(sleeps):
+    server = FakeGo2RTC()
+    client = make_client(server)
+
+    async def scenario():
+        await client.ensure_stream("camera_1", "rtsp://cam/1")
+        await client.ensure_stream("camera_2", "rtsp://cam/2")
+        # Go2RTC reiniciou: a stream sumiu
+        server.script = [404]
+        assert await client.get_frame("camera_1", attempts=2, wait=0) == b"jpeg"
+        await client.ensure_stream("camera_1", "rtsp://cam/1")
+        await client.ensure_stream("camera_2", "rtsp://cam/2")
+
+    run(scenario())
+    assert len(server.calls("PUT")) == 4
+
+
+def test_invalidate_forces_new_put(sleeps):
+    server = FakeGo2RTC()
+    client = make_client(server)
+
+    async def scenario():
+        await client.ensure_stream("camera_1", "rtsp://cam/1")
+        client.invalidate("camera_1")
+        await client.ensure_stream("camera_1", "rtsp://cam/1")
+
+    run(scenario())
+    assert len(server.calls("PUT")) == 2
@@ -3,6 +3,8 @@ import api, { getDeviceSnapshot, updateDeviceAdvanced, configureDevice, getDevic
 import './DeviceList.css';
 
 const API_BASE = 'http://localhost:8000';
+// 0 = segunda (mesmo índice do datetime.weekday() no backend)
+const WEEKDAYS = ['Seg', 'Ter', 'Qua', 'Qui', 'Sex', 'Sáb', 'Dom'];
 
 // --- COMPONENTE AUXILIAR DE DESENHO CORRIGIDO ---
 const DrawingCanvas = ({ imageUrl, entrantPoints, setEntrantPoints, passerbyPoints, setPasserbyPoints, activeLine, inSide }) => {
@@ -117,25 +119,40 @@ const DeviceList = () => {
     const [passerbyPoints, setPasserbyPoints] = useState([]);
     const [activeLine, setActiveLine] = useState('entrant');
     const [inSide, setInSide] = useState('right');
-    const [schedule, setSchedule] = useState({ start: "08:00", end: "18:00" });
+    const [groupName, setGroupName] = useState("");
+    const [schedule, setSchedule] = useState({ start: "08:00", end: "18:00", days: [0, 1, 2, 3, 4, 5, 6] });
     // ESTADO PARA MONITORAMENTO (STATS)
     const [statsDevice, setStatsDevice] = useState(null);
     const [liveStats, setLiveStats] = useState(null);
     const statsIntervalRef = useRef(null);
 
+    const statsSocketRef = useRef(null);
+
+    const closeStatsSocket = () => {
+        if (statsIntervalRef.current) clearInterval(statsIntervalRef.current);
+        if (statsSocketRef.current) statsSocketRef.current.close();
+        statsSocketRef.current = null;
+    };
+
     const handleOpenStats = (device) => {
         setStatsDevice(device);
         setLiveStats(null); // Limpa dados antigos
-        fetchStats(device.id); // Busca imediatamente
-        
-        // Inicia Polling a cada 2 segundos
-        if (statsIntervalRef.current) clearInterval(statsIntervalRef.current);
-        statsIntervalRef.current = setInterval(() => fetchStats(device.id), 2000);
+        closeStatsSocket();
+
+        // Push via WebSocket: o backend envia as contagens conforme mudam
+        const ws = new WebSocket(`${API_BASE.replace('http', 'ws')}/ws/devices/${device.id}/live`);
+        ws.onmessage = (e) => setLiveStats(JSON.parse(e.data));
+        // Fallback: se o WebSocket falhar, volta ao polling a cada 2 segundos
+        ws.onerror = () => {
+            fetchStats(device.id);
+            statsIntervalRef.current = setInterval(() => fetchStats(device.id), 2000);
+        };
+        statsSocketRef.current = ws;
     };
 
     const handleCloseStats = () => {
         setStatsDevice(null);
-        if (statsIntervalRef.current) clearInterval(statsIntervalRef.current);
+        closeStatsSocket();
     };
 
     const fetchStats = async (id) => {
@@ -147,11 +164,9 @@ const DeviceList = () => {
         }
     };
     
-    // Limpa intervalo ao desmontar componente
+    // Limpa intervalo e WebSocket ao desmontar componente
     useEffect(() => {
-        return () => {
-            if (statsIntervalRef.current) clearInterval(statsIntervalRef.current);
-        };
+        return () => closeStatsSocket();
     }, []);
 
     // Função para abrir o modal de configuração
@@ -175,10 +190,13 @@ const DeviceList = () => {
             if (device.processing_start_time) {
                 setSchedule({ 
                     start: device.processing_start_time, 
-                    end: device.processing_end_time 
+                    end: device.processing_end_time,
+                    // null = todos os dias; "" = nenhum dia marcado
+                    days: device.processing_days == null ? [0, 1, 2, 3, 4, 5, 6] : device.processing_days.split(',').filter(Boolean).map(Number)
                 });
             }
 
+            setGroupName(device.group_name || "");
             setConfigDevice(device);
         } catch (error) {
             console.error(error);
@@ -188,6 +206,7 @@ const DeviceList = () => {
 
     const handleSaveConfig = async () => {
         if (!configDevice) return;
+        if (schedule.days.length === 0 && !window.confirm("Nenhum dia da semana marcado: a câmera não será ligada pelo agendamento. Salvar assim mesmo?")) return;
         
         const linesConfig = {
             entrant: entrantPoints,
@@ -202,6 +221,8 @@ const DeviceList = () => {
             manufacturer: configDevice.manufacturer,
             processing_start_time: schedule.start,
             processing_end_time: schedule.end,
+            processing_days: schedule.days.join(','),
+            group_name: groupName,
             lines_config: linesConfig
         };
 
@@ -449,6 +470,29 @@ const DeviceList = () => {
                                     <label>Fim Processamento:</label>
                                     <input type="time" value={schedule.end} onChange={e => setSchedule({...schedule, end: e.target.value})} />
                                 </div>
+                                <div className="form-group">
+                                    <label>Grupo (Loja):</label>
+                                    <input type="text" value={groupName} placeholder="Ex: Loja Centro" onChange={e => setGroupName(e.target.value)} />
+                                </div>
+                                <div className="form-group">
+                                    <label>Dias da Semana:</label>
+                                    <div style={{display: 'flex', gap: '8px', flexWrap: 'wrap'}}>
+                                        {WEEKDAYS.map((label, day) => (
+                                            <label key={day} style={{display: 'flex', alignItems: 'center', gap: '3px'}}>
+                                                <input
+                                                    type="checkbox"
+                                                    checked={schedule.days.includes(day)}
+                                                    onChange={e => setSchedule({
+                                                        ...schedule,
+                                                        days: e.target.checked ? [...schedule.days, day].sort() : schedule.days.filter(d => d !== day)
+                                                    })}
+                                                />
+                                                {label}
+                                            </label>
+                                        ))}
+                                    </div>
+                                    <small>Fim menor que o início = a janela cruza a meia-noite.</small>
+                                </div>
                                 
                                 <div className="modal-actions" style={{marginTop: '50px'}}>
                                     <button onClick={() => setConfigDevice(null)}>Cancelar</button>
@@ -69,13 +69,16 @@ const VideoHistory = ({ refreshTrigger }) => {
     const [videos, setVideos] = useState([]);
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState('');
+    const [nextCursor, setNextCursor] = useState(null);
 
-    const fetchVideos = async () => {
+    const fetchVideos = async (cursor = null) => {
         try {
             setError('');
-            setLoading(true);
-            const response = await api.get('/videos/me/');
-            setVideos(response.data);
+            if (!cursor) setLoading(true);
+            // Histórico paginado: o backend devolve o cursor da próxima página no header
+            const response = await api.get('/videos/me/', { params: cursor ? { cursor } : {} });
+            setVideos(current => cursor ? [...current, ...response.data] : response.data);
+            setNextCursor(response.headers['x-next-cursor'] || null);
         } catch (err) {
             setError('Não foi possível carregar o histórico de vídeos.');
             console.error(err);
@@ -117,6 +120,9 @@ const VideoHistory = ({ refreshTrigger }) => {
                     ))}
                 </div>
             )}
+            {nextCursor && (
+                <button className="action-button" onClick={() => fetchVideos(nextCursor)}>Carregar mais</button>
+            )}
         </div>
     );
 };
@@ -104,9 +104,13 @@ const VideoUpload = ({ onProcessComplete }) => {
     const [dims, setDims] = useState(null);
     const [inSide, setInSide] = useState('right');
     const [reportUrl, setReportUrl] = useState(null);
+    const [jobId, setJobId] = useState(null);
+    const [queueInfo, setQueueInfo] = useState(null); // { position, eta_start_s } enquanto aguarda na fila
+    const [rate, setRate] = useState(null); // { fps, eta_s } da última mensagem de progresso
+    const [quick, setQuick] = useState(null); // Estimativa rápida: 'loading' ou resposta do mode=quick
     const ws = useRef(null);
 
-    const reset = () => { setStage('initial'); setVideoId(null); setEntrantPoints([]); setPasserbyPoints([]); setCounts(null); setOutputUrl(null); };
+    const reset = () => { setStage('initial'); setVideoId(null); setEntrantPoints([]); setPasserbyPoints([]); setCounts(null); setOutputUrl(null); setQuick(null); };
 
     const handleUpload = async (e) => {
         const file = e.target.files[0]; if(!file) return;
@@ -130,7 +134,7 @@ const VideoUpload = ({ onProcessComplete }) => {
         ws.current = new WebSocket(`ws://localhost:8000/ws/progress/${clientId}`);
         ws.current.onmessage = (e) => {
             const d = JSON.parse(e.data);
-            if(d.type==='progress') setProgress(Math.round(d.value));
+            if(d.type==='progress') { setQueueInfo(null); setProgress(Math.round(d.value)); setRate(d.fps ? { fps: d.fps, eta_s: d.eta_s } : null); }
             if(d.type==='results') { 
                 setCounts(d.value.counts); 
                 setReportUrl(`${API_BASE}${d.value.report_url}`);
@@ -148,11 +152,48 @@ const VideoUpload = ({ onProcessComplete }) => {
                 entrant_line_points: entrantPoints, passerby_line_points: passerbyPoints,
                 frame_dimensions: dims, in_side: inSide
             }, { headers: {Authorization: `Bearer ${token}`} });
-            setStreamUrl(`${API_BASE}${res.data.stream_url}`);
             setOutputUrl(`${API_BASE}${res.data.download_url}`);
+            if (res.data.cached) {
+                // Mesmo vídeo + mesmas linhas já processados: resultado na hora
+                ws.current.close();
+                setCounts(res.data.results);
+                setReportUrl(`${API_BASE}${res.data.report_url}`);
+                setStage('finished');
+                if (onProcessComplete) onProcessComplete();
+                return;
+            }
+            setStreamUrl(`${API_BASE}${res.data.stream_url}`);
+            setJobId(res.data.job_id);
+            if (res.data.position > 0) setQueueInfo({ position: res.data.position, eta_start_s: res.data.eta_start_s });
         } catch { setError('Erro ao processar'); setStage('drawing'); }
     };
 
+    const handleQuick = async () => {
+        if(entrantPoints.length<2 || passerbyPoints.length<2) return alert("Desenhe AMBAS as linhas!");
+        setQuick('loading');
+        try {
+            const token = localStorage.getItem('token');
+            const res = await api.post('/process-video/', {
+                video_id: videoId, client_id: uuidv4(), mode: 'quick',
+                entrant_line_points: entrantPoints, passerby_line_points: passerbyPoints,
+                frame_dimensions: dims, in_side: inSide
+            }, { headers: {Authorization: `Bearer ${token}`} });
+            setQuick(res.data);
+        } catch { setQuick(null); setError('Erro na estimativa rápida'); }
+    };
+
+    const QuickRange = ({ title, c }) => <li>{title}: <strong>~{c.value}</strong> ({c.low}–{c.high})</li>;
+
+    const handleCancel = async () => {
+        if (!jobId) return;
+        try {
+            await api.post(`/jobs/${jobId}/cancel`);
+            if (ws.current) ws.current.close();
+            setQueueInfo(null); setJobId(null); setStreamUrl(null); setProgress(0);
+            setStage('drawing');
+        } catch { setError('Não foi possível cancelar'); }
+    };
+
     const handleDownload = () => {
         if (!videoId) return;
         
@@ -179,10 +220,22 @@ const VideoUpload = ({ onProcessComplete }) => {
                     </div>
                     <DrawingCanvas imageUrl={firstFrameUrl} entrantPoints={entrantPoints} setEntrantPoints={setEntrantPoints} passerbyPoints={passerbyPoints} setPasserbyPoints={setPasserbyPoints} activeLine={activeLine} onImageLoad={setDims} inSide={inSide} />
                     <button className="custom-file-upload" style={{marginTop:'20px', background:'#28a745'}} onClick={handleProcess}>Processar Vídeo</button>
+                    <button className="custom-file-upload" style={{marginTop:'20px', marginLeft:'10px', background:'#555'}} onClick={handleQuick} disabled={quick==='loading'}>{quick==='loading' ? 'Estimando...' : 'Estimativa Rápida'}</button>
+                    {quick && quick!=='loading' && (
+                        <div className="stats-output">
+                            <h3>Estimativa Rápida</h3>
+                            <ul>
+                                <QuickRange title="Entrantes" c={quick.counts.entrantes}/>
+                                <QuickRange title="Passantes" c={quick.counts.passantes}/>
+                                <QuickRange title="Total" c={quick.counts.total_geral}/>
+                            </ul>
+                            <small>{quick.frames_sampled} frames amostrados em {quick.elapsed_s}s · {quick.calibrated ? `faixa de ${Math.round(quick.level*100)}% (${quick.calibration_samples} calibrações)` : 'faixa padrão (sem calibração suficiente)'}</small>
+                        </div>
+                    )}
                 </div>
             )}
 
-            {stage==='processing' && <div className="processing-view"><h3>Processando... {progress}%</h3><div style={{background:'#444', height:'10px', width:'100%'}}><div style={{background:'#00ff00', height:'100%', width:`${progress}%`}}></div></div>{streamUrl && <img src={streamUrl} style={{maxWidth:'100%', marginTop:'10px'}}/>}</div>}
+            {stage==='processing' && <div className="processing-view">{queueInfo ? <h3>Na fila: posição {queueInfo.position}{queueInfo.eta_start_s != null && ` (início em ~${Math.ceil(queueInfo.eta_start_s / 60)} min)`}</h3> : <h3>Processando... {progress}%{rate && ` (${Math.round(rate.fps)} fps${rate.eta_s != null ? `, ~${Math.ceil(rate.eta_s / 60)} min restantes` : ''})`}</h3>}{jobId && <button onClick={handleCancel}>Cancelar</button>}<div style={{background:'#444', height:'10px', width:'100%'}}><div style={{background:'#00ff00', height:'100%', width:`${progress}%`}}></div></div>{streamUrl && <img src={streamUrl} style={{maxWidth:'100%', marginTop:'10px'}}/>}</div>}
 
             {stage==='finished' && counts && (
                 <div className="results-section">
@@ -0,0 +1,117 @@
+"""
+Benchmark das consultas de analytics (count_rollups) com 1 ano de dados sintéticos.
+
+Uso (na raiz do projeto):
+    python tools/bench_analytics.py --devices 50 --groups 10 --queries 500 --p99-ms 50
+
+Cria um banco SQLite temporário (ou usa DATABASE_URL), popula os rollups como o pipeline ao vivo
+faria (upsert incremental por hora) e mede p50/p95/p99 das consultas típicas do dashboard.
+Sai com código 1 se o p99 passar do alvo.
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--devices", type=int, default=50)
+parser.add_argument("--groups", type=int, default=10)
+parser.add_argument("--days", type=int, default=365)
+parser.add_argument("--queries", type=int, default=500)
+parser.add_argument("--p99-ms", type=float, default=50.0)
+parser.add_argument("--seed", type=int, default=42)
+args = parser.parse_args()
+
+tmp_dir = None
+if "DATABASE_URL" not in os.environ:
+    tmp_dir = tempfile.mkdtemp(prefix="bench_analytics_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+import crud, models  # noqa: E402
+from database import engine, SessionLocal, Base  # noqa: E402
+
+random.seed(args.seed)
+Base.metadata.create_all(bind=engine)
+
+# --- 1. Dados sintéticos ---
+print(f"📦 Gerando {args.days} dias para {args.devices} câmeras em {args.groups} grupos...")
+t0 = time.perf_counter()
+end = datetime.now().replace(minute=0, second=0, microsecond=0)
+start = end - timedelta(days=args.days)
+
+with SessionLocal() as db:
+    for dev_id in range(1, args.devices + 1):
+        db.add(models.Device(id=dev_id, name=f"Cam {dev_id}", ip_address=f"10.0.0.{dev_id}", group_name=f"Loja {dev_id % args.groups}"))
+    db.commit()
+
+    for dev_id in range(1, args.devices + 1):
+        deltas = {}
+        hour = start
+        while hour < end:
+            # Movimento só no horário comercial, com pico no meio do dia
+            if 8 <= hour.hour < 20:
+                peak = 1.0 - abs(hour.hour - 14) / 8
+                deltas[("entrant", "in", hour)] = int(random.random() * 40 * peak)
+                deltas[("passerby", "cross", hour)] = int(random.random() * 120 * peak)
+            hour += timedelta(hours=1)
+        # Mesmo caminho do pipeline ao vivo (upsert incremental hora + dia)
+        crud.upsert_count_rollups(db, dev_id, deltas, commit=False)
+        db.commit()
+
+    rows = db.query(models.CountRollup).count()
+print(f"   {rows} linhas de rollup em {time.perf_counter() - t0:.1f}s")
+
+# --- 2. Consultas típicas ---
+def q_group_daily_90d(db):
+    return crud.get_analytics_counts(db, end - timedelta(days=90), end, "day", line="entrant", by="group")
+
+def q_device_hourly_7d(db):
+    dev = random.randint(1, args.devices)
+    return crud.get_analytics_counts(db, end - timedelta(days=7), end, "hour", device_ids=[dev])
+
+def q_one_group_daily_30d(db):
+    return crud.get_analytics_counts(db, end - timedelta(days=30), end, "day", group=f"Loja {random.randrange(args.groups)}", by="device")
+
+def q_total_monthly_year(db):
+    return crud.get_analytics_counts(db, start, end, "month", by="total")
+
+def q_devices_weekly_180d(db):
+    ids = random.sample(range(1, args.devices + 1), min(5, args.devices))
+    return crud.get_analytics_counts(db, end - timedelta(days=180), end, "week", device_ids=ids)
+
+QUERIES = [q_group_daily_90d, q_device_hourly_7d, q_one_group_daily_30d, q_total_monthly_year, q_devices_weekly_180d]
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+print(f"⏱️ Executando {args.queries} consultas...")
+timings = {q.__name__: [] for q in QUERIES}
+with SessionLocal() as db:
+    for q in QUERIES: q(db) # aquecimento
+    for i in range(args.queries):
+        q = QUERIES[i % len(QUERIES)]
+        t = time.perf_counter()
+        q(db)
+        timings[q.__name__].append((time.perf_counter() - t) * 1000)
+
+all_ms = [ms for v in timings.values() for ms in v]
+for name, v in timings.items():
+    print(f"   {name:<24} p50={percentile(v, 50):7.2f}ms  p99={percentile(v, 99):7.2f}ms")
+p99 = percentile(all_ms, 99)
+print(f"📊 Geral: p50={percentile(all_ms, 50):.2f}ms p95={percentile(all_ms, 95):.2f}ms p99={p99:.2f}ms (alvo {args.p99_ms}ms)")
+
+if tmp_dir:
+    engine.dispose()
+    import shutil
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+if p99 > args.p99_ms:
+    print("❌ p99 acima do alvo")
+    sys.exit(1)
+print("✅ p99 dentro do alvo")
@@ -0,0 +1,106 @@
+"""
+Compara o processamento paralelo por segmentos (sense/chunked.py) com o sequencial em um vídeo real.
+
+Uso (na raiz do projeto):
+    python tools/bench_chunked.py video.mp4 --entrant "100,400;900,400" --passerby "100,600;900,600" \
+        --in-side right --workers 1,2,4 --tolerance 0.02
+
+Roda o pipeline sequencial (um VideoProcessor, frame a frame) e depois o paralelo para cada quantidade
+de workers, com a mesma contagem (CrossingCounter) sobre os tracks costurados. Mostra tempo, speedup,
+eficiência por núcleo e a diferença das contagens. Sai com código 1 se alguma contagem divergir mais
+que a tolerância (fração do total sequencial, mínimo 1 pessoa).
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from sense import chunked, counting, video_process  # noqa: E402
+
+parser = argparse.ArgumentParser()
+parser.add_argument("video")
+parser.add_argument("--entrant", required=True, help="Linha de entrada: 'x1,y1;x2,y2;...' (pixels do vídeo)")
+parser.add_argument("--passerby", required=True, help="Linha de passagem: 'x1,y1;x2,y2;...'")
+parser.add_argument("--in-side", default="right", choices=["right", "left"])
+parser.add_argument("--workers", default="2,4", help="Quantidades de processos a testar, separadas por vírgula")
+parser.add_argument("--tolerance", type=float, default=0.02)
+parser.add_argument("--skip-sequential", action="store_true", help="Só mede o paralelo (sem verificação)")
+args = parser.parse_args()
+
+
+def parse_line(raw):
+    return [{"x": float(x), "y": float(y)} for x, y in (p.split(",") for p in raw.split(";"))]
+
+
+line_ent, line_pass = parse_line(args.entrant), parse_line(args.passerby)
+cap = cv2.VideoCapture(args.video)
+total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)); fps = cap.get(cv2.CAP_PROP_FPS)
+cap.release()
+print(f"🎬 {args.video}: {total} frames a {fps:.1f} fps ({total / (fps or 30) / 60:.1f} min)")
+
+
+def count(tracks_at):
+    counter = counting.CrossingCounter(line_ent, line_pass, args.in_side)
+    for i in range(total):
+        counter.update(tracks_at(i), ts=i / fps if fps else None, frame_idx=i)
+    return counter.counts
+
+
+# --- 1. Sequencial ---
+seq_counts, seq_s = None, None
+if not args.skip_sequential:
+    processor = video_process.VideoProcessor()
+    t0 = time.perf_counter()
+    counter = counting.CrossingCounter(line_ent, line_pass, args.in_side)
+    cap = cv2.VideoCapture(args.video)
+    i = 0
+    while True:
+        ret, frame = cap.read()
+        if not ret: break
+        counter.update(processor.process_frame(frame), ts=i / fps if fps else None, frame_idx=i)
+        i += 1
+    cap.release()
+    seq_s = time.perf_counter() - t0
+    seq_counts = counter.counts
+    print(f"⏱️ Sequencial: {seq_s:.1f}s  entrantes={seq_counts['entrantes']['Total']} passantes={seq_counts['passantes']['Total']}")
+
+# --- 2. Paralelo ---
+failed = False
+for n in [int(w) for w in args.workers.split(",")]:
+    chunked.pool = chunked.ChunkPool(n)
+    # Aquecimento: sobe os n processos e carrega os modelos fora da medição
+    ex = chunked.pool.executor()
+    list(ex.map(time.sleep, [1.0] * n))
+
+    out_dir = tempfile.mkdtemp(prefix="bench_chunked_")
+    t0 = time.perf_counter()
+    merged = asyncio.run(chunked.analyze(args.video, total, fps, out_dir, workers=n))
+    analyze_s = time.perf_counter() - t0
+    counts = count(merged.at)
+    wall_s = time.perf_counter() - t0
+    chunked.pool.shutdown()
+    shutil.rmtree(out_dir, ignore_errors=True)
+
+    line = f"⏱️ {n} workers: {wall_s:.1f}s (inferência {analyze_s:.1f}s)  entrantes={counts['entrantes']['Total']} passantes={counts['passantes']['Total']}  {merged.stats()}"
+    if seq_s:
+        speedup = seq_s / wall_s
+        line += f"  speedup={speedup:.2f}x eficiência={speedup / n:.0%}"
+    print(line)
+
+    if seq_counts:
+        for key in ("entrantes", "passantes"):
+            expected, got = seq_counts[key]["Total"], counts[key]["Total"]
+            if abs(got - expected) > max(1, args.tolerance * expected):
+                print(f"❌ {key}: {got} (paralelo) x {expected} (sequencial)")
+                failed = True
+
+if failed:
+    sys.exit(1)
+print("✅ Contagens dentro da tolerância" if seq_counts else "✅ Concluído")
@@ -0,0 +1,113 @@
+"""
+Mede o custo de renderização do processamento offline em cada modo (none / preview / full) num vídeo real.
+
+Uso (na raiz do projeto):
+    python tools/bench_render.py video.mp4 --entrant "100,400;900,400" --passerby "100,600;900,600" \
+        --in-side right --frames 1500 --replay
+
+Para cada modo roda o mesmo laço do run_video_processing: inferência + contagem + trajetórias e, conforme o
+modo, desenho (render.annotate), JPEG do preview e gravação H.264 (video_writer). Com --replay a inferência
+roda uma vez só e os tracks são reaproveitados, isolando o custo de desenho/encode. Mostra frames/s, tempo
+por frame e o ganho de cada modo sobre o full; sai com código 1 se as contagens divergirem entre os modos.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from sense import counting, render, video_process, video_writer  # noqa: E402
+
+parser = argparse.ArgumentParser()
+parser.add_argument("video")
+parser.add_argument("--entrant", required=True, help="Linha de entrada: 'x1,y1;x2,y2;...' (pixels do vídeo)")
+parser.add_argument("--passerby", required=True, help="Linha de passagem: 'x1,y1;x2,y2;...'")
+parser.add_argument("--in-side", default="right", choices=["right", "left"])
+parser.add_argument("--frames", type=int, default=0, help="Limita o número de frames (0 = vídeo inteiro)")
+parser.add_argument("--modes", default="full,preview,none")
+parser.add_argument("--replay", action="store_true", help="Inferência uma vez só; mede apenas contagem + renderização")
+args = parser.parse_args()
+
+
+def parse_line(raw):
+    return [{"x": float(x), "y": float(y)} for x, y in (p.split(",") for p in raw.split(";"))]
+
+
+line_ent, line_pass = parse_line(args.entrant), parse_line(args.passerby)
+cap = cv2.VideoCapture(args.video)
+fw = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)); fh = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)); fps = cap.get(cv2.CAP_PROP_FPS)
+cap.release()
+processor = video_process.VideoProcessor()
+
+
+def read_frames():
+    cap = cv2.VideoCapture(args.video)
+    i = 0
+    while not args.frames or i < args.frames:
+        ret, frame = cap.read()
+        if not ret: break
+        yield i, frame
+        i += 1
+    cap.release()
+
+
+replayed = None
+if args.replay:
+    t0 = time.perf_counter()
+    replayed = [processor.process_frame(frame) for _, frame in read_frames()]
+    print(f"🔁 Inferência para replay: {len(replayed)} frames em {time.perf_counter() - t0:.1f}s")
+
+
+async def run(mode):
+    """Mesmo laço do processamento offline para um modo. Retorna (frames, segundos, contagens, stats do encoder)."""
+    proc = processor.fork() if not args.replay else processor
+    counter = counting.CrossingCounter(line_ent, line_pass, args.in_side)
+    tmp_dir = tempfile.mkdtemp(prefix="bench_render_")
+    out = video_writer.open_writer(os.path.join(tmp_dir, "out.mp4"), fw, fh, fps) if mode == "full" else None
+    trajectories = open(os.path.join(tmp_dir, "tracks.jsonl"), "w", encoding="utf-8")
+    n = 0
+    t0 = time.perf_counter()
+    for i, frame in read_frames():
+        tracks = replayed[i] if replayed is not None else proc.process_frame(frame)
+        ts = i / fps if fps else None
+        events = counter.update(tracks, ts=ts, frame_idx=i)
+        if tracks:
+            trajectories.write(json.dumps(render.trajectory_record(i, ts, tracks)) + "\n")
+        if mode != "none":
+            annotated = render.annotate(frame, proc, tracks, events, counter.counts, line_ent, line_pass, args.in_side)
+            if out is not None:
+                await out.awrite(annotated)
+            cv2.imencode('.jpg', annotated)
+        n += 1
+    if out is not None:
+        await asyncio.to_thread(out.release)
+    trajectories.close()
+    return n, time.perf_counter() - t0, counter.counts, out.stats() if out is not None else None
+
+
+results = {}
+for mode in args.modes.split(","):
+    n, elapsed, counts, enc = asyncio.run(run(mode))
+    results[mode] = (n, elapsed, counts)
+    line = f"⏱️ {mode:>7}: {n / elapsed:6.1f} frames/s  {elapsed / max(n, 1) * 1000:6.2f} ms/frame  " \
+           f"entrantes={counts['entrantes']['Total']} passantes={counts['passantes']['Total']}"
+    if enc: line += f"  encoder={enc}"
+    print(line)
+
+if "full" in results:
+    base = results["full"][1]
+    for mode, (_, elapsed, _) in results.items():
+        if mode != "full":
+            print(f"🚀 {mode} x full: {base / elapsed:.2f}x")
+
+reference = next(iter(results.values()))[2]
+if any(counts != reference for _, _, counts in results.values()):
+    print("❌ Contagens diferentes entre os modos")
+    sys.exit(1)
+print("✅ Mesmas contagens em todos os modos")